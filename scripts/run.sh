@@ -1,6 +1,6 @@
 #!/bin/bash
 
-path=$PWD"/src/parser/"
+path=$PWD"/src/final/"
 test_path=$PWD"/tests/input2/"
 out_path=$PWD"/tests/output2/"
 
@@ -8,6 +8,15 @@ for i in 1 2 3 4 5 6 7 8 9 10
 do
    echo "Parsing and converting test"$i".go into its corresponding out"$i".dot and out"$i".ps"
    # cp $test_path"test"$i".go" $path"input.go"
-   python3 $path"parser_final.py" --input=$test_path"test"$i".go" --output=$out_path"out"$i".dot"
-   dot -Tps $out_path"out"$i".dot" -o $out_path"out"$i".ps"
+   # out$i.dot is only replaced when the whole file parsed, type errors
+   # still give a complete graph; a syntax error leaves out$i.dot.partial
+   rm -f $out_path"out"$i".dot.partial"
+   python3 $path"parser.py" --input=$test_path"test"$i".go" --check-only --dot=$out_path"out"$i".dot"
+   if [ -f $out_path"out"$i".dot.partial" ]; then
+      echo "test"$i".go did not parse to the end, out"$i".dot is kept as it was"
+   fi
+   if [ -f $out_path"out"$i".dot" ]; then
+      dot -Tps $out_path"out"$i".dot" -o $out_path"out"$i".ps" &
+   fi
 done
+wait
@@ -0,0 +1,348 @@
+import argparse
+import json
+import os
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from gen_workload import generate
+
+# sizes given to the workload generator for every scale
+scales = {
+    'small': {'numFuncs': 10, 'numStmts': 20, 'depth': 3, 'arraySize': 10, 'structFields': 4, 'recursion': 0.2},
+    'medium': {'numFuncs': 30, 'numStmts': 40, 'depth': 3, 'arraySize': 50, 'structFields': 8, 'recursion': 0.2},
+    'large': {'numFuncs': 50, 'numStmts': 50, 'depth': 4, 'arraySize': 100, 'structFields': 16, 'recursion': 0.3},
+    # hundreds of small functions, for the costs that grow with their number
+    'wide': {'numFuncs': 300, 'numStmts': 20, 'depth': 3, 'arraySize': 10, 'structFields': 4, 'recursion': 0.2},
+}
+
+srcDir = os.path.dirname(os.path.abspath(__file__))
+
+# regressions smaller than this many seconds are considered noise
+minDelta = 0.005
+
+
+def compileProgram(goFile, workDir, codegen=True, cacheDir=None):
+    # runs parser.py --opt=t and codeGen.py with --profile inside workDir and
+    # returns the merged profile
+    profileJson = os.path.join(workDir, 'profile.json')
+    if os.path.exists(profileJson):
+        os.remove(profileJson)
+    cache = [] if cacheDir is None else ['--cache=' + cacheDir]
+    subprocess.run([sys.executable, os.path.join(srcDir, 'parser.py'), '--input=' + goFile,
+                    '--csv=' + os.path.join(workDir, 'symTab.csv'), '--code=' + os.path.join(workDir, '3AC.code'),
+                    '--opt=t', '--profile', '--profile-json=' + profileJson] + cache,
+                   cwd=workDir, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if codegen:
+        subprocess.run([sys.executable, os.path.join(srcDir, 'codeGen.py'), '--profile', '--profile-json=' + profileJson] + cache,
+                       cwd=workDir, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with open(profileJson, 'r') as jsonFile:
+        return json.load(jsonFile)
+
+
+def runScale(name, seed, repeat, workDir):
+    goFile = os.path.join(workDir, name + '.go')
+    with open(goFile, 'w') as outFile:
+        outFile.write(generate(seed, **scales[name]))
+
+    # the fastest of the runs is the least disturbed by the rest of the system
+    phases = {}
+    counters = {}
+    for _ in range(repeat):
+        profile = compileProgram(goFile, workDir)
+        counters = profile['counters']
+        for phase in profile['phases']:
+            if phase['phase'] not in phases or phase['wall'] < phases[phase['phase']]:
+                phases[phase['phase']] = phase['wall']
+
+    total = sum(phases.values())
+    return {
+        'phases': phases,
+        'total': total,
+        'lines': counters['lines'],
+        'lines_per_sec': counters['lines'] / total if total > 0 else 0,
+        'counters': counters,
+    }
+
+
+def memoryScale(name, seed, workDir):
+    # peak resident memory of parser.py, and the python memory blocks that
+    # parsing leaves allocated (symbol tables, types, 3AC, ...) per line
+    goFile = os.path.join(workDir, name + '.go')
+    with open(goFile, 'w') as outFile:
+        outFile.write(generate(seed, **scales[name]))
+    profile = compileProgram(goFile, workDir, codegen=False)
+    phases = dict((phase['phase'], phase) for phase in profile['phases'])
+    lines = profile['counters']['lines']
+    return {
+        'lines': lines,
+        'peak_mb': max(phase['peak_kb'] for phase in profile['phases']) / 1024,
+        'parse_peak_mb': phases['parse']['peak_kb'] / 1024,
+        'blocks_per_line': (phases['parse']['blocks'] - phases['lex']['blocks']) / lines,
+    }
+
+
+def reportMemory(results, out=sys.stdout):
+    out.write('%-8s %8s %12s %16s %16s\n' % ('scale', 'lines', 'peak (MB)', 'parse peak (MB)', 'blocks per line'))
+    for name in results:
+        result = results[name]
+        out.write('%-8s %8d %12.1f %16.1f %16.1f\n' % (name, result['lines'], result['peak_mb'],
+                                                      result['parse_peak_mb'], result['blocks_per_line']))
+
+
+def lexFile(path):
+    # reads and lexes path, then finds the position of its last token; run
+    # in a child process so that the peak memory is its own
+    from ply import lex
+    import lexer as goLexer
+
+    start = time.perf_counter()
+    data = goLexer.readSource(path)
+    loaded = time.perf_counter()
+    lexer = lex.lex(module=goLexer)
+    lexer.input(data)
+    numTokens = 0
+    lastPos = 0
+    for tok in iter(lexer.token, None):
+        numTokens += 1
+        lastPos = tok.lexpos
+    lexed = time.perf_counter()
+    line, column = goLexer.lexPosition(lexer, lastPos)
+    indexed = time.perf_counter()
+    return {
+        'bytes': len(data),
+        'lines': line,
+        'tokens': numTokens,
+        'read': loaded - start,
+        'lex': lexed - loaded,
+        'index': indexed - lexed,
+        'peak_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def inputScale(megabytes, seed, workDir):
+    # the large program repeated up to the given size, only lexed since
+    # parsing it would take hours
+    goFile = os.path.join(workDir, 'input.go')
+    program = generate(seed, **scales['large'])
+    size = 0
+    with open(goFile, 'w') as outFile:
+        while size < megabytes * 1024 * 1024:
+            outFile.write(program)
+            size += len(program)
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--lex-file=' + goFile],
+                            cwd=workDir, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+    return json.loads(output)
+
+
+def reportInput(result, out=sys.stdout):
+    out.write('%.1f MB, %d lines, %d tokens\n' % (result['bytes'] / (1024 * 1024), result['lines'], result['tokens']))
+    for phase in ['read', 'lex', 'index']:
+        out.write('    %-10s %10.4f s\n' % (phase, result[phase]))
+    out.write('    %-10s %10.1f MB\n' % ('peak', result['peak_mb']))
+
+
+def editLatency(name, seed, edits):
+    # time IncrementalChecker takes to check the program from scratch, and
+    # to check it again after changing an integer literal somewhere in it
+    from incremental import IncrementalChecker
+
+    text = generate(seed, **scales[name])
+    checker = IncrementalChecker()
+    start = time.perf_counter()
+    checker.reset(text)
+    full = time.perf_counter() - start
+    # single digits are replaced by single digits, so the offsets stay valid
+    digits = [match.start() for match in re.finditer(r'\b[1-9]\b', text)]
+    rand = random.Random(seed)
+    times = []
+    checked = 0
+    for _ in range(edits):
+        pos = rand.choice(digits)
+        start = time.perf_counter()
+        checker.edit(pos, pos + 1, str(rand.randint(1, 9)))
+        times.append(time.perf_counter() - start)
+        checked += checker.checked
+    times.sort()
+    return {
+        'lines': text.count('\n') + 1,
+        'units': len(checker.units),
+        'full': full,
+        'median': times[len(times) // 2],
+        'max': times[-1],
+        'checked_per_edit': checked / edits,
+    }
+
+
+def reportEdits(results, out=sys.stdout):
+    out.write('%-8s %8s %8s %10s %12s %12s %10s\n' % ('scale', 'lines', 'units', 'full (s)', 'median (ms)',
+                                                      'max (ms)', 'checked'))
+    for name in results:
+        result = results[name]
+        out.write('%-8s %8d %8d %10.3f %12.2f %12.2f %10.1f\n' % (name, result['lines'], result['units'], result['full'],
+                                                                result['median'] * 1000, result['max'] * 1000,
+                                                                result['checked_per_edit']))
+
+
+def rebuildLatency(name, seed, edits, workDir):
+    # time of a build without the cache, and of rebuilds with --cache after
+    # changing an integer literal in one function
+    goFile = os.path.join(workDir, name + '.go')
+    text = generate(seed, **scales[name])
+    with open(goFile, 'w') as outFile:
+        outFile.write(text)
+    full = sum(phase['wall'] for phase in compileProgram(goFile, workDir)['phases'])
+    cacheDir = os.path.join(workDir, 'cache')
+    compileProgram(goFile, workDir, cacheDir=cacheDir)
+    digits = [match.start() for match in re.finditer(r'\b[1-9]\b', text)]
+    rand = random.Random(seed)
+    times = []
+    parsed = 0
+    for _ in range(edits):
+        pos = rand.choice(digits)
+        text = text[:pos] + str(rand.randint(1, 9)) + text[pos+1:]
+        with open(goFile, 'w') as outFile:
+            outFile.write(text)
+        profile = compileProgram(goFile, workDir, cacheDir=cacheDir)
+        times.append(sum(phase['wall'] for phase in profile['phases']))
+        parsed += profile['counters']['functions_parsed']
+    shutil.rmtree(cacheDir)
+    times.sort()
+    return {
+        'lines': text.count('\n') + 1,
+        'full': full,
+        'median': times[len(times) // 2],
+        'max': times[-1],
+        'parsed_per_edit': parsed / edits,
+    }
+
+
+def reportRebuilds(results, out=sys.stdout):
+    out.write('%-8s %8s %10s %12s %10s %10s\n' % ('scale', 'lines', 'full (s)', 'median (s)', 'max (s)', 'parsed'))
+    for name in results:
+        result = results[name]
+        out.write('%-8s %8d %10.3f %12.3f %10.3f %10.1f\n' % (name, result['lines'], result['full'], result['median'],
+                                                             result['max'], result['parsed_per_edit']))
+
+
+def report(results, out=sys.stdout):
+    for name in results:
+        result = results[name]
+        out.write('%s: %d lines, %.0f lines/s\n' % (name, result['lines'], result['lines_per_sec']))
+        for phase in result['phases']:
+            out.write('    %-10s %10.4f s\n' % (phase, result['phases'][phase]))
+        out.write('    %-10s %10.4f s\n' % ('total', result['total']))
+
+
+def compare(results, baseline, threshold, out=sys.stdout):
+    # returns the number of phases that got slower than the baseline by more
+    # than threshold (a fraction)
+    regressions = 0
+    out.write('%-8s %-10s %10s %10s %8s\n' % ('scale', 'phase', 'base (s)', 'now (s)', 'ratio'))
+    for name in results:
+        if name not in baseline:
+            continue
+        now = dict(results[name]['phases'], total=results[name]['total'])
+        base = dict(baseline[name]['phases'], total=baseline[name]['total'])
+        for phase in now:
+            if phase not in base or base[phase] <= 0:
+                continue
+            ratio = now[phase] / base[phase]
+            mark = ''
+            if ratio > 1 + threshold and now[phase] - base[phase] > minDelta:
+                mark = '  REGRESSION'
+                regressions += 1
+            out.write('%-8s %-10s %10.4f %10.4f %8.2f%s\n' % (name, phase, base[phase], now[phase], ratio, mark))
+    return regressions
+
+
+if __name__ == '__main__':
+    argParser = argparse.ArgumentParser(description='Times every phase of the compiler on generated programs')
+    argParser.add_argument('--scales', dest='scales', default='small,medium', help='comma separated list out of ' + ','.join(scales))
+    argParser.add_argument('--seed', dest='seed', type=int, default=0, help='seed of the workload generator')
+    argParser.add_argument('--repeat', dest='repeat', type=int, default=3, help='runs per scale, the fastest one is kept')
+    argParser.add_argument('--save', dest='save', help='write the results to this JSON file')
+    argParser.add_argument('--baseline', dest='baseline', help='JSON written earlier by --save to compare against')
+    argParser.add_argument('--threshold', dest='threshold', type=float, default=0.1, help='allowed slowdown against the baseline, 0.1 = 10%%')
+    argParser.add_argument('--memory', dest='memory', action='store_true', help='only parse every scale once and report the memory used')
+    argParser.add_argument('--input-mb', dest='inputMb', type=int, help='time reading and lexing a generated input of this many MB')
+    argParser.add_argument('--lex-file', dest='lexFile', help=argparse.SUPPRESS)
+    argParser.add_argument('--edits', dest='edits', type=int, help='time this many edits checked by IncrementalChecker against checking every scale from scratch')
+    argParser.add_argument('--rebuilds', dest='rebuilds', type=int, help='time this many rebuilds with --cache after one edit each against a build without it')
+    args = argParser.parse_args()
+
+    if args.lexFile is not None:
+        print(json.dumps(lexFile(args.lexFile)))
+        sys.exit(0)
+
+    if args.inputMb is not None:
+        workDir = tempfile.mkdtemp(prefix='gobench')
+        try:
+            result = inputScale(args.inputMb, args.seed, workDir)
+        finally:
+            shutil.rmtree(workDir)
+        reportInput(result)
+        if args.save is not None:
+            with open(args.save, 'w') as jsonFile:
+                json.dump(result, jsonFile, indent=2)
+        sys.exit(0)
+
+    names = [x for x in args.scales.split(',') if x != '']
+    for name in names:
+        if name not in scales:
+            argParser.error('unknown scale ' + name)
+
+    if args.edits is not None:
+        results = dict((name, editLatency(name, args.seed, args.edits)) for name in names)
+        reportEdits(results)
+        if args.save is not None:
+            with open(args.save, 'w') as jsonFile:
+                json.dump(results, jsonFile, indent=2)
+        sys.exit(0)
+
+    if args.rebuilds is not None:
+        workDir = tempfile.mkdtemp(prefix='gobench')
+        try:
+            results = dict((name, rebuildLatency(name, args.seed, args.rebuilds, workDir)) for name in names)
+        finally:
+            shutil.rmtree(workDir)
+        reportRebuilds(results)
+        if args.save is not None:
+            with open(args.save, 'w') as jsonFile:
+                json.dump(results, jsonFile, indent=2)
+        sys.exit(0)
+
+    workDir = tempfile.mkdtemp(prefix='gobench')
+    try:
+        results = {}
+        for name in names:
+            if args.memory:
+                results[name] = memoryScale(name, args.seed, workDir)
+            else:
+                results[name] = runScale(name, args.seed, args.repeat, workDir)
+    finally:
+        shutil.rmtree(workDir)
+
+    if args.memory:
+        reportMemory(results)
+        if args.save is not None:
+            with open(args.save, 'w') as jsonFile:
+                json.dump(results, jsonFile, indent=2)
+        sys.exit(0)
+
+    report(results)
+    if args.save is not None:
+        with open(args.save, 'w') as jsonFile:
+            json.dump(results, jsonFile, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as jsonFile:
+            baseline = json.load(jsonFile)
+        print('')
+        if compare(results, baseline, args.threshold) > 0:
+            sys.exit(1)
@@ -0,0 +1,591 @@
+r'''
+Function by function rebuilds, for parser.py --cache.
+
+The source is cut into top-level declarations as incremental.py does, and
+parsed one declaration at a time. Every function declaration gets a key,
+a hash of its text and of what it can look up at the top level: the
+globals, functions and types its identifiers name. The build that parses
+it records what came out: its 3AC, its symbol tables,
+the types it made and what it added to the global symbol table, and
+its optimized 3AC. A later
+build parses only the functions whose key it has no record of, the others
+are grafted from their record, their scopes, temporaries, labels and
+unnamed types numbered as parsing them would have. So the 3AC and the
+symbol tables are those of a build without the cache.
+
+Declarations other than functions are always parsed. A function that had
+errors, or that changed the top level in a way a record cannot replay,
+is not recorded.
+'''
+import hashlib
+import io
+import os
+import pickle
+import re
+
+from data_structures import ParseStop
+from incremental import topLevelUnits
+from lexer import compilation_errors, tokenIds
+from optimizer import compactLabels, functionPasses, isFuncMarker, isLabel, jumpTarget, setJumpTarget, splitFunctions
+
+funcId = tokenIds['FUNC']
+# the token type of characters no rule matches
+errorId = 1
+identifier = re.compile(r'[_A-Za-z][_A-Za-z0-9]*')
+tempName = re.compile(r't([0-9]+)$')
+labelName = re.compile(r'label([0-9]+)$')
+
+
+class FunctionRecord:
+    r'''
+    What parsing a function declaration made, numbered as in the build that
+    parsed it.
+    '''
+    __slots__ = ('scope', 'varCount', 'labelCount', 'counts', 'lastScope', 'code', 'scopeInfo',
+                 'tables', 'table0', 'unNamed', 'types', 'functions', 'labels')
+
+    def __init__(self):
+        # the counters before the declaration, and (scopes, temporaries,
+        # labels) it made
+        self.scope = 0
+        self.varCount = 0
+        self.labelCount = 0
+        self.counts = (0, 0, 0)
+        self.lastScope = 0
+        self.code = []
+        self.scopeInfo = []
+        # its symbol tables, and the (type, name) of every addUnNamedType
+        # call, pickled by dumpTypes
+        self.tables = b''
+        self.unNamed = []
+        # changes to the global symbol table: ('list', name, scope),
+        # ('label', name, scope, funcScope), ('maybe', name) and
+        # ('maybeScope', name, scope)
+        self.table0 = []
+        # name -> (canonical key, key it was made with if unnamed) of the
+        # types it did not make
+        self.types = {}
+        # scope -> (name, index in functions[name]) of the functions of
+        # other declarations it refers to
+        self.functions = {}
+        # function label -> (name, scope), of its marker and its calls
+        self.labels = {}
+
+
+class Relocation:
+    r'''
+    Numbers a record as if its declaration was parsed with the counters
+    and the top level of helper.
+    '''
+    def __init__(self, record, helper):
+        self.record = record
+        self.helper = helper
+        self.scopeStart = record.scope
+        self.scopeShift = helper.scope - record.scope
+        self.tempStart = record.varCount
+        self.tempShift = helper.varCount - record.varCount
+        self.labelStart = record.labelCount
+        self.labelShift = helper.labelCount - record.labelCount
+        self.scopes, self.temps, self.labels = record.counts
+        # ids of the types of helper that loadTypes handed out, they are
+        # not renamed
+        self.shared = {}
+        self.valid = True
+        table0 = helper.symbolTables[0]
+        self.external = {}
+        for scope, (name, idx) in record.functions.items():
+            scopes = table0.functions.get(name)
+            if not isinstance(scopes, list) or idx >= len(scopes):
+                self.valid = False
+                return
+            self.external[scope] = scopes[idx]
+        self.typeNames = {}
+        for name, (key, made) in record.types.items():
+            if made is not None:
+                # by the key it was made with, unnamed types made while a
+                # struct was declared can have the same key as later ones
+                current = helper.unNamed.get(made)
+            else:
+                current = name if name in helper.type else None
+            if current is None or helper.canonicalType(current) != key:
+                self.valid = False
+                return
+            self.typeNames[name] = current
+        self.same = False
+
+    def identity(self):
+        # whether the record can be taken as it is
+        return (self.scopeShift == 0 and self.tempShift == 0 and self.labelShift == 0 and
+                all(scope == self.external[scope] for scope in self.external) and
+                all(name == self.typeNames[name] for name in self.typeNames))
+
+    def scope(self, scope):
+        if scope == 0:
+            return 0
+        if self.scopeStart <= scope < self.scopeStart + self.scopes:
+            return scope + self.scopeShift
+        return self.external[scope]
+
+    def name(self, name):
+        # temporaries and labels of the declaration are renumbered
+        if name[:1] == 't':
+            match = tempName.match(name)
+            if match is not None and 0 <= int(match.group(1)) - self.tempStart < self.temps:
+                return 't' + str(int(match.group(1)) + self.tempShift)
+        elif name[:5] == 'label':
+            match = labelName.match(name)
+            if match is not None and 0 <= int(match.group(1)) - self.labelStart < self.labels:
+                return 'label' + str(int(match.group(1)) + self.labelShift)
+        elif name[:1] == '@':
+            # made by the optimizer, see ownLabels
+            marker, idx = name[1:].rsplit('_', 1)
+            return '@' + self.function(marker) + '_' + idx
+        return name
+
+    def function(self, label):
+        name, scope = self.record.labels[label]
+        return name + str(self.scope(scope))
+
+    def type(self, type_):
+        # renames the unnamed types in a type in compact or expanded form,
+        # lists and dicts in place
+        if isinstance(type_, str):
+            return self.typeNames.get(type_, type_)
+        if id(type_) in self.shared:
+            return type_
+        if isinstance(type_, list):
+            for idx, x in enumerate(type_):
+                type_[idx] = self.type(x)
+        elif isinstance(type_, dict):
+            for key in type_:
+                type_[key] = self.type(type_[key])
+        return type_
+
+    def load(self, data):
+        return loadTypes(self.helper, data, self.typeNames, self.shared)
+
+    def code(self, code, scopeInfo):
+        newCode = []
+        newScopeInfo = []
+        for instr, info in zip(code, scopeInfo):
+            if isFuncMarker(instr):
+                instr = [self.function(instr[0][:-2]) + '::']
+            elif instr[0] == 'call':
+                instr = ['call', self.function(instr[1])] + instr[2:]
+            else:
+                instr = [self.name(x) if isinstance(x, str) else x for x in instr]
+            newCode.append(instr)
+            newScopeInfo.append([self.scope(x) if isinstance(x, int) else x for x in info])
+        return newCode, newScopeInfo
+
+    def table(self, table):
+        if table.parent is not None:
+            table.parent = self.scope(table.parent)
+        names = {}
+        for name, entry in table.table.items():
+            entry.type = self.type(entry.type)
+            names[self.name(name)] = entry
+        table.table = names
+        metadata = table.metadata
+        metadata['scopeNo'] = self.scope(metadata['scopeNo'])
+        for key in ('start', 'end', 'update', 'retval'):
+            if key in metadata:
+                metadata[key] = self.name(metadata[key])
+        for key in ('signature', 'retvaltype'):
+            if key in metadata:
+                metadata[key] = self.type(metadata[key])
+        return table
+
+
+class BuildCache:
+    r'''
+    Records of the function declarations of the last build, kept in
+    directory.
+    '''
+    def __init__(self, directory):
+        self.path = os.path.join(directory, 'functions.p')
+        os.makedirs(directory, exist_ok=True)
+        # key -> [pickled FunctionRecord, pickled optimized 3AC or None]
+        self.records = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as inFile:
+                self.records = pickle.load(inFile)
+        # the records of this build, only these are saved
+        self.used = {}
+        # (start, stop, key, relocation, record) of the 3AC of every function
+        # declaration, relocation None if it was parsed
+        self.functions = []
+        self.parsed = 0
+        self.grafted = 0
+
+    def compile(self, helper, rootNode, lexer, parser):
+        r'''
+        Parses the input of lexer (a FastLexer) into helper and rootNode as
+        parser.parse would, stopping at the first syntax error.
+        '''
+        types = lexer.types
+        units = topLevelUnits(types)
+        header = units[0]
+        if not self.parse(parser, lexer, [header]):
+            return
+        # parsed again ahead of every declaration, without the lexical errors
+        # that were reported the first time
+        headerRanges = []
+        first = 0
+        for idx in range(header[1]):
+            if types[idx] == errorId:
+                headerRanges.append((first, idx))
+                first = idx + 1
+        headerRanges.append((first, header[1]))
+        headerText = lexer.lexdata[:lexer.ends[header[1]-1]] if header[1] > 0 else ''
+
+        for first, stop in units[1:]:
+            start = len(rootNode.code)
+            if types[first] != funcId:
+                if not self.parse(parser, lexer, headerRanges + [(first, stop)]):
+                    return
+                continue
+            key = self.key(helper, lexer, headerText, first, stop)
+            relocation = None
+            record = None
+            if key in self.records:
+                record = pickle.loads(self.records[key][0])
+                relocation = self.graft(helper, rootNode, record)
+            if relocation is not None:
+                self.used[key] = list(self.records[key])
+                self.grafted += 1
+            else:
+                errors = compilation_errors.size()
+                before = self.snapshot(helper)
+                log = []
+                refs = set()
+                helper.unNamedHook = lambda type_, name: log.append((dumpTypes(helper, type_, refs, name), name))
+                parsed = self.parse(parser, lexer, headerRanges + [(first, stop)])
+                helper.unNamedHook = None
+                if not parsed:
+                    return
+                self.parsed += 1
+                record = None
+                if compilation_errors.size() == errors:
+                    record = self.record(helper, rootNode, before, log, refs, start)
+                if record is None:
+                    key = None
+                else:
+                    self.used[key] = [pickle.dumps(record, pickle.HIGHEST_PROTOCOL), None]
+            self.functions.append((start, len(rootNode.code), key, relocation, record))
+
+    def parse(self, parser, lexer, ranges):
+        # parses the tokens in ranges, False after a syntax error
+        lexer.select(ranges)
+        try:
+            parser.parse(None, lexer=lexer, tracking=True)
+        except ParseStop:
+            return False
+        return True
+
+    def key(self, helper, lexer, headerText, first, stop):
+        text = lexer.lexdata[lexer.starts[first]:lexer.ends[stop-1]]
+        parts = [headerText, text, repr(helper.offsetStack)]
+        unNamed = set(helper.unNamed.values())
+        for name in sorted(set(identifier.findall(text))):
+            parts.append(name + repr(self.facts(helper, unNamed, name)))
+        return hashlib.sha1('\0'.join(parts).encode()).hexdigest()
+
+    def facts(self, helper, unNamed, name):
+        # what name is at the top level, without the numbering of scopes,
+        # temporaries and unnamed types
+        table0 = helper.symbolTables[0]
+        facts = []
+        entry = table0.table.get(name)
+        if entry is not None:
+            facts.append(('symbol', self.typeFact(helper, unNamed, entry.type), entry.size, entry.offset, entry.flags))
+        scopes = table0.functions.get(name)
+        if isinstance(scopes, list):
+            signatures = []
+            for scope in scopes:
+                metadata = helper.symbolTables[scope].metadata
+                signatures.append(([self.typeFact(helper, unNamed, x) for x in metadata.get('signature', [])],
+                                   [self.typeFact(helper, unNamed, x) for x in metadata.get('retvaltype', [])],
+                                   metadata.get('retvalsize'), metadata.get('num_arg')))
+            facts.append(('function', signatures, name in table0.maybe))
+        elif scopes is not None:
+            facts.append(('label',))
+        if name in helper.type:
+            facts.append(('type', self.typeFact(helper, unNamed, name), helper.type[name]['size']))
+        return facts
+
+    def typeFact(self, helper, unNamed, type_):
+        try:
+            key = helper.canonicalType(type_)
+        except (KeyError, IndexError, TypeError):
+            return repr(type_)
+        if isinstance(type_, str) and type_ not in unNamed:
+            return (type_, key)
+        return key
+
+    def snapshot(self, helper):
+        # what record compares the top level after a declaration with
+        table0 = helper.symbolTables[0]
+        functions = dict((name, len(value) if isinstance(value, list) else value)
+                         for name, value in table0.functions.items())
+        return {
+            'scope': helper.scope, 'varCount': helper.varCount, 'labelCount': helper.labelCount,
+            'symbols': len(table0.table), 'width': table0.width, 'offsets': list(helper.offsetStack),
+            'metadata': dict(table0.metadata), 'functions': functions, 'maybe': len(table0.maybe),
+            'maybeScope': dict(table0.maybeScope), 'types': dict(helper.type),
+        }
+
+    def record(self, helper, rootNode, before, log, refs, start):
+        r'''
+        The record of the function declaration just parsed, whose 3AC starts
+        at start, None if grafting it could not give what parsing does.
+        '''
+        table0 = helper.symbolTables[0]
+        if (len(table0.table) != before['symbols'] or table0.width != before['width'] or
+                helper.offsetStack != before['offsets'] or helper.scopeStack != [0] or
+                table0.metadata != before['metadata']):
+            return None
+        # types are only made by addUnNamedType, and never redefined
+        made = set(name for _, name in log if name not in before['types'])
+        for name, entry in helper.type.items():
+            if before['types'].get(name) is not entry and name not in made:
+                return None
+
+        record = FunctionRecord()
+        record.scope = before['scope']
+        record.varCount = before['varCount']
+        record.labelCount = before['labelCount']
+        record.counts = (helper.scope - record.scope, helper.varCount - record.varCount,
+                         helper.labelCount - record.labelCount)
+        own = range(record.scope, helper.scope)
+        record.code = rootNode.code[start:]
+        record.scopeInfo = rootNode.scopeInfo[start:]
+        tables = helper.symbolTables[record.scope:]
+        record.lastScope = helper.lastScope
+        # a call made again returns what the first one did
+        record.unNamed = list(dict.fromkeys(log))
+
+        # the functions of other declarations are found by name and position
+        positions = {}
+        for name, scopes in table0.functions.items():
+            if isinstance(scopes, list):
+                for idx, scope in enumerate(scopes):
+                    positions[scope] = (name, idx)
+
+        def useScope(scope):
+            if scope != 0 and scope not in own:
+                if scope not in positions:
+                    return False
+                record.functions[scope] = positions[scope]
+            return True
+
+        def useLabel(label):
+            # the function a marker or call names
+            found = []
+            for end in range(len(label) - 1, 0, -1):
+                if not label[end:].isdigit():
+                    break
+                scopes = table0.functions.get(label[:end])
+                if isinstance(scopes, list) and str(int(label[end:])) == label[end:] and int(label[end:]) in scopes:
+                    found.append((label[:end], int(label[end:])))
+            if len(found) != 1 or not useScope(found[0][1]):
+                return False
+            record.labels[label] = found[0]
+            return True
+
+        for instr, info in zip(record.code, record.scopeInfo):
+            if isFuncMarker(instr):
+                if not useLabel(instr[0][:-2]):
+                    return None
+            elif instr[0] == 'call':
+                if not useLabel(instr[1]):
+                    return None
+            for x in info:
+                if isinstance(x, int) and x != 0 and x not in own:
+                    return None
+        for table in tables:
+            if table.parent is not None and table.parent != 0 and table.parent not in own:
+                return None
+
+        for name, value in table0.functions.items():
+            if isinstance(value, list):
+                for scope in value[before['functions'].get(name, 0):]:
+                    if not useScope(scope):
+                        return None
+                    record.table0.append(('list', name, scope))
+            elif before['functions'].get(name) != value:
+                # name + str(scope) of the marker, see p_func_decl
+                if not useLabel(name) or not useScope(value):
+                    return None
+                record.table0.append(('label',) + record.labels[name] + (value,))
+        for name in table0.maybe[before['maybe']:]:
+            record.table0.append(('maybe', name))
+        for name, scope in table0.maybeScope.items():
+            if before['maybeScope'].get(name) != scope:
+                if not useScope(scope):
+                    return None
+                record.table0.append(('maybeScope', name, scope))
+
+        # the types it names and did not make are found again by name, the
+        # unnamed ones by the key they were made with
+        unNamed = dict((name, key) for key, name in helper.unNamed.items())
+
+        def useTypes(type_):
+            if isinstance(type_, str):
+                if type_ in helper.type and type_ not in made and type_ not in record.types:
+                    record.types[type_] = (helper.canonicalType(type_), unNamed.get(type_))
+            elif isinstance(type_, list):
+                for x in type_:
+                    useTypes(x)
+            elif isinstance(type_, dict):
+                for x in type_.values():
+                    useTypes(x)
+
+        record.tables = dumpTypes(helper, tables, refs)
+        for data, _ in record.unNamed:
+            useTypes(loadTypes(helper, data, {}, {}))
+        for table in tables:
+            for entry in table.table.values():
+                useTypes(entry.type)
+            useTypes(table.metadata.get('signature', []))
+            useTypes(table.metadata.get('retvaltype', []))
+        for name in refs:
+            useTypes(name)
+        return record
+
+    def graft(self, helper, rootNode, record):
+        # adds the record to helper and rootNode, None if what it refers to
+        # outside of the declaration is gone
+        relocation = Relocation(record, helper)
+        if not relocation.valid:
+            return None
+        for data, name in record.unNamed:
+            relocation.typeNames[name] = helper.addUnNamedType(relocation.type(relocation.load(data)))
+        tables = relocation.load(record.tables)
+        relocation.same = relocation.identity()
+        if relocation.same:
+            code, scopeInfo = record.code, record.scopeInfo
+        else:
+            code, scopeInfo = relocation.code(record.code, record.scopeInfo)
+            tables = [relocation.table(table) for table in tables]
+
+        table0 = helper.symbolTables[0]
+        for op in record.table0:
+            if op[0] == 'list':
+                table0.functions.setdefault(op[1], []).append(relocation.scope(op[2]))
+            elif op[0] == 'label':
+                table0.functions[op[1] + str(relocation.scope(op[2]))] = relocation.scope(op[3])
+            elif op[0] == 'maybe':
+                table0.maybe.append(op[1])
+            else:
+                table0.maybeScope[op[1]] = relocation.scope(op[2])
+        helper.symbolTables += tables
+        helper.scope += relocation.scopes
+        helper.varCount += relocation.temps
+        helper.labelCount += relocation.labels
+        helper.lastScope = relocation.scope(record.lastScope)
+        rootNode.code += code
+        rootNode.scopeInfo += scopeInfo
+        return relocation
+
+    def optimize(self, helper, rootNode):
+        r'''
+        optimizer.optimize for the 3AC compile made. A function grafted from
+        a record with its optimized 3AC takes it from there, the others are
+        optimized and their records given theirs.
+        '''
+        code, scopeInfo = rootNode.code, rootNode.scopeInfo
+        declarations = dict((entry[0], entry[1:]) for entry in self.functions)
+        funcs = splitFunctions(code)
+        newCode = code[:funcs[0][1]] if funcs else code
+        newScopeInfo = scopeInfo[:funcs[0][1]] if funcs else scopeInfo
+        for name, start, end in funcs:
+            stop, key, relocation, record = declarations.get(start, (None, None, None, None))
+            if stop != end:
+                # code of other declarations follows it
+                key = None
+            optimized = self.used[key][1] if key is not None else None
+            if relocation is not None and optimized is not None:
+                body, bodyScopeInfo = pickle.loads(optimized)
+                if not relocation.same:
+                    body, bodyScopeInfo = relocation.code(body, bodyScopeInfo)
+            else:
+                body, bodyScopeInfo = code[start:end], scopeInfo[start:end]
+                for pass_ in functionPasses:
+                    body, bodyScopeInfo = pass_(body, bodyScopeInfo, helper)
+                if key is not None and (relocation is None or relocation.same):
+                    # a record numbered otherwise than this build gets its
+                    # optimized 3AC the next time it is parsed
+                    self.used[key][1] = pickle.dumps((ownLabels(record, body), bodyScopeInfo), pickle.HIGHEST_PROTOCOL)
+            newCode += body
+            newScopeInfo += bodyScopeInfo
+        rootNode.code, rootNode.scopeInfo = compactLabels(newCode, newScopeInfo, helper)
+
+    def save(self):
+        with open(self.path, 'wb') as outFile:
+            pickle.dump(self.used, outFile, pickle.HIGHEST_PROTOCOL)
+
+
+def dumpTypes(helper, obj, refs, own=None):
+    # pickles obj with the type lists and struct fields of the types of
+    # helper pickled as (name, part), but those of the type named own. The
+    # parser shares these between types, and typeKey tells recursive structs
+    # apart by them. The names referred to are added to refs
+    shared = {}
+    for name, entry in helper.type.items():
+        if name == own:
+            continue
+        type_ = entry['type']
+        shared.setdefault(id(type_), (name, 0))
+        if len(type_) > 1 and isinstance(type_[1], dict):
+            shared.setdefault(id(type_[1]), (name, 1))
+
+    def persistentId(x):
+        ref = shared.get(id(x))
+        if ref is not None:
+            refs.add(ref[0])
+        return ref
+    buffer = io.BytesIO()
+    pickler = pickle.Pickler(buffer, pickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = persistentId
+    pickler.dump(obj)
+    return buffer.getvalue()
+
+def loadTypes(helper, data, names, shared):
+    # the obj of dumpTypes, sharing the parts of the types of helper named
+    # names.get(name, name), whose ids are added to shared
+    unpickler = pickle.Unpickler(io.BytesIO(data))
+
+    def persistentLoad(ref):
+        name, part = ref
+        type_ = helper.type[names.get(name, name)]['type']
+        if part == 1:
+            type_ = type_[1]
+        shared[id(type_)] = name
+        return type_
+    unpickler.persistent_load = persistentLoad
+    return unpickler.load()
+
+def ownLabels(record, code):
+    # the optimized code of a record, the labels the optimizer made named
+    # '@' + function label + '_0', '_1', ... so that they are apart from
+    # those of other functions and from the parser's. compactLabels numbers
+    # them all again
+    marker = code[0][0][:-2]
+    own = range(record.labelCount, record.labelCount + record.counts[2])
+    names = {}
+
+    def name(label):
+        match = labelName.match(label)
+        if match is not None and int(match.group(1)) in own:
+            return label
+        return names.setdefault(label, '@' + marker + '_' + str(len(names)))
+    newCode = []
+    for instr in code:
+        if isLabel(instr):
+            instr = [name(instr[0])]
+        elif jumpTarget(instr) is not None:
+            instr = list(instr)
+            setJumpTarget(instr, name(jumpTarget(instr)))
+        newCode.append(instr)
+    return newCode
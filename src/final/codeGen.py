@@ -1,105 +1,154 @@
+import argparse
+import hashlib
+import os
 import pickle as pkl
 import random
+import re
 import string
 import struct
 from data_structures import Helper, Node
+from emitter import AsmEmitter, Label
+from optimizer import splitFunctions
+from profiler import PhaseProfiler
+from concurrent.futures import ProcessPoolExecutor
 
 def binary(num):
     return ''.join('{:0>8b}'.format(c) for c in struct.pack('!f', num))
 
-asmCode = []
-
 class CodeGenerator:
-    def __init__(self, helper, rootNode):
-        self.asmCode = []
-        self.asmCode.append('global main')
-        self.asmCode.append('extern printf')
-        self.asmCode.append('extern scanf')
-        self.asmCode.append('extern malloc')
-        # self.asmCode.append('extern gets')
-        # self.asmCode.append('extern puts')
-        # self.asmCode.append('extern farray_print')
-        self.asmCode.append('section .data')
-        self.asmCode.append('temp dq 0')
-        self.asmCode.append('print_int db "%i ", 0x00')
-        self.asmCode.append('farray_print db "%f ", 0x0a, 0x00')
-        self.asmCode.append('print_line db "", 0x0a, 0x00')
-        self.asmCode.append('scan_int db "%d", 0')
-        self.dataIndex = 6
-        self.codeIndex = 0
-        self.asmCode.append('section .text')
+    def __init__(self, helper, rootNode, emitter):
+        self.emitter = emitter
         self.helper = helper
+        self.funcName = ''
         self.counter = 0
         self.scopeInfo = rootNode.scopeInfo
         self.code = rootNode.code
         self.relops = ['==int', '!=int', '<=int', '>=int', '>int', '<int']
         self.frelops = ['==float', '!=float', '<=float', '>=float', '>float', '<float']
+        self.frameOperand = re.compile(r'\[ebp((?:\+-|\+|-)[0-9]+)\]')
 
     def ebpOffset(self, ident, identScope, funcScope):
-        paramSize = helper.getParamWidth(funcScope)
-
-        offset = 0
-        if 'is_arg' in self.helper.symbolTables[identScope].table[ident]:
-            if 'parent' not in self.helper.symbolTables[identScope].table[ident]:
-                offset = 8 + paramSize - self.helper.symbolTables[identScope].table[ident]['size'] - self.helper.symbolTables[identScope].table[ident]['offset']
-            else:
-                offset = 8 + paramSize - self.helper.symbolTables[identScope].table[ident]['offset']
-
-        else:
-            if 'parent' in self.helper.symbolTables[identScope].table[ident]:
-                # parent = self.helper.symbolTables[identScope].table[ident]['parent']
-                # parentScope = self.helper.symbolTables[identScope].table[ident]['parentScope']
-                offset = self.helper.symbolTables[identScope].table[ident]['offset']
-            else:
-                offset = -(self.helper.symbolTables[identScope].table[ident]['offset'] + self.helper.symbolTables[identScope].table[ident]['size'] - paramSize)
+        offset = self.helper.frameOffset(ident, identScope, funcScope)
         if offset >= 0:
             return '+'+str(offset)
         return str(offset)
 
-    def addFunc(self,name):
+    def addFunc(self, name, start, end):
+        # returns the whole assembly of one function. It reads nothing but the
+        # helper and code[start:end], so functions can be generated in any order
         funcScope = self.helper.symbolTables[0].functions[name]
+        frameSize = self.helper.getWidth(funcScope) - self.helper.getParamWidth(funcScope) + self.helper.getLargest(funcScope)
 
-        # add function label
-        self.asmCode.append(name+':')
-
-        # standard prologue
-        self.add_prologue()
+        # labels made while generating code are namespaced by the function
+        self.funcName = name
+        self.counter = 0
 
-        # update stack pointer to store all the varaibles(except parameters) in current sym table
-        self.asmCode.append('sub esp, '+str(helper.getWidth(funcScope) - helper.getParamWidth(funcScope) + helper.getLargest(funcScope)))
-
-        self.codeIndex += 1
-        while True:
-            if self.codeIndex >= len(self.code):
-                break
-            curr = self.code[self.codeIndex]
-            if (len(curr) == 1 and curr[0][-2:] == '::'):
-                break
-            code_ = self.genCode(self.codeIndex, funcScope)
+        # every return jumps to this single epilogue instead of duplicating it
+        epilogue = name + '_epilogue'
+
+        body = []
+        fused = self.fusedBranches(start, end)
+        for idx in range(start+1, end):
+            if idx - 1 in fused:
+                # the if went out together with its comparison
+                continue
+            if idx in fused:
+                code_ = self.compare_branch(idx, funcScope)
+            else:
+                code_ = self.genCode(idx, funcScope)
             if len(code_) == 0:
                 # then it should be a return statement
-                if len(self.code[self.codeIndex]) != 1:
+                if len(self.code[idx]) != 1:
                     # this represents a non void function hence return value needs to be updated in eax
-                    retValOffset = self.ebpOffset(self.code[self.codeIndex][1], self.scopeInfo[self.codeIndex][1], funcScope)
-                    self.asmCode.append('lea eax, [ebp'+str(retValOffset) + ']')
-                self.add_epilogue()
+                    retValOffset = self.ebpOffset(self.code[idx][1], self.scopeInfo[idx][1], funcScope)
+                    body.append('lea eax, [ebp'+str(retValOffset) + ']')
+                body.append('jmp ' + epilogue)
             else:
                 if code_[0] != 'none':
-                    self.asmCode += code_
-            self.codeIndex += 1
+                    body += code_
+
+        # the last return can simply fall through into the epilogue
+        if len(body) > 0 and body[-1] == 'jmp ' + epilogue:
+            body.pop()
+        needEpilogueLabel = ('jmp ' + epilogue) in body
+
+        # add function label
+        code = []
+        if name.rstrip('0123456789') == 'main':
+            code.append(Label('main'))
+        else:
+            code.append(Label(name))
+
+        if self.isLeaf(body):
+            # frame pointer omission: no ebp frame, everything is addressed off esp
+            self.add_leaf_function(code, body, frameSize, epilogue, needEpilogueLabel)
+            return code
+
+        # standard prologue
+        self.add_prologue(code)
+
+        # update stack pointer to store all the varaibles(except parameters) in current sym table
+        if frameSize > 0:
+            code.append('sub esp, '+str(frameSize))
+
+        code += body
 
         # standard epilogue
-        self.add_epilogue()
+        if needEpilogueLabel:
+            code.append(Label(epilogue))
+        self.add_epilogue(code)
+        return code
+
+    def newLoopLabel(self):
+        self.counter += 1
+        return self.funcName + '_looping' + str(self.counter)
+
+    def isLeaf(self, body):
+        # a leaf makes no calls and never pushes anything, and uses ebp only as
+        # the base of [ebp+offset] operands, so those can be rebased onto esp.
+        # A recursive function calls itself, so it is never a leaf and only
+        # gets the shared epilogue
+        for line in body:
+            if line.split(' ')[0] in ['call', 'push', 'pop']:
+                return False
+            if 'ebp' in self.frameOperand.sub('', line):
+                return False
+        return True
+
+    def add_leaf_function(self, code, body, frameSize, epilogue, needEpilogueLabel):
+        # without 'push ebp' the slot below the return address is free, so
+        # reserving frameSize + 4 bytes keeps every local at or above esp
+        adjust = 0
+        if frameSize > 0:
+            adjust = frameSize + 4
+            code.append('sub esp, ' + str(adjust))
+
+        def rebase(match):
+            offset = int(match.group(1).replace('+-', '-')) + adjust - 4
+            if offset >= 0:
+                return '[esp+' + str(offset) + ']'
+            return '[esp' + str(offset) + ']'
+
+        for line in body:
+            if isinstance(line, Label):
+                code.append(line)
+            else:
+                code.append(self.frameOperand.sub(rebase, line))
 
+        if needEpilogueLabel:
+            code.append(Label(epilogue))
+        if adjust > 0:
+            code.append('add esp, ' + str(adjust))
+        code.append('ret')
 
-    def add_prologue(self):
-        self.asmCode.append('push ebp')
-        self.asmCode.append('mov ebp, esp')
+    def add_prologue(self, code):
+        code.append('push ebp')
+        code.append('mov ebp, esp')
 
-    def add_epilogue(self):
-        self.asmCode.append('mov esp, ebp')
-        self.asmCode.append('pop ebp')
-        self.asmCode.append('ret')
+    def add_epilogue(self, code):
+        # leave == mov esp, ebp; pop ebp
+        code.append('leave')
+        code.append('ret')
 
     def unary_minus(self, instr, scopeInfo, funcScope):
         dst = instr[1]
@@ -169,7 +218,7 @@ class CodeGenerator:
 
         info_src1 = self.helper.symbolTables[scopeInfo[2]].get(src1)
 
-        baseType = helper.getBaseType(info_src1['type'])
+        baseType = self.helper.getBaseType(info_src1['type'])
         if baseType[0] == 'struct':
             objOffset = self.ebpOffset(src1, scopeInfo[2], funcScope)
             dstOffset = self.ebpOffset(dst, scopeInfo[1], funcScope)
@@ -475,15 +524,14 @@ class CodeGenerator:
         if dst[0] == '*':
             return self.pointer_assign(instr, scopeInfo, funcScope)
 
-        data_ = helper.symbolTables[scopeInfo[1]].get(instr[1])
-        baseType = helper.getBaseType(data_['type'])
+        data_ = self.helper.symbolTables[scopeInfo[1]].get(instr[1])
+        baseType = self.helper.getBaseType(data_['type'])
 
         if baseType[0] in ['struct', 'array']:
             offset1 = self.ebpOffset(instr[1], scopeInfo[1], funcScope)
             offset2 = self.ebpOffset(instr[2], scopeInfo[2], funcScope)
 
-            self.counter += 1
-            label = 'looping' + str(self.counter)
+            label = self.newLoopLabel()
             iters = int(data_['size'] / 4)
             code_ = ['mov esi, ebp', 'mov ebx, ebp']
             code_.append('add esi, '+offset1)
@@ -493,7 +541,7 @@ class CodeGenerator:
             if flag[1] == 1:
                 code_.append('mov esi, [ebp' + offset1 + ']')
             code_.append('mov cx, '+str(iters))
-            code_.append(label + ':')
+            code_.append(Label(label))
             code_.append('mov edx, [ebx]')
             code_.append('mov [esi], edx')
             code_.append('add esi, 4')
@@ -575,7 +623,7 @@ class CodeGenerator:
         return code
 
     def assign_ptr_rhs(self, instr, scopeInfo, funcScope):
-        sz = helper.symbolTables[scopeInfo[1]].get(instr[1])['size']
+        sz = self.helper.symbolTables[scopeInfo[1]].get(instr[1])['size']
         dst = instr[1]
         src = instr[2]
         flag = self.setFlags(instr, scopeInfo)
@@ -583,8 +631,7 @@ class CodeGenerator:
         offset1 = self.ebpOffset(instr[1], scopeInfo[1], funcScope)
         offset2 = self.ebpOffset(instr[2], scopeInfo[2], funcScope)
 
-        self.counter += 1
-        label = 'looping' + str(self.counter)
+        label = self.newLoopLabel()
         iters = int(sz / 4)
         code_ = ['mov esi, ebp', 'mov ebx, ebp']
         code_.append('add esi, '+offset1)
@@ -595,7 +642,7 @@ class CodeGenerator:
         if flag[1] == 1:
             code_.append('mov esi, [ebp' + offset1 + ']')
         code_.append('mov cx, '+str(iters))
-        code_.append(label + ':')
+        code_.append(Label(label))
         code_.append('mov edx, [ebx]')
         code_.append('mov [esi], edx')
         code_.append('add esi, 4')
@@ -706,12 +753,13 @@ class CodeGenerator:
         src2Offset = self.ebpOffset(src2, scopeInfo[3], funcScope)
 
         code = []
-        code.append('fld dword [ebp' + str(src1Offset) + ']')
-        # if flag[2] == 1:
-        #     code.append('mov edi, [edi]')
+        # src1 ends up in st0, so fcomip compares src1 with src2
         code.append('fld dword [ebp' + str(src2Offset) + ']')
         # if flag[3] == 1:
         #     code.append('mov esi, [esi]')
+        code.append('fld dword [ebp' + str(src1Offset) + ']')
+        # if flag[2] == 1:
+        #     code.append('mov edi, [edi]')
         code.append('xor eax, eax')
         code.append('fcomip')
         # code.append('sahf')
@@ -722,13 +770,13 @@ class CodeGenerator:
         elif instr[0] == '!=float':
             code.append('setne al')
         elif instr[0] == '<float':
-            code.append('setl al')
+            code.append('setb al')
         elif instr[0] == '>float':
-            code.append('setg al')
+            code.append('seta al')
         elif instr[0] == '<=float':
-            code.append('setle al')
+            code.append('setbe al')
         elif instr[0] == '>=float':
-            code.append('setge al')
+            code.append('setae al')
 
         if flag[1] == 1:
             code.append('mov esi, [ebp'+ str(dstOffset) + ']')
@@ -737,6 +785,74 @@ class CodeGenerator:
             code.append('mov [ebp' + str(dstOffset) + '], eax')
         return code
 
+    def fusedBranches(self, start, end):
+        # indices of the comparisons whose result is read by nothing but the if
+        # right after them, such a pair needs no bool in memory
+        def isPair(idx):
+            instr = self.code[idx]
+            if instr[0] not in self.relops + self.frelops or idx + 1 >= end:
+                return False
+            key = (instr[1], self.scopeInfo[idx][1])
+            nextInstr = self.code[idx+1]
+            if nextInstr[0] != 'if' or (nextInstr[1], self.scopeInfo[idx+1][1]) != key:
+                return False
+            if key in [(instr[2], self.scopeInfo[idx][2]), (instr[3], self.scopeInfo[idx][3])]:
+                return False
+            return self.setFlags(instr, self.scopeInfo[idx])[1] == 0
+
+        uses = {}
+        for idx in range(start+1, end):
+            instr = self.code[idx]
+            scopeInfo = self.scopeInfo[idx]
+            for k in range(1, min(len(instr), len(scopeInfo))):
+                if scopeInfo[k] != '':
+                    uses.setdefault((instr[k], scopeInfo[k]), []).append(idx)
+
+        fused = set()
+        for idx in range(start+1, end):
+            if not isPair(idx):
+                continue
+            key = (self.code[idx][1], self.scopeInfo[idx][1])
+            if all(isPair(x) or (x - 1 > start and isPair(x - 1) and self.code[x][0] == 'if') for x in uses[key]):
+                fused.add(idx)
+        return fused
+
+    def compare_branch(self, idx, funcScope):
+        # a comparison and the if testing its result, as one cmp and a jump
+        instr = self.code[idx]
+        scopeInfo = self.scopeInfo[idx]
+        ifInstr = self.code[idx+1]
+        flag = self.setFlags(instr, scopeInfo)
+
+        src1Offset = self.ebpOffset(instr[2], scopeInfo[2], funcScope)
+        src2Offset = self.ebpOffset(instr[3], scopeInfo[3], funcScope)
+
+        code = []
+        if instr[0] in self.relops:
+            op = instr[0][:-3]
+            jumps = {'==': 'je', '!=': 'jne', '<': 'jl', '>': 'jg', '<=': 'jle', '>=': 'jge'}
+            code.append('mov edi, [ebp' + str(src1Offset) + ']')
+            if flag[2] == 1:
+                code.append('mov edi, [edi]')
+            code.append('mov esi, [ebp' + str(src2Offset) + ']')
+            if flag[3] == 1:
+                code.append('mov esi, [esi]')
+            code.append('cmp edi, esi')
+        else:
+            # fcomip sets the flags like an unsigned compare of st0 with st1
+            op = instr[0][:-5]
+            jumps = {'==': 'je', '!=': 'jne', '<': 'jb', '>': 'ja', '<=': 'jbe', '>=': 'jae'}
+            code.append('fld dword [ebp' + str(src2Offset) + ']')
+            code.append('fld dword [ebp' + str(src1Offset) + ']')
+            code.append('fcomip')
+            code.append('fstp dword [temp]')
+
+        # 'if t == False' jumps when the comparison does not hold
+        if ifInstr[2] == '==':
+            op = {'==': '!=', '!=': '==', '<': '>=', '>=': '<', '>': '<=', '<=': '>'}[op]
+        code.append(jumps[op] + ' ' + ifInstr[5])
+        return code
+
     def print_int(self, instr, scopeInfo, funcScope):
         src = instr[1]
         srcOffset = self.ebpOffset(src, scopeInfo[1], funcScope)
@@ -822,8 +938,8 @@ class CodeGenerator:
         return code
 
     def param(self, instr, scopeInfo, funcScope):
-        data_ = helper.symbolTables[scopeInfo[1]].get(instr[1])
-        baseType = helper.getBaseType(data_['type'])
+        data_ = self.helper.symbolTables[scopeInfo[1]].get(instr[1])
+        baseType = self.helper.getBaseType(data_['type'])
         flag = self.setFlags(instr, scopeInfo)
         offset = self.ebpOffset(instr[1], scopeInfo[1], funcScope)
         if baseType[0] in ['int', 'bool', 'float', 'string']:
@@ -836,8 +952,7 @@ class CodeGenerator:
             else:
                 return ['mov edx, [ebp' + offset + ']', 'push edx']
         else:
-            self.counter += 1
-            label = 'looping' + str(self.counter)
+            label = self.newLoopLabel()
             iters = int(data_['size'] / 4)
             code_ = ['mov esi, ebp']
             code_.append('add esi, '+offset)
@@ -845,7 +960,7 @@ class CodeGenerator:
                 code_.append('mov esi, [ebp'+offset+']')
             code_.append('add esi, ' + str(data_['size'] - 4))
             code_.append('mov cx, '+str(iters))
-            code_.append(label + ':')
+            code_.append(Label(label))
             code_.append('mov edx, [esi]')
             code_.append('push edx')
             code_.append('sub esi, 4')
@@ -864,7 +979,10 @@ class CodeGenerator:
         if flag[1] == 1:
             code.append('mov edi, [edi]')
         code.append('cmp edi, 0')
-        code.append('je ' + jLabel)
+        if instr[2] == '!=':
+            code.append('jne ' + jLabel)
+        else:
+            code.append('je ' + jLabel)
 
         return code
 
@@ -875,47 +993,35 @@ class CodeGenerator:
         code.append('jmp ' + jLabel)
         return code
 
-    def logical(self, instr, scopeInfo, funcScope):
-        dst = instr[1]
-        src1 = instr[2]
-        src2 = instr[3]
+    def not_op(self, instr, scopeInfo, funcScope):
         flag = self.setFlags(instr, scopeInfo)
-
-        dstOffset = self.ebpOffset(dst, scopeInfo[1], funcScope)
-        src1Offset = self.ebpOffset(src1, scopeInfo[2], funcScope)
-        src2Offset = self.ebpOffset(src2, scopeInfo[3], funcScope)
+        dstOffset = self.ebpOffset(instr[1], scopeInfo[1], funcScope)
+        srcOffset = self.ebpOffset(instr[2], scopeInfo[2], funcScope)
 
         code = []
-        code.append('mov edi, [ebp' + str(src1Offset) + ']')
+        code.append('mov edi, [ebp' + str(srcOffset) + ']')
         if flag[2] == 1:
             code.append('mov edi, [edi]')
-        code.append('mov esi, [ebp' + str(src2Offset) + ']')
-        if flag[3] == 1:
-            code.append('mov esi, [esi]')
-
-        if instr[0] == '||':
-            code.append('or edi, esi')
-        elif instr[0] == '&&':
-            code.append('and edi, esi')
-
+        code.append('xor eax, eax')
+        code.append('cmp edi, 0')
+        code.append('sete al')
         if flag[1] == 1:
             code.append('mov esi, [ebp'+ str(dstOffset) + ']')
-            code.append('mov [esi], edi')
+            code.append('mov [esi], eax')
         else:
-            code.append('mov [ebp' + str(dstOffset) + '], edi')
+            code.append('mov [ebp' + str(dstOffset) + '], eax')
         return code
 
     def getRetVal(self, instr, scopeInfo, funcScope):
-        data_ = helper.symbolTables[scopeInfo[1]].get(instr[1])
+        data_ = self.helper.symbolTables[scopeInfo[1]].get(instr[1])
         offset = self.ebpOffset(instr[1], scopeInfo[1], funcScope)
 
-        self.counter += 1
-        label = 'looping' + str(self.counter)
+        label = self.newLoopLabel()
         iters = int(data_['size'] / 4)
         code_ = ['mov esi, ebp']
         code_.append('add esi, '+offset)
         code_.append('mov cx, '+str(iters))
-        code_.append(label + ':')
+        code_.append(Label(label))
         code_.append('mov edx, [eax]')
         code_.append('mov [esi], edx')
         code_.append('add esi, 4')
@@ -953,7 +1059,7 @@ class CodeGenerator:
         if instr[0] == 'return':
             return []
         elif len(instr) == 1:
-            return [instr[0]+':']
+            return [Label(instr[0])]
         elif instr[0] == '+int':
             return self.add_op(instr, scopeInfo, funcScope)
         elif instr[0] == '+float':
@@ -1002,8 +1108,8 @@ class CodeGenerator:
         if instr[0] == 'goto':
             return self.goto_op(instr, scopeInfo, funcScope)
 
-        if instr[0] in [ '||' , '&&']:
-            return self.logical(instr, scopeInfo, funcScope)
+        if instr[0] == '!':
+            return self.not_op(instr, scopeInfo, funcScope)
 
         if instr[0] in ['--', '++']:
             return self.inc_dec(instr, scopeInfo, funcScope)
@@ -1029,15 +1135,183 @@ class CodeGenerator:
         if instr[0][0] == '&':
             return self.ampersand_op(instr, scopeInfo, funcScope)
 
-    def getCode(self):
-        while True:
-            if self.codeIndex >= len(self.code):
-                break
-            funcName = self.code[self.codeIndex][0].split(':')
-            self.addFunc(funcName[0])
-        return self.asmCode
+    def add_header(self):
+        self.emitter.directive('global main')
+        self.emitter.directive('extern printf')
+        self.emitter.directive('extern scanf')
+        self.emitter.directive('extern malloc')
+        # self.emitter.directive('extern gets')
+        # self.emitter.directive('extern puts')
+        # self.emitter.directive('extern farray_print')
+        self.emitter.directive('section .data')
+        self.emitter.data('temp dq 0')
+        self.emitter.data('print_int db "%i ", 0x00')
+        self.emitter.data('farray_print db "%f ", 0x0a, 0x00')
+        self.emitter.data('print_line db "", 0x0a, 0x00')
+        self.emitter.data('scan_int db "%d", 0')
+        self.emitter.directive('section .text')
+
+    def getCode(self, jobs=1, cache=None):
+        # each function is written out as soon as it is generated, always in
+        # the order of the 3AC even when they are generated in parallel. With
+        # a cache, only the functions it does not have are generated
+        self.add_header()
+        funcs = splitFunctions(self.code)
+        keys = [None] * len(funcs)
+        missing = funcs
+        if cache is not None:
+            keys = [cache.key(self, *func) for func in funcs]
+            missing = [func for func, key in zip(funcs, keys) if not cache.has(key)]
+        if jobs == 1 or len(missing) < 2:
+            self.generateFuncs(funcs, keys, map(lambda func: self.addFunc(*func), missing), cache)
+        else:
+            chunk = max(1, len(missing) // (4 * jobs))
+            with ProcessPoolExecutor(jobs, initializer=initWorker, initargs=(self.helper, self.code, self.scopeInfo)) as pool:
+                self.generateFuncs(funcs, keys, pool.map(workerAddFunc, missing, chunksize=chunk), cache)
+        self.emitter.flush()
+
+    def generateFuncs(self, funcs, keys, generated, cache):
+        # emits funcs in order, taking the code of those the cache does not
+        # have from generated
+        for key in keys:
+            if cache is not None and cache.has(key):
+                self.emitter.emit(cache.load(key))
+            else:
+                code = next(generated)
+                if cache is not None:
+                    cache.store(key, code)
+                self.emitter.emit(code)
+
+# every worker process keeps its own generator over the shared 3AC
+worker = None
+
+def initWorker(helper, code, scopeInfo):
+    global worker
+    rootNode = Node('rootNode')
+    rootNode.code = code
+    rootNode.scopeInfo = scopeInfo
+    worker = CodeGenerator(helper, rootNode, None)
+
+def workerAddFunc(func):
+    return worker.addFunc(*func)
+
+class AsmCache:
+    r'''
+    Assembly of every function of the last run, for --cache. A function is
+    found by a digest of all that addFunc reads for it, its variables
+    standing for their type, size, offset and flags, and its labels and the
+    functions it calls numbered by appearance. So a function that was only
+    moved or renumbered is not generated again, its stored assembly gets
+    the labels of the new one.
+    '''
+    word = re.compile(r'[_A-Za-z@][_A-Za-z0-9]*')
+    placeholder = re.compile(r'@([0-9]+)')
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, 'functions.asm.p')
+        os.makedirs(directory, exist_ok=True)
+        # digest -> normalized assembly
+        self.functions = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as inFile:
+                self.functions = pkl.load(inFile)
+        self.used = {}
+        self.hits = 0
+
+    def key(self, codeGen, name, start, end):
+        # (digest, names) of a function, names being the labels and
+        # functions it refers to in order of appearance, itself first
+        helper = codeGen.helper
+        funcScope = helper.symbolTables[0].functions[name]
+        names = {name: 0}
+        operands = {}
+        # canonical types by appearance, their keys are long
+        types = {}
+        parts = [name.rstrip('0123456789') == 'main', helper.getWidth(funcScope),
+                 helper.getParamWidth(funcScope), helper.getLargest(funcScope)]
+        for idx in range(start+1, end):
+            instr = codeGen.code[idx]
+            scopeInfo = codeGen.scopeInfo[idx]
+            if len(instr) == 1 and instr[0] != 'return':
+                parts.append(('label', names.setdefault(instr[0], len(names))))
+                continue
+            normalized = [instr[0]]
+            for i in range(1, len(instr)):
+                x = instr[i]
+                if isinstance(x, str) and (instr[0] == 'call' and i == 1 or instr[0] == 'goto' and i == 1 or
+                                           instr[0] == 'if' and i == 5):
+                    normalized.append(('label', names.setdefault(x, len(names))))
+                elif isinstance(x, str) and i < len(scopeInfo) and isinstance(scopeInfo[i], int):
+                    operand = (x, scopeInfo[i])
+                    if operand not in operands:
+                        operands[operand] = (len(operands), self.operand(helper, types, x, scopeInfo[i], funcScope))
+                    normalized.append(operands[operand])
+                else:
+                    normalized.append(x)
+            parts.append((normalized, [x for x in scopeInfo if not isinstance(x, int)]))
+        parts.append(list(types))
+        digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+        return digest, sorted(names, key=names.get)
+
+    def operand(self, helper, types, ident, scope, funcScope):
+        info = helper.symbolTables[scope].get(ident)
+        if info is None:
+            return None
+        try:
+            type_ = types.setdefault(helper.canonicalType(info.type), len(types))
+            offset = helper.frameOffset(ident, scope, funcScope)
+        except (KeyError, IndexError, TypeError):
+            return repr(info)
+        return (scope == 0, type_, info.size, offset, info.flags)
+
+    def has(self, key):
+        return key[0] in self.functions
+
+    def load(self, key):
+        self.hits += 1
+        code = self.functions[key[0]]
+        self.used[key[0]] = code
+        names = key[1]
+
+        def name(match):
+            return names[int(match.group(1))]
+        return [Label(self.placeholder.sub(name, line)) if isLabel else self.placeholder.sub(name, line)
+                for isLabel, line in code]
+
+    def store(self, key, code):
+        names = dict((name, '@' + str(idx)) for idx, name in enumerate(key[1]))
+        own = key[1][0] + '_'
+
+        def placeholder(match):
+            word = match.group(0)
+            if word in names:
+                return names[word]
+            if word.startswith(own):
+                # labels made by addFunc, see newLoopLabel
+                return '@0' + word[len(own)-1:]
+            return word
+        if any('@' in line for line in code):
+            return
+        self.used[key[0]] = [(isinstance(line, Label), self.word.sub(placeholder, line)) for line in code]
+
+    def save(self):
+        with open(self.path, 'wb') as outFile:
+            pkl.dump(self.used, outFile, pkl.HIGHEST_PROTOCOL)
+
 
 if __name__=='__main__':
+    argParser = argparse.ArgumentParser(description='Generates x86 assembly from the 3AC')
+    argParser.add_argument('--jobs', dest='jobs', type=int, default=1, help='number of processes generating functions in parallel, 0 for one per cpu')
+    argParser.add_argument('--profile', dest='isProfile', action='store_true', help='print the time and memory spent in code generation')
+    argParser.add_argument('--profile-json', dest='profile_json_location', default='profile.json', help='JSON written by parser.py --profile, the codegen phase is added to it')
+    argParser.add_argument('--cprofile', dest='cprofile_dir', help='with --profile, dump a cProfile .prof file in this directory')
+    argParser.add_argument('--cache', dest='cache_dir', help='directory keeping the assembly of every function, only the functions that changed are generated again')
+    args = argParser.parse_args()
+    profiler = PhaseProfiler(args.isProfile, args.cprofile_dir)
+    jobs = args.jobs
+    if jobs <= 0:
+        jobs = os.cpu_count()
+
     # Load files
     rootNode = pkl.load(open('rootNode.p', 'rb'))
     assert(len(rootNode.code) == len(rootNode.scopeInfo))
@@ -1045,18 +1319,20 @@ if __name__=='__main__':
 
     # Now can use helper class functions
 
-    codeGen = CodeGenerator(helper, rootNode)
-
-    outfile = open('assembly.asm', 'w')
-    x86Code = codeGen.getCode()
-
-    for code_ in x86Code:
-        if code_.split(' ')[0] in ['global', 'section', 'extern']:
-            outfile.write(code_ + '\n')
-        elif code_[-1:] == ':' and 'main' in code_:
-            outfile.write('main:\n')
-        elif code_[-1:] == ':':
-            outfile.write(code_ + '\n')
-        else:
-            outfile.write('    '+code_+'\n')
-    outfile.close()
+    outfile = open('assembly.asm', 'w', buffering=1 << 16)
+    emitter = AsmEmitter(outfile)
+    codeGen = CodeGenerator(helper, rootNode, emitter)
+    cache = None
+    if args.cache_dir is not None:
+        cache = AsmCache(args.cache_dir)
+    with profiler.phase('codegen'):
+        codeGen.getCode(jobs, cache)
+        outfile.close()
+    if cache is not None:
+        cache.save()
+        profiler.count('asm_functions_cached', cache.hits)
+
+    if profiler.enabled:
+        profiler.count('asm_lines', emitter.lines)
+        profiler.report()
+        profiler.dump(args.profile_json_location, merge=True)
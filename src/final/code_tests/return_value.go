@@ -0,0 +1,19 @@
+// Returns with and without a value
+package main;
+
+func square(x int) int {
+	if x < 0 {
+		return -x * -x;
+	};
+	return x * x;
+};
+
+func main() {
+	var n int;
+	n = square(3);
+	if n > 5 {
+		print n;
+		return;
+	};
+	print 0;
+};
@@ -1,57 +1,251 @@
+import array
+import bisect
+import json
+import pickle
+import sys
+
 
 class Errors:
-    def __init__(self):
+    r'''
+    The diagnostics of a compilation, kept until report prints them all at
+    once. An error repeating one already kept, same type, position and
+    message, is dropped. With limit set, the limit-th error ends the parse
+    with ParseStop.
+    '''
+    def __init__(self, limit=None):
         self.types = ['KeyError', 'Lexical Error']
         self.error = []
         self.counter = 0
-
-    def add(self, type_, lineno, string):
+        self.limit = limit
+        # (type, line, column, msg) of the errors kept
+        self.seen = set()
+        # set when the limit stopped the parse
+        self.truncated = False
+
+    def add(self, type_, position, string):
+        # position is the (line, column) pair of the error
+        lineno, colno = position
+        key = (type_, lineno, colno, string)
+        if key in self.seen:
+            # a cascade repeating itself
+            return
+        self.seen.add(key)
         self.counter += 1
-        err_ = {}
-        err_["type"] = type_
-        err_["lineno"] = lineno
-        err_["msg"] = string
-        # err_['colno'] = colno
-        (self.error).append(err_)
-        self.printError(self.counter-1)
+        self.error.append({'type': type_, 'lineno': lineno, 'colno': colno, 'msg': string})
+        if self.limit is not None and self.counter >= self.limit:
+            self.truncated = True
+            raise ParseStop()
         return
 
-    def printError(self, index):
-        err_ = self.error[index]
-        error_string = '[' + err_['type'] + ']: ' + err_['msg'] + ' (line: ' + str(err_['lineno'])
-        # if err_['colno'] != None:
-        #     error_string += ', column no: ' + str(err_['colno'])
-        error_string += ')'
-        print(error_string)
-        return
+    def errorString(self, err_):
+        return '[%s]: %s (line: %s, column: %s)' % (err_['type'], err_['msg'], err_['lineno'], err_['colno'])
 
     def printErrors(self):
-        for idx in range(len(self.error)):
-            self.printError(idx)
+        self.report()
+        return
+
+    def report(self, format_='text', stream=None, source=None):
+        r'''
+        Writes the errors to stream, stdout by default, as text lines, as a
+        JSON object or as a SARIF log. source is the file name the JSON and
+        SARIF locations are given in.
+        '''
+        if stream is None:
+            stream = sys.stdout
+        if format_ == 'json':
+            json.dump({'file': source, 'errors': self.error, 'truncated': self.truncated}, stream)
+            stream.write('\n')
+        elif format_ == 'sarif':
+            json.dump(self.sarif(source), stream, indent=1)
+            stream.write('\n')
+        else:
+            lines = [self.errorString(err_) for err_ in self.error]
+            if self.truncated:
+                lines.append('too many errors')
+            if lines:
+                stream.write('\n'.join(lines) + '\n')
         return
 
+    def sarif(self, source):
+        # SARIF 2.1.0, one rule per error type
+        rules = {}
+        for err_ in self.error:
+            rules.setdefault(err_['type'], len(rules))
+        results = []
+        for err_ in self.error:
+            result = {'ruleId': err_['type'], 'ruleIndex': rules[err_['type']],
+                      'level': 'error', 'message': {'text': err_['msg']}}
+            region = {'startLine': err_['lineno'], 'startColumn': err_['colno']}
+            result['locations'] = [{'physicalLocation': {'artifactLocation': {'uri': source},
+                                                         'region': region}}]
+            results.append(result)
+        run = {'tool': {'driver': {'name': 'parser.py', 'rules': [{'id': rule} for rule in rules]}},
+               'results': results,
+               'invocations': [{'executionSuccessful': len(self.error) == 0}]}
+        if self.truncated:
+            run['invocations'][0]['toolExecutionNotifications'] = [{'level': 'note', 'message': {'text': 'too many errors'}}]
+        return {'version': '2.1.0',
+                '$schema': 'https://json.schemastore.org/sarif-2.1.0.json',
+                'runs': [run]}
+
     def size(self):
         return len(self.error)
 
 
+class ParseStop(Exception):
+    # raised by p_error to end the parse at the first syntax error. There
+    # are no error productions to recover with, and while looking for one
+    # PLY can reduce empty rules forever
+    pass
+
+
+class Lazy:
+    r'''
+    Descriptor Compact puts over the slot of a container. It makes the
+    container the first time the slot is read.
+    '''
+    __slots__ = ('slot', 'factory')
+
+    def __init__(self, slot, factory):
+        self.slot = slot
+        self.factory = factory
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        try:
+            return self.slot.__get__(obj, owner)
+        except AttributeError:
+            value = self.factory()
+            self.slot.__set__(obj, value)
+            return value
+
+    def __set__(self, obj, value):
+        self.slot.__set__(obj, value)
+
+
+class Compact:
+    r'''
+    Base of slotted classes whose containers, listed in containers, are
+    only made when they are first used. Only those slots go through Lazy,
+    a __getattr__ would slow down the lookup of every attribute.
+    '''
+    __slots__ = ()
+    containers = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name, factory in cls.containers.items():
+            setattr(cls, name, Lazy(cls.__dict__[name], factory))
+
+    def __getstate__(self):
+        # the slots that are set, without making the others
+        state = {}
+        for slot in type(self).__slots__:
+            descriptor = getattr(type(self), slot)
+            if isinstance(descriptor, Lazy):
+                descriptor = descriptor.slot
+            try:
+                state[slot] = descriptor.__get__(self)
+            except AttributeError:
+                pass
+        return (None, state)
+
+
+class Symbol:
+    r'''
+    Entry of a symbol table: type, size and offset, and the flags below.
+    Indexed like the dict it replaces, so entry['size'] and
+    'is_arg' in entry keep working. A field that is None is missing.
+    '''
+    __slots__ = ('type', 'size', 'offset', 'flags')
+    fields = ('type', 'size', 'offset')
+    flagBits = {'is_arg': 1, 'is_const': 2, 'reference': 4, 'parent': 8}
+
+    def __init__(self, type_, size=None, offset=None, flags=0):
+        self.type = type_
+        self.size = size
+        self.offset = offset
+        self.flags = flags
+
+    def __reduce__(self):
+        return (Symbol, (self.type, self.size, self.offset, self.flags))
+
+    def __getitem__(self, key):
+        if key in self.flagBits:
+            if self.flags & self.flagBits[key]:
+                return True
+        elif key in self.fields:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self.flagBits:
+            if value:
+                self.flags |= self.flagBits[key]
+            else:
+                self.flags &= ~self.flagBits[key]
+        elif key in self.fields:
+            setattr(self, key, value)
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in self.flagBits:
+            return self.flags & self.flagBits[key] != 0
+        return key in self.fields and getattr(self, key) is not None
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        return [key for key in self.fields + tuple(self.flagBits) if key in self]
+
+    def __repr__(self):
+        return repr(dict((key, self[key]) for key in self.keys()))
 
-class SymbolTable:
+
+class SymbolTable(Compact):
+    __slots__ = ('typeDefs', 'functions', 'table', 'parent', 'metadata', 'maybe', 'maybeScope',
+                 'width', 'paramWidth')
+    # only the global table has functions, the others never make these
+    containers = {'typeDefs': dict, 'functions': dict, 'maybe': list, 'maybeScope': dict}
 
     def __init__(self, parent=None):
-        self.typeDefs = {} # this is a dictionary of dictionary, in which each type name is key
-                           # for each key, all the declarations are key in the new dict, with type, size tuple
-                           # In this dictionary we will also store the total size
-        self.functions = {} # we  need to store index of its symbol table, and the label from which code starts
         self.table = {}
         self.parent = parent
+        # sizes of all the symbols, and of the arguments among them, kept
+        # up to date by update
+        self.width = 0
+        self.paramWidth = 0
         self.metadata = {}
         self.metadata['name'] = 'global'
         self.metadata['largest'] = 0
-        self.maybe = []
-        self.maybeScope = {}
 
         # metadata has a key 'is_function' to check if the current symbol table is activation record.
 
+    # typeDefs is a dictionary of dictionary, in which each type name is key
+    # for each key, all the declarations are key in the new dict, with type, size tuple
+    # In this dictionary we will also store the total size
+    # functions: we  need to store index of its symbol table, and the label from which code starts
+
+    def __getstate__(self):
+        # the symbols as columns, pickle would call Symbol.__reduce__ for
+        # each of them and a tuple per symbol would wake up the collector
+        state = Compact.__getstate__(self)[1]
+        entries = self.table.values()
+        state['table'] = (list(self.table), [entry.type for entry in entries], [entry.size for entry in entries],
+                          [entry.offset for entry in entries], [entry.flags for entry in entries])
+        return (None, state)
+
+    def __setstate__(self, state):
+        for slot, value in state[1].items():
+            setattr(self, slot, value)
+        ids, types, sizes, offsets, flags = self.table
+        self.table = dict(zip(ids, map(Symbol, types, sizes, offsets, flags)))
+
     def __str__(self):
         print('\n')
         print('typeDefs:',self.typeDefs)
@@ -63,32 +257,41 @@ class SymbolTable:
 
     # Checks whether "id" lies in the symbol table
     def lookUp(self, id):
-        return (id in self.table.keys())
+        return id in self.table
 
     def lookUpType(self,id):
-        return (id in self.typeDefs.keys())
+        return id in self.typeDefs
 
     # Inserts if already not present
-    def add(self, id, type_):
+    def add(self, id, type_, size=None, offset=None):
         if (not self.lookUp(id)):
-            (self.table)[id] = {}
-            (self.table)[id]['type'] = type_
+            (self.table)[id] = Symbol(type_, size, offset)
+            if size is not None:
+                self.width += size
 
     # Returns the argument list of the variable else returns None
     # Note that type is always a key in argument list
     def get(self, id):
-        if(self.lookUp(id)):
-            return (self.table)[id]
-
-        return None
+        return self.table.get(id)
 
     # Updates the variable of id id with arg list of KEY key with VALUE value
     def update(self, id, key, value):
+        entry = self.table.get(id)
+        if entry is None:
+            return False
+        size_ = entry.size or 0
+        isArg = 'is_arg' in entry
         try:
-            (self.table)[id][key] = value
-            return True
+            entry[key] = value
         except KeyError:
             return False
+        if key == 'size':
+            self.width += value - size_
+            if isArg:
+                self.paramWidth += value - size_
+        elif key == 'is_arg' and isArg != bool(value):
+            self.paramWidth += size_ if value else -size_
+        return True
 
 
     def setParent(self, parent):
@@ -104,6 +307,9 @@ class Helper:
         self.labelCount = 0
         self.scope = 0
         self.scopeStack = []
+        # for every name, the scopes on scopeStack declaring it, innermost
+        # last, so a name is resolved without walking the scopes
+        self.shadow = {}
         self.offsetStack = [0]
         self.symbolTables = []
         self.lastScope = 0
@@ -117,6 +323,21 @@ class Helper:
         # array would be like type['arr'] = {type: ['array', {'type': expanded form, 'len': 10}, 'size': }
         # slices like type['slice'] = {type: ['slice', {'type': expanded form, 'len': 10}], size}
 
+        # structurally identical types share one canonical key, a tuple, so
+        # two types are the same exactly when their keys are the same object
+        self.canonical = {}
+        # canonical key of every type name, dropped when a name is (re)defined
+        self.typeIds = {}
+        # unnamed type made for every canonical key, and size of every key
+        self.unNamed = {}
+        self.sizes = {}
+        # when set, called with (type, name) by every addUnNamedType, so
+        # the calls can be made again on another helper
+        self.unNamedHook = None
+        # when set, only the types are checked: the actions make no 3AC, and
+        # newVar and newLabel hand out the same name without recording it
+        self.checkOnly = False
+
     def getSize(self, type_):
         # returns the size for the given type by indexing it in type map.
         return self.type[type_]['size']
@@ -128,8 +349,85 @@ class Helper:
             return type_
         return self.type[type_]['type']
 
+    def setType(self, name, entry):
+        # names are looked up when keys are built, so the cached keys of
+        # other names may change with this one
+        self.type[name] = entry
+        self.typeIds = {}
+
+    def dropType(self, name):
+        self.type.pop(name, None)
+        self.typeIds = {}
+
+    def typeKey(self, type_, stack=()):
+        r'''
+        Structural key of a type in compact or expanded form. A struct
+        referred to by name is expanded, unless it is still being declared
+        or already being expanded further up, then it is ('struct', name).
+        So recursive types stay finite and keep their name.
+        '''
+        if isinstance(type_, str):
+            if len(stack) == 0 and type_ in self.typeIds:
+                return self.typeIds[type_]
+            type_ = self.type[type_]['type']
+        if type_[0] == 'pointer':
+            return ('pointer', self.typeKey(type_[1], stack))
+        if type_[0] == 'array' or type_[0] == 'slice':
+            return (type_[0], self.typeKey(type_[1]['type'], stack), type_[1]['len'])
+        if type_[0] != 'struct':
+            return tuple(type_)
+        fields = type_[1]
+        if isinstance(fields, str):
+            name = fields
+            if name not in self.type or isinstance(self.type[name]['type'][1], str):
+                return ('struct', name)
+            fields = self.type[name]['type'][1]
+            if id(fields) in stack:
+                return ('struct', name)
+        stack = stack + (id(fields),)
+        return ('struct',) + tuple((name, self.typeKey(fields[name]['type'], stack), fields[name]['offset']) for name in fields)
+
+    def displayType(self, type_, stack=()):
+        r'''
+        Expanded form of a type as the symbol table dumps print it. Structs
+        referred to by name are expanded as in typeKey, so types with the
+        same structure print the same, whichever of them was interned.
+        '''
+        if isinstance(type_, str):
+            type_ = self.type[type_]['type']
+        if type_[0] == 'pointer':
+            return ['pointer', self.displayType(type_[1], stack)]
+        if type_[0] == 'array' or type_[0] == 'slice':
+            return [type_[0], dict(type_[1], type=self.displayType(type_[1]['type'], stack))]
+        if type_[0] != 'struct':
+            return type_
+        fields = type_[1]
+        if isinstance(fields, str):
+            name = fields
+            if name not in self.type or isinstance(self.type[name]['type'][1], str):
+                return ['struct', name]
+            fields = self.type[name]['type'][1]
+            if id(fields) in stack:
+                return ['struct', name]
+        stack = stack + (id(fields),)
+        return ['struct', dict((name, dict(fields[name], type=self.displayType(fields[name]['type'], stack))) for name in fields)]
+
+    def canonicalType(self, type_):
+        # the one key object shared by all types with the structure of type_
+        key = self.typeKey(type_)
+        key = self.canonical.setdefault(key, key)
+        if isinstance(type_, str):
+            self.typeIds[type_] = key
+        return key
+
     def computeSize(self, type_):
-        # computes size for a expanded type
+        # computes size for a compact or expanded type, once per canonical type
+        key = self.canonicalType(type_)
+        if key not in self.sizes:
+            self.sizes[key] = self.expandedSize(type_)
+        return self.sizes[key]
+
+    def expandedSize(self, type_):
         if isinstance(type_, str):
             return self.type[type_]['size']
         if type_[0] == 'pointer':
@@ -154,24 +452,39 @@ class Helper:
         Input: type in expanded form
         this function adds this new type in type dictionary.
         This might be useful when the type does not have a explicit name.
+        A type with the same structure as an earlier one gets its name.
         '''
         assert(isinstance(type_, list))
-        typeName = 'type' + str(self.typeincr)
-        self.typeincr += 1
-        sz = self.computeSize(type_)
-        self.type[typeName] = {'size': sz, 'type': type_}
+        key = self.canonicalType(type_)
+        if key in self.unNamed:
+            typeName = self.unNamed[key]
+        else:
+            typeName = 'type' + str(self.typeincr)
+            self.typeincr += 1
+            sz = self.computeSize(type_)
+            self.type[typeName] = {'size': sz, 'type': type_}
+            self.typeIds[typeName] = key
+            self.unNamed[key] = typeName
+        if self.unNamedHook is not None:
+            self.unNamedHook(type_, typeName)
         return typeName
 
     def newVar(self, type_):
         # this type_ can be in compact or base format.
+        if self.checkOnly:
+            return '$t'
         var = 't' + str(self.varCount)
         if isinstance(type_, str):
             size_ = self.getSize(type_)
         else:
             size_ = self.computeSize(type_)
-        self.symbolTables[self.getScope()].add(var, type_)
-        self.symbolTables[self.getScope()].update(var, 'size', size_)
-        self.symbolTables[self.getScope()].update(var, 'offset', self.getOffset())
+        table = self.symbolTables[self.getScope()]
+        if table.lookUp(var):
+            # the program declared a variable named like the temporary
+            table.update(var, 'size', size_)
+            table.update(var, 'offset', self.getOffset())
+        else:
+            self.addSymbol(var, type_, size_, self.getOffset())
         self.updateOffset(size_)
 
         self.varCount += 1
@@ -181,10 +494,20 @@ class Helper:
         # if (self.labelCount == 0): # just to make 3AC pretty!
         #     label = 'Program Start'
         # else:
+        if self.checkOnly:
+            return '$label'
         label = 'label' + str(self.labelCount)
         self.labelCount += 1
         return label
 
+    def getScopeLabel(self, scope, kind):
+        # label of a scope ('start', 'end', 'update'), made the first time it
+        # is asked for so that scopes that never jump need no labels
+        metadata = self.symbolTables[scope].metadata
+        if kind not in metadata:
+            metadata[kind] = self.newLabel()
+        return metadata[kind]
+
     def newOffset(self):
         self.offsetStack.append(self.getOffset())
         return
@@ -214,8 +537,17 @@ class Helper:
         if scope != -1:
             self.symbolTables[scope].metadata['largest'] += self.getWidth(self.getScope())
         self.lastScope = self.scopeStack.pop()
+        for ident in self.symbolTables[self.lastScope].table:
+            self.shadow[ident].pop()
         self.popOffset()
 
+    def addSymbol(self, ident, type_, size=None, offset=None):
+        # adds ident to the current scope, unless it is already declared there
+        table = self.symbolTables[self.getScope()]
+        if not table.lookUp(ident):
+            table.add(ident, type_, size, offset)
+            self.shadow.setdefault(ident, []).append(self.getScope())
+
     def getLargest(self, scope):
         return self.symbolTables[scope].metadata['largest']
 
@@ -234,10 +566,7 @@ class Helper:
             return False
 
         # Default case
-        for scope in self.scopeStack[::-1]:
-            if self.symbolTables[scope].lookUp(identifier) is True:
-                return True
-        return False
+        return self.findScope(identifier) is not None
 
     def checkType(self, identifier):
         if identifier in self.type:
@@ -250,23 +579,24 @@ class Helper:
                 return self.symbolTables[0].get(identifier)
 
         else:
-            for scope in self.scopeStack[::-1]:
-                if self.symbolTables[scope].get(identifier) is not None:
-                    return self.symbolTables[scope].get(identifier)
+            scope = self.findScope(identifier)
+            if scope is not None:
+                return self.symbolTables[scope].table[identifier]
 
-            for scope in self.scopeStack[::-1]:
+            for scope in reversed(self.scopeStack):
                 if self.symbolTables[scope].typeDefs.get(identifier) is not None:
                     return self.symbolTables[scope].typeDefs.get(identifier)
         return None
 
     def findScope(self, identifier):
-        for scope in self.scopeStack[::-1]:
-            if self.symbolTables[scope].get(identifier) is not None:
-                return scope
+        scopes = self.shadow.get(identifier)
+        if scopes:
+            return scopes[-1]
+        return None
 
     def getNearest(self, type_):
         # return nearest parent scope with name = type_(func, for), -1 if no such scope exist
-        for scope in self.scopeStack[::-1]:
+        for scope in reversed(self.scopeStack):
             if self.symbolTables[scope].metadata['name'] == type_:
                 return scope
         return -1
@@ -347,41 +677,10 @@ class Helper:
             return -1
 
     def compareType(self, tp1, tp2):
-        # given 2 types (in compact form), checks wheather they denote same type or not
-        if isinstance(tp1, str):
-            tp1 = self.getBaseType(tp1)
-        if isinstance(tp2, str):
-            tp2 = self.getBaseType(tp2)
-
-        # This cancer code is just to handle the case of linked list (pointer to struct)
-        try:
-            if tp1[0] == 'pointer' and tp1[1][0] == 'struct' and isinstance(tp1[1][1], str):
-                tp1 = ['pointer', self.getBaseType(tp1[1][1])]
-        except:
-            pass
-        try:
-            if tp2[0] == 'pointer' and tp2[1][0] == 'struct' and isinstance(tp2[1][1], str):
-                tp2 = ['pointer', self.getBaseType(tp2[1][1])]
-        except:
-            pass
-
-        try:
-            if tp1[0] == 'struct' and isinstance(tp1[1], str):
-                tp1 = self.getBaseType(tp1[1])
-        except:
-            pass
-        
-        try:
-            if tp2[0] == 'struct' and isinstance(tp2[1], str):
-                tp2 = self.getBaseType(tp2[1])
-        except:
-            pass
-
-        # cancer ends, can do chemo now :P
-        if tp1 == tp2:
+        # given 2 types (in compact or expanded form), checks wheather they denote same type or not
+        if isinstance(tp1, str) and tp1 == tp2:
             return True
-        else:
-            return False
+        return self.canonicalType(tp1) is self.canonicalType(tp2)
 
     def checkArguments(self, name, arguments):
         # checks for a given function name and argument type list, matches with the function signature
@@ -406,21 +705,74 @@ class Helper:
         return 'arguments do not match any function signature'
 
     def getWidth(self, scope):
-        symTable = self.symbolTables[scope]
-        width = 0
-        for ident in symTable.table:
-            size_ = self.computeSize(symTable.get(ident)['type'])
-            width += size_
-        return width
+        return self.symbolTables[scope].width
 
     def getParamWidth(self, scope):
-        symTable = self.symbolTables[scope]
-        width = 0
-        for ident in symTable.table:
-            info = symTable.get(ident)
-            if 'is_arg' in info.keys():
-                width += self.type[info['type']]['size']
-        return width
+        return self.symbolTables[scope].paramWidth
+
+    def frameOffset(self, ident, identScope, funcScope):
+        # offset from ebp of a variable in the activation record of funcScope,
+        # arguments sit above the return address and locals below ebp
+        paramSize = self.getParamWidth(funcScope)
+        info = self.symbolTables[identScope].table[ident]
+        if 'is_arg' in info:
+            if 'parent' not in info:
+                return 8 + paramSize - info['size'] - info['offset']
+            return 8 + paramSize - info['offset']
+        if 'parent' in info:
+            return info['offset']
+        return -(info['offset'] + info['size'] - paramSize)
+
+    def saveGlobals(self):
+        r'''
+        Snapshot of what the declarations so far left at the top level: the
+        global symbol table and the types. Scopes, temporaries and labels
+        are not part of it, their counters only go up.
+        '''
+        return pickle.dumps((self.symbolTables[0], self.offsetStack[0], self.type, self.canonical,
+                             self.unNamed, self.sizes, self.typeincr))
+
+    def restoreGlobals(self, state):
+        table, offset, self.type, self.canonical, self.unNamed, self.sizes, self.typeincr = pickle.loads(state)
+        self.symbolTables[0] = table
+        self.scopeStack = [0]
+        self.offsetStack = [offset]
+        self.shadow = dict((ident, [0]) for ident in table.table)
+        self.typeIds = {}
+
+    def topLevel(self):
+        # closes the scopes a declaration cut short by a syntax error left open
+        while len(self.scopeStack) > 1:
+            self.endScope()
+
+    def globalsKey(self):
+        r'''
+        What later declarations can see of the top level: the globals but
+        temporaries, the function signatures and the types by name. Equal
+        keys give equal diagnostics for the declarations that follow.
+        '''
+        def keyOf(type_):
+            try:
+                return self.canonicalType(type_)
+            except (KeyError, IndexError, TypeError):
+                return repr(type_)
+
+        table = self.symbolTables[0]
+        names = {}
+        for ident, info in table.table.items():
+            if not (ident[0] == 't' and ident[1:].isdigit()):
+                names[ident] = (keyOf(info.type), info.flags)
+        functions = {}
+        for name, scopes in table.functions.items():
+            if isinstance(scopes, list):
+                signatures = []
+                for scope in scopes:
+                    metadata = self.symbolTables[scope].metadata
+                    signatures.append((tuple(keyOf(tp) for tp in metadata.get('signature', [])),
+                                       tuple(keyOf(tp) for tp in metadata.get('retvaltype', []))))
+                functions[name] = signatures
+        types = dict((name, keyOf(name)) for name in self.type)
+        return (names, functions, types, list(table.maybe))
 
     def debug(self):
         print('varCount:',self.varCount)
@@ -433,23 +785,52 @@ class Helper:
             print('symbolTable %d:'%table,self.symbolTables[table])
 
 
-class Node:
+class Node(Compact):
+    __slots__ = ('name', 'code', 'typeList', 'placeList', 'identList', 'sizeList', 'extra', 'scopeInfo')
+    # most nodes use the others, these two are rarely used
+    containers = {'identList': list, 'sizeList': list}
+
     def __init__(self,name):
+        self.name = name
         self.code = []
+        self.scopeInfo = []
         self.typeList = []
         self.placeList = []
-        self.identList = []
-        self.name = name
-        self.sizeList = []
         self.extra = {}
-        self.scopeInfo = []
-
-class LineCount:
-    def __init__(self):
-        self.lineno = 0
-
-    def add(self, count):
-        self.lineno += count
 
-    def get(self):
-        return self.lineno
+class LineIndex:
+    r'''
+    Offsets at which the lines of a source text start, so that the line
+    and column of an offset are found by binary search.
+    '''
+    def __init__(self, text):
+        self.text = text
+        # a machine word per line, a list of ints would take several
+        self.starts = array.array('q', [0])
+        pos = text.find('\n')
+        while pos != -1:
+            self.starts.append(pos + 1)
+            pos = text.find('\n', pos + 1)
+
+    def position(self, offset):
+        # 1-based line and column of offset
+        line = bisect.bisect_right(self.starts, offset)
+        return line, offset - self.starts[line - 1] + 1
+
+    def offset(self, line, column):
+        # inverse of position
+        return self.starts[line - 1] + column - 1
+
+    def edit(self, start, end, text, newText):
+        # follows the replacement of self.text[start:end] by text, which
+        # gives newText, the line starts after it are only moved
+        lo = bisect.bisect_right(self.starts, start)
+        hi = bisect.bisect_right(self.starts, end)
+        added = array.array('q')
+        pos = text.find('\n')
+        while pos != -1:
+            added.append(start + pos + 1)
+            pos = text.find('\n', pos + 1)
+        delta = len(text) - (end - start)
+        self.starts = self.starts[:lo] + added + array.array('q', map(delta.__add__, self.starts[hi:]))
+        self.text = newText
@@ -0,0 +1,44 @@
+
+class Label(str):
+    # marks a label definition inside a list of instructions, so the emitter
+    # never has to guess the kind of a line from its text
+    pass
+
+
+class AsmEmitter:
+    r'''
+    Writes NASM code straight to a (buffered) output stream.
+    Every line goes through the method for its kind, which alone decides
+    how it is formatted.
+    '''
+    def __init__(self, outfile):
+        self.outfile = outfile
+        self.lines = 0
+
+    def write(self, line):
+        self.outfile.write(line)
+        self.lines += 1
+
+    def directive(self, text):
+        # global, extern, section
+        self.write(text + '\n')
+
+    def data(self, text):
+        self.write('    ' + text + '\n')
+
+    def label(self, name):
+        self.write(name + ':\n')
+
+    def instr(self, text):
+        self.write('    ' + text + '\n')
+
+    def emit(self, code):
+        # a list of instructions as returned by the CodeGenerator handlers
+        for line in code:
+            if isinstance(line, Label):
+                self.label(line)
+            else:
+                self.instr(line)
+
+    def flush(self):
+        self.outfile.flush()
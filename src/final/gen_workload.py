@@ -0,0 +1,193 @@
+import argparse
+import random
+import sys
+
+
+class WorkloadGenerator:
+    r'''
+    Emits a random, but valid and terminating, program in the Go subset
+    accepted by parser.py. The same seed and sizes always give the same
+    program, so timings of different compiler versions can be compared.
+
+        numFuncs      functions besides main, each one only calls functions
+                      declared before it (and itself when recursive)
+        numStmts      statements in the top level block of every function
+        depth         maximum nesting of if / for blocks
+        arraySize     length of the arrays, also the bound of every loop
+        structFields  fields of every struct type
+        recursion     fraction of the functions that are recursive
+    '''
+    def __init__(self, seed=0, numFuncs=10, numStmts=20, depth=3, arraySize=10, structFields=4, recursion=0.2):
+        self.random = random.Random(seed)
+        self.numFuncs = numFuncs
+        self.numStmts = numStmts
+        self.depth = depth
+        self.arraySize = max(1, arraySize)
+        self.structFields = max(1, structFields)
+        self.recursion = recursion
+        self.numStructs = max(1, numFuncs // 5)
+        self.lines = []
+        self.indent = 0
+        self.counter = 0
+
+    def emit(self, line):
+        self.lines.append('\t' * self.indent + line)
+
+    def newName(self, prefix):
+        self.counter += 1
+        return prefix + str(self.counter)
+
+    def generate(self):
+        self.lines = []
+        self.emit('package main;')
+        self.emit('')
+        for idx in range(self.numStructs):
+            self.genStruct(idx)
+        for idx in range(self.numFuncs):
+            self.genFunc(idx)
+        self.genMain()
+        return '\n'.join(self.lines) + '\n'
+
+    def genStruct(self, idx):
+        self.emit('type rec%d struct {' % idx)
+        for field in range(self.structFields):
+            self.emit('\tf%d int;' % field)
+        self.emit('};')
+        self.emit('')
+
+    def genFunc(self, idx):
+        name = funcName(idx)
+        recursive = self.random.random() < self.recursion
+        self.emit('func %s(n int, m int) int {' % name)
+        self.indent += 1
+        scope = ['n', 'm']
+        if recursive:
+            # n decreases on every call, so the recursion always ends
+            self.emit('if n <= 0 {')
+            self.emit('\treturn m;')
+            self.emit('};')
+        self.genBlock(scope, idx, self.numStmts, self.depth)
+        if recursive:
+            self.emit('return %s(n-1, %s) + 1;' % (name, self.genExpr(scope, 2)))
+        else:
+            self.emit('return %s;' % self.genExpr(scope, 2))
+        self.indent -= 1
+        self.emit('};')
+        self.emit('')
+
+    def genMain(self):
+        self.emit('func main() {')
+        self.indent += 1
+        self.emit('total := 0;')
+        for idx in range(self.numFuncs):
+            self.emit('total = total + %s(%d, %d);' % (funcName(idx), self.random.randint(0, 5), self.random.randint(0, 9)))
+        self.emit('print total;')
+        self.indent -= 1
+        self.emit('};')
+
+    def genBlock(self, scope, funcIdx, numStmts, depth):
+        scope = list(scope)
+        for _ in range(numStmts):
+            self.genStmt(scope, funcIdx, depth)
+
+    def genStmt(self, scope, funcIdx, depth):
+        kinds = ['decl', 'assign', 'assign', 'array', 'struct', 'print']
+        if funcIdx > 0:
+            kinds.append('call')
+        if depth > 0:
+            kinds += ['if', 'for']
+        kind = self.random.choice(kinds)
+
+        if kind == 'decl':
+            var = self.newName('v')
+            self.emit('%s := %s;' % (var, self.genExpr(scope, 2)))
+            scope.append(var)
+        elif kind == 'assign':
+            var = self.random.choice(self.assignable(scope))
+            op = self.random.choice(['=', '+=', '-='])
+            self.emit('%s %s %s;' % (var, op, self.genExpr(scope, 2)))
+        elif kind == 'array':
+            arr = self.newName('a')
+            idx = self.newName('i')
+            self.emit('var %s [%d]int;' % (arr, self.arraySize))
+            self.emit('for %s := 0; %s < %d; %s++ {' % (idx, idx, self.arraySize, idx))
+            self.emit('\t%s[%s] = %s + %s;' % (arr, idx, idx, self.genExpr(scope, 1)))
+            self.emit('};')
+            var = self.newName('v')
+            self.emit('%s := %s[%d];' % (var, arr, self.random.randrange(self.arraySize)))
+            scope.append(var)
+        elif kind == 'struct':
+            rec = self.newName('r')
+            self.emit('var %s (type rec%d);' % (rec, self.random.randrange(self.numStructs)))
+            for field in range(self.structFields):
+                self.emit('%s.f%d = %s;' % (rec, field, self.genExpr(scope, 1)))
+            var = self.newName('v')
+            self.emit('%s := %s.f%d;' % (var, rec, self.random.randrange(self.structFields)))
+            scope.append(var)
+        elif kind == 'print':
+            self.emit('print %s;' % self.random.choice(scope))
+        elif kind == 'call':
+            var = self.random.choice(self.assignable(scope))
+            callee = self.random.randrange(funcIdx)
+            # small arguments keep recursive callees shallow
+            self.emit('%s = %s + %s(%d, %s);' % (var, var, funcName(callee), self.random.randint(0, 3), self.genExpr(scope, 1)))
+        elif kind == 'if':
+            self.emit('if %s %s %s {' % (self.genExpr(scope, 1), self.random.choice(['<', '<=', '>', '>=', '==', '!=']), self.genExpr(scope, 1)))
+            self.genNested(scope, funcIdx, depth)
+            if self.random.random() < 0.5:
+                self.emit('} else {')
+                self.genNested(scope, funcIdx, depth)
+            self.emit('};')
+        elif kind == 'for':
+            idx = self.newName('i')
+            self.emit('for %s := 0; %s < %d; %s++ {' % (idx, idx, self.arraySize, idx))
+            self.genNested(scope + [idx], funcIdx, depth)
+            self.emit('};')
+
+    def assignable(self, scope):
+        # n bounds the recursion and i* the loops, so they are never written
+        return [var for var in scope if var != 'n' and var[0] != 'i']
+
+    def genNested(self, scope, funcIdx, depth):
+        self.indent += 1
+        self.genBlock(scope, funcIdx, self.random.randint(1, 3), depth - 1)
+        self.indent -= 1
+
+    def genExpr(self, scope, depth):
+        if depth == 0 or self.random.random() < 0.3:
+            if self.random.random() < 0.7:
+                return self.random.choice(scope)
+            return str(self.random.randint(0, 100))
+        op = self.random.choice(['+', '-', '*'])
+        return '(%s %s %s)' % (self.genExpr(scope, depth-1), op, self.genExpr(scope, depth-1))
+
+
+def funcName(idx):
+    # the compiler labels a function by its name followed by its scope
+    # number, so a name ending in a digit could take the label of another one
+    return 'fn%d_' % idx
+
+
+def generate(seed=0, **sizes):
+    return WorkloadGenerator(seed, **sizes).generate()
+
+
+if __name__ == '__main__':
+    argParser = argparse.ArgumentParser(description='Generates a synthetic Go program for benchmarking the compiler')
+    argParser.add_argument('--seed', dest='seed', type=int, default=0, help='seed of the random generator')
+    argParser.add_argument('--functions', dest='numFuncs', type=int, default=10, help='number of functions besides main')
+    argParser.add_argument('--statements', dest='numStmts', type=int, default=20, help='top level statements per function')
+    argParser.add_argument('--depth', dest='depth', type=int, default=3, help='maximum nesting of if and for blocks')
+    argParser.add_argument('--array-size', dest='arraySize', type=int, default=10, help='length of arrays and loop bounds')
+    argParser.add_argument('--struct-fields', dest='structFields', type=int, default=4, help='fields per struct type')
+    argParser.add_argument('--recursion', dest='recursion', type=float, default=0.2, help='fraction of recursive functions')
+    argParser.add_argument('--output', dest='output', help='output .go file, stdout by default')
+    args = argParser.parse_args()
+
+    program = generate(args.seed, numFuncs=args.numFuncs, numStmts=args.numStmts, depth=args.depth,
+                       arraySize=args.arraySize, structFields=args.structFields, recursion=args.recursion)
+    if args.output is None:
+        sys.stdout.write(program)
+    else:
+        with open(args.output, 'w') as outFile:
+            outFile.write(program)
@@ -0,0 +1,255 @@
+r'''
+Incremental checking of a Go source that is being edited, for editors that
+want diagnostics on every keystroke.
+
+The source is cut into units at the semicolons that end top-level
+declarations, the package clause and imports forming the first unit. Every
+unit is parsed on its own, after the first one, with the symbol table and
+types the units before it left at the top level. An edit re-lexes the text
+around it (FastLexer.edit), and only the units whose tokens changed are
+checked again, followed by the later units for as long as what the top
+level looks like to them (Helper.globalsKey) differs from before.
+
+For a file without syntax errors the diagnostics are those of parser.py.
+parser.py stops at the first syntax error, here only its unit is cut
+short.
+'''
+import argparse
+import bisect
+import json
+import sys
+
+from ply import yacc
+
+import lexer as goLexer
+import parser as goParser
+from data_structures import Helper, Node
+
+semicolonId = goLexer.tokenIds['SEMICOLON']
+headerIds = (goLexer.tokenIds['PACKAGE'], goLexer.tokenIds['IMPORT'])
+openIds = (goLexer.tokenIds['LPAREN'], goLexer.tokenIds['LBRACK'], goLexer.tokenIds['LBRACE'])
+closeIds = (goLexer.tokenIds['RPAREN'], goLexer.tokenIds['RBRACK'], goLexer.tokenIds['RBRACE'])
+
+# scopes left behind by units checked again are not reused, past this many
+# per live one everything is checked from scratch
+maxOrphans = 2
+
+
+def splitUnits(types, first=0):
+    # (first, stop) of the units of the tokens from first on, cut at the
+    # semicolons outside of any parentheses, brackets or braces
+    depth = 0
+    start = first
+    for idx in range(first, len(types)):
+        kind = types[idx]
+        if kind in openIds:
+            depth += 1
+        elif kind in closeIds:
+            # an unbalanced closing one does not hide the semicolons after it
+            depth = max(depth - 1, 0)
+        elif kind == semicolonId and depth == 0:
+            yield start, idx + 1
+            start = idx + 1
+    if start < len(types):
+        yield start, len(types)
+
+def topLevelUnits(types):
+    # the units of all the tokens, the package clause and imports being the
+    # first one, empty if there are none
+    units = list(splitUnits(types))
+    header = 0
+    while header < len(units) and types[units[header][0]] in headerIds:
+        header += 1
+    stop = units[header-1][1] if header > 0 else 0
+    units[:header] = [(0, stop)]
+    return units
+
+
+class Unit:
+    r'''
+    The tokens first to stop of the source, with what checking them gave:
+    the errors and the top level after them.
+    '''
+    __slots__ = ('first', 'stop', 'dirty', 'state', 'key', 'errors', 'scopes')
+
+    def __init__(self, first, stop):
+        self.first = first
+        self.stop = stop
+        self.dirty = True
+        # Helper.saveGlobals and Helper.globalsKey after the unit
+        self.state = None
+        self.key = None
+        # (type, token, column, msg), token counted from first and column
+        # from the start of that token, so moving the unit keeps them right
+        self.errors = []
+        self.scopes = 0
+
+
+class IncrementalChecker:
+    r'''
+    Keeps the diagnostics of text up to date as it is edited.
+    '''
+    def __init__(self, text=''):
+        self.lexer = goLexer.FastLexer()
+        self.parser = yacc.yacc(module=goParser, debug=False, write_tables=False,
+                                errorlog=yacc.NullLogger())
+        # units checked by the last edit
+        self.checked = 0
+        self.reset(text)
+
+    def reset(self, text):
+        # lexes and checks text from scratch
+        self.helper = Helper()
+        # types only, as parser.py --check-only, no 3AC
+        self.helper.checkOnly = True
+        self.helper.newScope()
+        self.lexer.input(text)
+        self.units = [Unit(start, stop) for start, stop in topLevelUnits(self.lexer.types)]
+        self.checked = self.check(0)
+
+    def split(self, first):
+        return (Unit(start, stop) for start, stop in splitUnits(self.lexer.types, first))
+
+    def edit(self, start, end, text):
+        r'''
+        Replaces the source from offset start to end by text and checks
+        again what the edit may have changed.
+        '''
+        first, oldStop, newStop = self.lexer.edit(start, end, text)
+        units = self.units
+        if first == oldStop and first == newStop:
+            # only whitespace or comments changed between tokens
+            self.checked = 0
+            return
+        shift = newStop - oldStop
+        idx = bisect.bisect_right([unit.stop for unit in units], first)
+        idx = min(idx, len(units) - 1)
+        if idx <= 0:
+            self.reset(self.lexer.lexdata)
+            return
+
+        # cut the changed tokens into units until a cut falls where one was
+        # before, from there on the units are the old ones moved
+        oldStops = dict((unit.stop, pos) for pos, unit in enumerate(units) if pos >= idx and unit.stop >= oldStop)
+        newUnits = []
+        rest = []
+        for unit in self.split(units[idx].first):
+            newUnits.append(unit)
+            if unit.stop >= newStop and unit.stop - shift in oldStops:
+                pos = oldStops[unit.stop - shift]
+                # the state after it is compared with the old one
+                unit.key = units[pos].key
+                rest = units[pos+1:]
+                break
+        for unit in rest:
+            unit.first += shift
+            unit.stop += shift
+        if any(self.lexer.types[unit.first] in headerIds for unit in newUnits):
+            # an import among the declarations, recheck as a whole
+            self.reset(self.lexer.lexdata)
+            return
+        self.units = units[:idx] + newUnits + rest
+
+        live = sum(unit.scopes for unit in self.units)
+        if self.helper.scope > (maxOrphans + 1) * live + 64:
+            self.reset(self.lexer.lexdata)
+            return
+        self.checked = self.check(idx)
+
+    def check(self, idx):
+        # checks the units from idx on that changed or see a different top
+        # level than before, returns how many were checked
+        helper = self.helper
+        goParser.helper = helper
+        goParser.lexer = self.lexer
+        goParser.data = self.lexer.lexdata
+        errors = goLexer.compilation_errors
+        header = self.units[0]
+        if idx > 0:
+            helper.restoreGlobals(self.units[idx-1].state)
+
+        checked = 0
+        same = False
+        while idx < len(self.units):
+            unit = self.units[idx]
+            if same and not unit.dirty:
+                break
+            oldKey = unit.key
+            errors.__init__()
+            goParser.rootNode = Node('rootNode')
+            scope = helper.scope
+            if idx == 0:
+                self.lexer.select([(0, header.stop)])
+            else:
+                self.lexer.select([(0, header.stop), (unit.first, unit.stop)])
+            try:
+                self.parser.parse(None, lexer=self.lexer, tracking=True)
+            except goParser.ParseStop:
+                pass
+            except Exception:
+                # the semantic actions trust what they were given by the
+                # actions before, which half typed code can break. After an
+                # error of the unit that is what broke them, parser.py
+                # reports nothing more either
+                if errors.size() == 0:
+                    errors.add('Internal Error', goLexer.lexPosition(self.lexer, self.lexer.lexpos),
+                               'could not check the declaration past here')
+            helper.topLevel()
+            unit.scopes = helper.scope - scope
+            unit.errors = []
+            for err in errors.error:
+                offset = self.lexer.lineIndex.offset(err['lineno'], err['colno'])
+                # the errors of the package clause and imports are the first unit's
+                if idx == 0 or header.stop == 0 or offset >= self.lexer.ends[header.stop-1]:
+                    unit.errors.append(self.anchor(unit, offset, err))
+            unit.state = helper.saveGlobals()
+            unit.key = helper.globalsKey()
+            unit.dirty = False
+            same = oldKey is not None and unit.key == oldKey
+            checked += 1
+            idx += 1
+        errors.__init__()
+        return checked
+
+    def anchor(self, unit, offset, err):
+        # err at offset, made relative to the token of unit it falls in
+        lexer = self.lexer
+        token = max(bisect.bisect_right(lexer.starts, offset) - 1, unit.first)
+        if token >= len(lexer.starts) - 1 and (token >= len(lexer.starts) or offset >= lexer.ends[token]):
+            # past the last token, kept relative to the end of the text
+            return (err['type'], None, offset - len(lexer.lexdata), err['msg'])
+        return (err['type'], token - unit.first, offset - lexer.starts[token], err['msg'])
+
+    def errors(self):
+        r'''
+        The errors of the source as it is now, as compilation_errors holds
+        them after parser.py.
+        '''
+        lexer = self.lexer
+        result = []
+        for unit in self.units:
+            for type_, token, column, msg in unit.errors:
+                if token is None:
+                    offset = len(lexer.lexdata) + column
+                else:
+                    offset = lexer.starts[unit.first + token] + column
+                lineno, colno = goLexer.lexPosition(lexer, offset)
+                result.append({'type': type_, 'lineno': lineno, 'colno': colno, 'msg': msg})
+        return result
+
+
+if __name__ == '__main__':
+    argParser = argparse.ArgumentParser(description='Checks a .go file, then applies the edits read from stdin and prints the errors after each')
+    argParser.add_argument('--input', dest='in_file_location', help='Location of the input .go file', required=True)
+    args = argParser.parse_args()
+
+    checker = IncrementalChecker(goLexer.readSource(args.in_file_location))
+    print(json.dumps({'errors': checker.errors(), 'checked': checker.checked}))
+    # one edit per line: {"start": offset, "end": offset, "text": "..."}
+    for line in sys.stdin:
+        if line.strip() == '':
+            continue
+        edit = json.loads(line)
+        checker.edit(edit['start'], edit['end'], edit['text'])
+        print(json.dumps({'errors': checker.errors(), 'checked': checker.checked}))
+        sys.stdout.flush()
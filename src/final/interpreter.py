@@ -0,0 +1,678 @@
+r'''
+Interpreter for the 3AC generated by parser.py.
+
+Memory is modelled like the assembly of codeGen.py: every function gets an
+ebp based activation record laid out by Helper.frameOffset, arguments are
+pushed by 'param' and never popped by the caller, and a 'return' leaves the
+address of the returned variable in eax for the caller's 'retval' to copy.
+Memory is a map from byte address to the 4 byte word stored there, which
+holds a python int (wrapped to 32 bits), a float (rounded to single
+precision) or a string.
+
+Before running, every instruction is translated once into a closure with
+its operands already resolved to ebp offsets; the closure takes the index
+of its instruction and returns the index of the next one.
+'''
+import argparse
+import json
+import pickle as pkl
+import struct
+import sys
+from collections import defaultdict
+from optimizer import splitFunctions, basicBlocks, functionChecksum
+
+# address of the first word pushed on the stack
+stackTop = 0x7fff0000
+
+class InterpreterError(Exception):
+    pass
+
+def wrap(value):
+    # two's complement 32 bit integer
+    return ((value + 0x80000000) & 0xffffffff) - 0x80000000
+
+def single(value):
+    # round to single precision like an fstp dword
+    try:
+        return struct.unpack('f', struct.pack('f', value))[0]
+    except OverflowError:
+        return float('inf') if value > 0 else float('-inf')
+
+def intDiv(x, y):
+    if y == 0:
+        raise InterpreterError('integer division by zero')
+    quotient = abs(x) // abs(y)
+    if (x < 0) != (y < 0):
+        quotient = -quotient
+    return wrap(quotient)
+
+def intRem(x, y):
+    return wrap(x - intDiv(x, y) * y)
+
+def floatDiv(x, y):
+    if y == 0:
+        raise InterpreterError('float division by zero')
+    return single(x / y)
+
+intOps = {
+    '+': lambda x, y: wrap(x + y),
+    '-': lambda x, y: wrap(x - y),
+    '*': lambda x, y: wrap(x * y),
+    '/': intDiv,
+    '%': intRem,
+    '&': lambda x, y: x & y,
+    '|': lambda x, y: x | y,
+    '^': lambda x, y: x ^ y,
+    '<<': lambda x, y: wrap(x << (y & 31)),
+    '>>': lambda x, y: x >> (y & 31),
+}
+
+floatOps = {
+    '+': lambda x, y: single(x + y),
+    '-': lambda x, y: single(x - y),
+    '*': lambda x, y: single(x * y),
+    '/': floatDiv,
+}
+
+relOps = {
+    '==': lambda x, y: int(x == y),
+    '!=': lambda x, y: int(x != y),
+    '<': lambda x, y: int(x < y),
+    '>': lambda x, y: int(x > y),
+    '<=': lambda x, y: int(x <= y),
+    '>=': lambda x, y: int(x >= y),
+}
+
+def parseLiteral(text):
+    if text in ['true', 'True']:
+        return 1
+    if text in ['false', 'False']:
+        return 0
+    if isinstance(text, str) and text[:1] == '"':
+        return text[1:-1]
+    if isinstance(text, str):
+        try:
+            return int(text, 0)
+        except ValueError:
+            try:
+                return int(text)
+            except ValueError:
+                return single(float(text))
+    return text
+
+
+class Interpreter:
+    r'''
+    Runs the 3AC of rootNode, reading 'scan' input from the list of tokens
+    inputs and writing 'print' output to out.
+
+        interp = Interpreter(helper, rootNode, ['5'])
+        interp.run()
+        interp.opcodeCounts()
+    '''
+    def __init__(self, helper, rootNode, inputs=None, out=sys.stdout):
+        self.helper = helper
+        self.inputs = list(inputs) if inputs is not None else None
+        self.out = out
+        self.mem = defaultdict(int)
+        self.ebp = 0
+        self.esp = stackTop
+        self.eax = 0
+        self.steps = 0
+
+        # ops[i] executes opcodes[i], which is the instruction code[origin[i]];
+        # every function also gets a closing return, with origin None
+        self.ops = []
+        self.opcodes = []
+        self.origin = []
+        self.entry = {}
+        self.main = None
+
+        self.builders = {
+            '=': self.buildAssign,
+            'retval': self.buildRetVal,
+            'if': self.buildIf,
+            'goto': self.buildGoto,
+            'call': self.buildCall,
+            'param': self.buildParam,
+            'return': self.buildReturn,
+            '++': self.buildIncDec,
+            '--': self.buildIncDec,
+            '!': self.buildNot,
+            '*pointer': self.buildDeref,
+            'print_int': self.buildPrint,
+            'print_bool': self.buildPrint,
+            'print_float': self.buildPrint,
+            'print_string': self.buildPrint,
+            'scan_int': self.buildScan,
+            'scan_string': self.buildScan,
+        }
+        for op in intOps:
+            if op != '+':
+                self.builders[op + '='] = self.buildCompoundAssign
+        self.builders['+='] = self.buildCompoundAssign
+
+        self.load(rootNode.code, rootNode.scopeInfo)
+        self.hits = [0 for _ in self.ops]
+        # how often every if jumped
+        self.taken = [0 for _ in self.ops]
+
+    # ---------------- operands ----------------
+
+    def lookup(self, name, scope):
+        # symbol table entry of name, searching enclosing scopes if needed
+        while isinstance(scope, int):
+            table = self.helper.symbolTables[scope]
+            if name in table.table:
+                return table.table[name], scope
+            scope = table.parent
+        raise InterpreterError('unknown variable ' + str(name))
+
+    def isVar(self, scope):
+        return isinstance(scope, int)
+
+    def operand(self, name, scope, funcScope):
+        # (ebp offset, holds a reference) of a variable
+        info, identScope = self.lookup(name, scope)
+        return self.helper.frameOffset(name, identScope, funcScope), 'reference' in info
+
+    def loader(self, name, scope, funcScope):
+        # returns a function giving the current value of an operand
+        m = self
+        mem = self.mem
+        if not self.isVar(scope):
+            value = parseLiteral(name)
+            return lambda: value
+        off, ref = self.operand(name, scope, funcScope)
+        if ref:
+            return lambda: mem[mem[m.ebp + off]]
+        return lambda: mem[m.ebp + off]
+
+    def storer(self, name, scope, funcScope):
+        m = self
+        mem = self.mem
+        off, ref = self.operand(name, scope, funcScope)
+        if ref:
+            def store(value):
+                mem[mem[m.ebp + off]] = value
+        else:
+            def store(value):
+                mem[m.ebp + off] = value
+        return store
+
+    def address(self, name, scope, funcScope):
+        # returns a function giving the address of a variable, or of what it
+        # refers to when it is a reference
+        m = self
+        mem = self.mem
+        off, ref = self.operand(name, scope, funcScope)
+        if ref:
+            return lambda: mem[m.ebp + off]
+        return lambda: m.ebp + off
+
+    def baseType(self, name, scope):
+        info, _ = self.lookup(name, scope)
+        return self.helper.getBaseType(info['type'])
+
+    def words(self, name, scope):
+        info, _ = self.lookup(name, scope)
+        return info['size'] // 4
+
+    def push(self, value):
+        self.esp -= 4
+        self.mem[self.esp] = value
+
+    def pop(self):
+        value = self.mem[self.esp]
+        self.esp += 4
+        return value
+
+    # ---------------- loading ----------------
+
+    def load(self, code, scopeInfo):
+        funcs = splitFunctions(code)
+
+        # first give every instruction its position, so jumps can be resolved
+        labels = {}
+        position = 0
+        for name, start, end in funcs:
+            self.entry[name] = position
+            if name.rstrip('0123456789') == 'main':
+                self.main = name
+            for idx in range(start, end):
+                # a void return is the only one word instruction that is not a label
+                if len(code[idx]) == 1 and code[idx][0] != 'return':
+                    labels[code[idx][0]] = position
+                position += 1
+            position += 1
+
+        for name, start, end in funcs:
+            funcScope = self.helper.symbolTables[0].functions[name]
+            for idx in range(start, end):
+                instr = code[idx]
+                if idx == start:
+                    self.ops.append(self.buildPrologue(funcScope))
+                    self.opcodes.append('function')
+                elif len(instr) == 1 and instr[0] != 'return':
+                    self.ops.append(self.next)
+                    self.opcodes.append('label')
+                else:
+                    self.ops.append(self.build(instr, scopeInfo[idx], funcScope, labels))
+                    self.opcodes.append(instr[0])
+                self.origin.append(idx)
+            # falling off the end of a function returns from it
+            self.ops.append(self.buildReturn(['return'], [''], funcScope, labels))
+            self.opcodes.append('return')
+            self.origin.append(None)
+
+    def build(self, instr, scopeInfo, funcScope, labels):
+        opcode = instr[0]
+        try:
+            if opcode in self.builders:
+                return self.builders[opcode](instr, scopeInfo, funcScope, labels)
+            return self.buildTyped(instr, scopeInfo, funcScope, labels)
+        except (KeyError, IndexError, InterpreterError) as e:
+            error = 'cannot interpret ' + str(instr) + ': ' + str(e)
+        # only fail if the instruction is actually executed
+        def fail(pc):
+            raise InterpreterError(error)
+        return fail
+
+    def buildTyped(self, instr, scopeInfo, funcScope, labels):
+        # arithmetic, comparisons, unary minus and address-of, whose opcode
+        # is an operator followed by the type of its operands
+        opcode = instr[0]
+        for type_ in ['int', 'float', 'bool', 'string', 'pointer', 'struct', 'array']:
+            if opcode.endswith(type_):
+                op = opcode[:-len(type_)]
+                break
+        else:
+            # operators only defined on ints (%, |, ^, <<, >>) carry no type
+            if opcode not in intOps:
+                raise InterpreterError('unknown opcode')
+            op = opcode
+            type_ = 'int'
+
+        if len(instr) == 3:
+            if op == '&':
+                return self.buildAddressOf(instr, scopeInfo, funcScope, labels)
+            if op in ['-', '+']:
+                zero = 0.0 if type_ == 'float' else 0
+                fn = (floatOps if type_ == 'float' else intOps)[op]
+                return self.buildBinary(fn, [opcode, instr[1], zero, instr[2]], ['', scopeInfo[1], 'literal', scopeInfo[2]], funcScope)
+            raise InterpreterError('unknown unary operator')
+
+        if op in relOps:
+            return self.buildBinary(relOps[op], instr, scopeInfo, funcScope)
+        if type_ == 'float':
+            return self.buildBinary(floatOps[op], instr, scopeInfo, funcScope)
+        if op == '+' and self.isVar(scopeInfo[2]):
+            baseType = self.baseType(instr[2], scopeInfo[2])
+            if baseType[0] in ['struct', 'array']:
+                return self.buildElement(instr, scopeInfo, funcScope)
+        return self.buildBinary(intOps[op], instr, scopeInfo, funcScope)
+
+    # ---------------- handlers ----------------
+
+    def next(self, pc):
+        return pc + 1
+
+    def buildPrologue(self, funcScope):
+        helper = self.helper
+        frameSize = helper.getWidth(funcScope) - helper.getParamWidth(funcScope) + helper.getLargest(funcScope)
+        m = self
+        def prologue(pc):
+            m.push(m.ebp)
+            m.ebp = m.esp
+            m.esp -= frameSize
+            return pc + 1
+        return prologue
+
+    def buildReturn(self, instr, scopeInfo, funcScope, labels):
+        m = self
+        if len(instr) == 1:
+            def ret(pc):
+                m.esp = m.ebp
+                m.ebp = m.pop()
+                return m.pop()
+            return ret
+        # like 'lea eax', the address of the variable itself is returned
+        off, _ = self.operand(instr[1], scopeInfo[1], funcScope)
+        def retValue(pc):
+            m.eax = m.ebp + off
+            m.esp = m.ebp
+            m.ebp = m.pop()
+            return m.pop()
+        return retValue
+
+    def buildCall(self, instr, scopeInfo, funcScope, labels):
+        m = self
+        target = self.entry[instr[1]]
+        def call(pc):
+            m.push(pc + 1)
+            return target
+        return call
+
+    def buildParam(self, instr, scopeInfo, funcScope, labels):
+        m = self
+        mem = self.mem
+        if self.baseType(instr[1], scopeInfo[1])[0] in ['int', 'bool', 'float', 'string']:
+            load = self.loader(instr[1], scopeInfo[1], funcScope)
+            def param(pc):
+                m.push(load())
+                return pc + 1
+            return param
+        # structs and arrays are pushed word by word, last word first
+        address = self.address(instr[1], scopeInfo[1], funcScope)
+        words = self.words(instr[1], scopeInfo[1])
+        def paramCopy(pc):
+            base = address()
+            for idx in range(words - 1, -1, -1):
+                m.push(mem[base + 4 * idx])
+            return pc + 1
+        return paramCopy
+
+    def buildRetVal(self, instr, scopeInfo, funcScope, labels):
+        m = self
+        mem = self.mem
+        off, _ = self.operand(instr[1], scopeInfo[1], funcScope)
+        words = self.words(instr[1], scopeInfo[1])
+        def retval(pc):
+            dst = m.ebp + off
+            for idx in range(words):
+                mem[dst + 4 * idx] = mem[m.eax + 4 * idx]
+            return pc + 1
+        return retval
+
+    def buildIf(self, instr, scopeInfo, funcScope, labels):
+        m = self
+        load = self.loader(instr[1], scopeInfo[1], funcScope)
+        target = labels[instr[5]]
+        if instr[2] == '==':
+            def ifFalse(pc):
+                if load() == 0:
+                    m.taken[pc] += 1
+                    return target
+                return pc + 1
+            return ifFalse
+        def ifTrue(pc):
+            if load() != 0:
+                m.taken[pc] += 1
+                return target
+            return pc + 1
+        return ifTrue
+
+    def buildGoto(self, instr, scopeInfo, funcScope, labels):
+        target = labels[instr[1]]
+        return lambda pc: target
+
+    def buildBinary(self, fn, instr, scopeInfo, funcScope):
+        if self.isVar(scopeInfo[2]) and self.isVar(scopeInfo[3]):
+            dst, dstRef = self.operand(instr[1], scopeInfo[1], funcScope)
+            src1, src1Ref = self.operand(instr[2], scopeInfo[2], funcScope)
+            src2, src2Ref = self.operand(instr[3], scopeInfo[3], funcScope)
+            if not (dstRef or src1Ref or src2Ref):
+                # the common case, with everything in the current frame
+                m = self
+                mem = self.mem
+                def binaryFrame(pc):
+                    fp = m.ebp
+                    mem[fp + dst] = fn(mem[fp + src1], mem[fp + src2])
+                    return pc + 1
+                return binaryFrame
+        store = self.storer(instr[1], scopeInfo[1], funcScope)
+        load1 = self.loader(instr[2], scopeInfo[2], funcScope)
+        load2 = self.loader(instr[3], scopeInfo[3], funcScope)
+        def binary(pc):
+            store(fn(load1(), load2()))
+            return pc + 1
+        return binary
+
+    def buildElement(self, instr, scopeInfo, funcScope):
+        # t = obj + offset, the address of a field or an array element;
+        # t itself is a reference, so it is written directly
+        m = self
+        mem = self.mem
+        base = self.address(instr[2], scopeInfo[2], funcScope)
+        off, _ = self.operand(instr[1], scopeInfo[1], funcScope)
+        index = self.loader(instr[3], scopeInfo[3], funcScope)
+        def element(pc):
+            mem[m.ebp + off] = base() + index()
+            return pc + 1
+        return element
+
+    def buildAddressOf(self, instr, scopeInfo, funcScope, labels):
+        store = self.storer(instr[1], scopeInfo[1], funcScope)
+        address = self.address(instr[2], scopeInfo[2], funcScope)
+        def addressOf(pc):
+            store(address())
+            return pc + 1
+        return addressOf
+
+    def buildDeref(self, instr, scopeInfo, funcScope, labels):
+        # t = *p copies the whole object p points to
+        mem = self.mem
+        dst = self.address(instr[1], scopeInfo[1], funcScope)
+        src = self.loader(instr[2], scopeInfo[2], funcScope)
+        words = self.words(instr[1], scopeInfo[1])
+        def deref(pc):
+            to = dst()
+            frm = src()
+            for idx in range(words):
+                mem[to + 4 * idx] = mem[frm + 4 * idx]
+            return pc + 1
+        return deref
+
+    def buildAssign(self, instr, scopeInfo, funcScope, labels):
+        mem = self.mem
+        dst = instr[1]
+        src = instr[2]
+        if dst[0] == '*':
+            # *p = x
+            pointer = self.loader(dst[1:], scopeInfo[1], funcScope)
+            load = self.loader(src, scopeInfo[2], funcScope)
+            def storePointer(pc):
+                mem[pointer()] = load()
+                return pc + 1
+            return storePointer
+
+        baseType = self.baseType(dst, scopeInfo[1])
+        if baseType[0] in ['struct', 'array']:
+            to = self.address(dst, scopeInfo[1], funcScope)
+            frm = self.address(src, scopeInfo[2], funcScope)
+            words = self.words(dst, scopeInfo[1])
+            def copy(pc):
+                toAddr = to()
+                frmAddr = frm()
+                for idx in range(words):
+                    mem[toAddr + 4 * idx] = mem[frmAddr + 4 * idx]
+                return pc + 1
+            return copy
+
+        store = self.storer(dst, scopeInfo[1], funcScope)
+        if isinstance(src, str) and src[:1] == '(':
+            # conversion, (type)var
+            type_, name = src[1:].split(')', 1)
+            load = self.loader(name, scopeInfo[2], funcScope)
+            if self.helper.getBaseType(type_)[0] == 'float':
+                convert = lambda value: single(float(value))
+            else:
+                convert = lambda value: wrap(int(value))
+            def conversion(pc):
+                store(convert(load()))
+                return pc + 1
+            return conversion
+
+        if not self.isVar(scopeInfo[2]):
+            value = parseLiteral(src)
+            if baseType[0] == 'float':
+                value = single(float(value))
+            def assignLiteral(pc):
+                store(value)
+                return pc + 1
+            return assignLiteral
+
+        load = self.loader(src, scopeInfo[2], funcScope)
+        def assign(pc):
+            store(load())
+            return pc + 1
+        return assign
+
+    def buildCompoundAssign(self, instr, scopeInfo, funcScope, labels):
+        mem = self.mem
+        fn = intOps[instr[0][:-1]]
+        dst = instr[1]
+        if dst[0] == '*':
+            pointer = self.loader(dst[1:], scopeInfo[1], funcScope)
+            load = self.loader(instr[2], scopeInfo[2], funcScope)
+            def updatePointer(pc):
+                address = pointer()
+                mem[address] = fn(mem[address], load())
+                return pc + 1
+            return updatePointer
+        return self.buildBinary(fn, [instr[0], dst, dst, instr[2]], ['', scopeInfo[1], scopeInfo[1], scopeInfo[2]], funcScope)
+
+    def buildIncDec(self, instr, scopeInfo, funcScope, labels):
+        step = 1 if instr[0] == '++' else -1
+        return self.buildBinary(intOps['+'], [instr[0], instr[1], instr[1], step], ['', scopeInfo[1], scopeInfo[1], 'literal'], funcScope)
+
+    def buildNot(self, instr, scopeInfo, funcScope, labels):
+        return self.buildBinary(relOps['=='], [instr[0], instr[1], instr[2], 0], ['', scopeInfo[1], scopeInfo[2], 'literal'], funcScope)
+
+    def buildPrint(self, instr, scopeInfo, funcScope, labels):
+        m = self
+        load = self.loader(instr[1], scopeInfo[1], funcScope)
+        if instr[0] == 'print_float':
+            fmt = '%f \n'
+        elif instr[0] == 'print_string':
+            fmt = '%s\n'
+        else:
+            fmt = '%d '
+        def printValue(pc):
+            m.out.write(fmt % load())
+            return pc + 1
+        return printValue
+
+    def buildScan(self, instr, scopeInfo, funcScope, labels):
+        m = self
+        store = self.storer(instr[1], scopeInfo[1], funcScope)
+        convert = int if instr[0] == 'scan_int' else str
+        def scan(pc):
+            token = m.nextInput()
+            # like scanf, a failed read leaves the variable unchanged
+            if token is not None:
+                try:
+                    store(wrap(convert(token)) if convert is int else token)
+                except ValueError:
+                    pass
+            return pc + 1
+        return scan
+
+    def nextInput(self):
+        if self.inputs is None:
+            self.inputs = sys.stdin.read().split()
+        if len(self.inputs) == 0:
+            return None
+        return self.inputs.pop(0)
+
+    # ---------------- running ----------------
+
+    def run(self, maxSteps=None):
+        if self.main is None:
+            raise InterpreterError('no main function')
+        ops = self.ops
+        hits = self.hits
+        # main returns to -1, which ends the loop
+        self.push(-1)
+        pc = self.entry[self.main]
+        if maxSteps is None:
+            while pc >= 0:
+                hits[pc] += 1
+                pc = ops[pc](pc)
+        else:
+            steps = 0
+            while pc >= 0:
+                hits[pc] += 1
+                pc = ops[pc](pc)
+                steps += 1
+                if steps >= maxSteps:
+                    raise InterpreterError('more than %d instructions executed' % maxSteps)
+        self.steps = sum(hits)
+
+    def opcodeCounts(self):
+        counts = defaultdict(int)
+        for idx, hit in enumerate(self.hits):
+            if hit > 0:
+                counts[self.opcodes[idx]] += hit
+        return dict(counts)
+
+    def profile(self, code):
+        r'''
+        Execution counts of the run, per function of code (which must be the
+        3AC the interpreter was built from):
+
+            checksum    of the 3AC of the function, see functionChecksum
+            blocks      [times entered, times its final if jumped] per basic block
+            calls       [offset from the function start, callee, times executed]
+                        per call site
+        '''
+        opIndex = {}
+        for idx, origin in enumerate(self.origin):
+            if origin is not None:
+                opIndex[origin] = idx
+        functions = {}
+        for name, start, end in splitFunctions(code):
+            blocks = []
+            for first, last in basicBlocks(code, start, end):
+                blocks.append([self.hits[opIndex[first]], self.taken[opIndex[last]]])
+            calls = []
+            for idx in range(start, end):
+                if code[idx][0] == 'call':
+                    calls.append([idx - start, code[idx][1], self.hits[opIndex[idx]]])
+            functions[name] = {
+                'checksum': functionChecksum(code, start, end),
+                'entries': self.hits[opIndex[start]],
+                'blocks': blocks,
+                'calls': calls,
+            }
+        return {'functions': functions}
+
+    def reportCounts(self, out=sys.stderr):
+        counts = self.opcodeCounts()
+        out.write('%-14s %12s\n' % ('opcode', 'executed'))
+        for opcode in sorted(counts, key=lambda x: -counts[x]):
+            out.write('%-14s %12d\n' % (opcode, counts[opcode]))
+        out.write('%-14s %12d\n' % ('total', sum(counts.values())))
+
+
+if __name__=='__main__':
+    argParser = argparse.ArgumentParser(description='Runs the 3AC in rootNode.p and helper.p written by parser.py')
+    argParser.add_argument('--input', dest='input_file_location', help='file with the input of scan statements, stdin by default')
+    argParser.add_argument('--counts', dest='isCounts', action='store_true', help='print how many times every opcode was executed')
+    argParser.add_argument('--max-steps', dest='maxSteps', type=int, help='stop after executing this many instructions')
+    argParser.add_argument('--profile-out', dest='profile_location', help='write block and call site counts to this JSON file, for parser.py --pgo')
+    args = argParser.parse_args()
+
+    rootNode = pkl.load(open('rootNode.p', 'rb'))
+    helper = pkl.load(open('helper.p', 'rb'))
+
+    inputs = None
+    if args.input_file_location is not None:
+        with open(args.input_file_location, 'r') as inFile:
+            inputs = inFile.read().split()
+
+    interp = Interpreter(helper, rootNode, inputs)
+    try:
+        interp.run(args.maxSteps)
+    except InterpreterError as e:
+        sys.stdout.flush()
+        sys.stderr.write('[RuntimeError]: ' + str(e) + '\n')
+        sys.exit(1)
+    finally:
+        sys.stdout.write('\n')
+        if args.isCounts:
+            interp.reportCounts()
+
+    if args.profile_location is not None:
+        with open(args.profile_location, 'w') as jsonFile:
+            json.dump(interp.profile(rootNode.code), jsonFile, indent=1)
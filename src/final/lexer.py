@@ -1,6 +1,12 @@
+import array
+import bisect
+import mmap
+import os
+import re
+import sys
 from ply import lex
 from ply.lex import TOKEN
-from data_structures import Errors, LineCount
+from data_structures import Errors, LineIndex
 
 """
 CITE:
@@ -11,7 +17,6 @@ CITE:
 
 # reserved words in language
 compilation_errors = Errors()
-line_number = LineCount()
 
 reserved = {
     'nil': 'NIL',
@@ -173,7 +178,7 @@ exponent = r"(e|E)" + r"(\+|-)?" + decimals
 t_FLOAT_LITERAL = r"(" + decimals + r"\.(" + decimals + r")?(" + exponent + r")?" + r")|(" + decimals + exponent + r")|("+ \
     r"\." + decimals + r"(" + exponent + r")?" + r")"
 
-t_ignore = " \t"
+t_ignore = " \t\r\n"
 
 # t_STRING_LITERAL = r"\"[.]+\""
 # Definig functions for each token
@@ -185,13 +190,6 @@ def t_IDENT(t):
     return t
 
 
-def t_NL(t):
-    r"\n+"
-    t.lexer.lineno += len(t.value)
-    line_number.add(len(t.value))
-    pass
-
-
 def t_COMMENT(t):
     r"(//.*)|(/\*(.|\n)*?)\*/"
     pass
@@ -201,15 +199,238 @@ def t_STRING_LITERAL(t):
     r"(\"(.|\n)*?)\""
     return t
 
-# Compute column.
-#     input is the input text string
-#     token is a token instance
-def find_column(input, token):
-    line_start = input.rfind('\n', 0, token.lexpos) + 1
-    return (token.lexpos - line_start) + 1
+def readSource(path):
+    # decodes the file straight out of a memory map, so the text is the
+    # only copy of the source held in memory
+    with open(path, 'rb') as inFile:
+        if os.fstat(inFile.fileno()).st_size == 0:
+            return ''
+        with mmap.mmap(inFile.fileno(), 0, access=mmap.ACCESS_READ) as source:
+            return str(source, 'utf-8')
+
+def lexPosition(lexer, lexpos):
+    # line and column of lexpos in the input of lexer, the line starts are
+    # indexed once for every input
+    index = getattr(lexer, 'lineIndex', None)
+    if index is None or index.text is not lexer.lexdata:
+        index = lexer.lineIndex = LineIndex(lexer.lexdata)
+    return index.position(lexpos)
 
 def t_error(t):
-    # column_number = find_column(data, t)
     # TODO: instead of first character print the complete word
-    compilation_errors.add('Lexical Error', t.lexer.lineno, "Invalid token: %s"%t.value[0])
+    compilation_errors.add('Lexical Error', lexPosition(t.lexer, t.lexpos), "Invalid token: %s"%t.value[0])
     t.lexer.skip(1)  # skip ahead 1 character
+
+
+# token types by id for FastLexer, ids 0 and 1 mark skipped text and errors
+tokenTypes = ['', 'error'] + tokens
+tokenIds = dict((name, idx) for idx, name in enumerate(tokenTypes))
+identId = tokenIds['IDENT']
+quoId = tokenIds['QUO']
+
+def fastPattern():
+    # one regular expression for all the rules, in the order the PLY lexer
+    # tries them: rule functions as defined, then strings, longest first.
+    # The ignored characters before a token are part of its match, the
+    # empty group 1 marks where the token starts.
+    groups = []
+    for func in [t_IDENT, t_COMMENT, t_STRING_LITERAL]:
+        groups.append((func.__name__[2:], getattr(func, 'regex', func.__doc__)))
+    strings = [(name[2:], value) for name, value in globals().items()
+               if name.startswith('t_') and isinstance(value, str) and name != 't_ignore']
+    strings.sort(key=lambda x: len(x[1]), reverse=True)
+    groups += strings
+    # an ignored character is never an error, at the end of the input the
+    # rules fail on it and nothing may match it instead
+    groups.append(('error', '[^' + re.escape(t_ignore) + ']'))
+    # the group naming a rule is empty and comes after it, so that re can
+    # reject a rule by its first character without entering a group
+    rules = '|'.join('(?:%s)(?P<%s>)' % (regex, name) for name, regex in groups)
+    return re.compile('[' + re.escape(t_ignore) + ']*(?P<start>)(?:' + rules + ')', re.VERBOSE)
+
+class FastLexer:
+    r'''
+    Drop-in for the PLY lexer that splits the whole input with a single
+    regular expression into arrays of token type ids, starts and ends.
+    LexToken objects are only made as the parser asks for them, and
+    identifiers are interned so every occurrence shares one string.
+    After edit, only the tokens around the edited text are lexed again.
+    '''
+    pattern = None
+    # a token match may look this many characters past its end, as a float
+    # does for an exponent
+    lookahead = 3
+
+    def __init__(self):
+        if FastLexer.pattern is None:
+            FastLexer.pattern = fastPattern()
+            # group number of every rule to its token type id
+            FastLexer.groupIds = dict((number, tokenIds.get(name, 0))
+                                      for name, number in FastLexer.pattern.groupindex.items())
+            FastLexer.reservedIds = dict((word, tokenIds[name]) for word, name in reserved.items())
+        self.names = {}
+        self.lineno = 1
+        self.input('')
+
+    def scan(self, data, pos):
+        # (type id, start, end) of the tokens of data from pos on
+        groupIds = self.groupIds
+        reservedIds = self.reservedIds
+        for match in self.pattern.finditer(data, pos):
+            kind = groupIds[match.lastindex]
+            if kind == 0:
+                continue
+            start = match.end(1)
+            end = match.end()
+            if kind == identId:
+                kind = reservedIds.get(data[start:end], identId)
+            yield kind, start, end
+
+    def input(self, data):
+        self.lexdata = data
+        # 9 bytes a token, offsets fit as sources stay below 4GB
+        self.types = array.array('B')
+        self.starts = array.array('I')
+        self.ends = array.array('I')
+        addType = self.types.append
+        addStart = self.starts.append
+        addEnd = self.ends.append
+        for kind, start, end in self.scan(data, 0):
+            addType(kind)
+            addStart(start)
+            addEnd(end)
+        self.select([(0, len(self.types))])
+
+    def select(self, ranges):
+        # hands out only the tokens in the given (first, stop) index ranges
+        self.ranges = list(reversed(ranges))
+        self.next = self.stop = 0
+        # end of the last token handed out, read by the parser's tracking
+        self.lexpos = 0
+
+    def edit(self, start, end, text):
+        r'''
+        Replaces lexdata[start:end] by text. Lexing starts again at the
+        first token the edit may change and stops at the first new token
+        past the edit that is an old token moved, all later tokens are the
+        same. Returns (first, oldStop, newStop): the tokens from first to
+        oldStop were replaced by those from first to newStop.
+        '''
+        data = self.lexdata[:start] + text + self.lexdata[end:]
+        delta = len(text) - (end - start)
+        types, starts, ends = self.types, self.starts, self.ends
+        first = bisect.bisect_right(ends, start - self.lookahead)
+        # an unclosed string or comment is lexed as an error or as / and *,
+        # and closing it anywhere later changes the tokens from there
+        try:
+            first = types.index(1, 0, first)
+        except ValueError:
+            pass
+        limit = (starts[first] if first < len(types) else len(self.lexdata)) + 1
+        pos = self.lexdata.find('/*', 0, limit)
+        while pos != -1:
+            idx = bisect.bisect_left(starts, pos)
+            if idx < first and starts[idx] == pos and types[idx] == quoId:
+                first = idx
+                break
+            pos = self.lexdata.find('/*', pos + 1, limit)
+
+        newTypes = array.array('B')
+        newStarts = array.array('I')
+        newEnds = array.array('I')
+        stop = first
+        resume = start + len(text)
+        for kind, tokStart, tokEnd in self.scan(data, ends[first - 1] if first > 0 else 0):
+            if tokStart >= resume:
+                while stop < len(types) and starts[stop] + delta < tokStart:
+                    stop += 1
+                if (stop < len(types) and starts[stop] + delta == tokStart and
+                        ends[stop] + delta == tokEnd and types[stop] == kind):
+                    break
+            newTypes.append(kind)
+            newStarts.append(tokStart)
+            newEnds.append(tokEnd)
+        else:
+            stop = len(types)
+
+        self.types = types[:first] + newTypes + types[stop:]
+        self.starts = starts[:first] + newStarts + array.array('I', map(delta.__add__, starts[stop:]))
+        self.ends = ends[:first] + newEnds + array.array('I', map(delta.__add__, ends[stop:]))
+        index = getattr(self, 'lineIndex', None)
+        if index is not None and index.text is self.lexdata:
+            index.edit(start, end, text, data)
+        self.lexdata = data
+        self.select([(0, len(self.types))])
+        return first, stop, first + len(newTypes)
+
+    def token(self):
+        while True:
+            if self.next >= self.stop:
+                if len(self.ranges) == 0:
+                    self.lexpos = len(self.lexdata)
+                    return None
+                self.next, self.stop = self.ranges.pop()
+                continue
+            idx = self.next
+            self.next += 1
+            kind = self.types[idx]
+            start = self.starts[idx]
+            if kind == 1:
+                # reported when the parser gets here, as the PLY lexer does
+                compilation_errors.add('Lexical Error', lexPosition(self, start), "Invalid token: %s"%self.lexdata[start])
+                continue
+            tok = lex.LexToken()
+            tok.type = tokenTypes[kind]
+            tok.value = self.lexdata[start:self.ends[idx]]
+            if kind == identId:
+                tok.value = self.names.setdefault(tok.value, tok.value)
+            tok.lineno = self.lineno
+            tok.lexpos = start
+            tok.lexer = self
+            self.lexpos = self.ends[idx]
+            return tok
+
+    def __iter__(self):
+        return iter(self.token, None)
+
+
+def tokenStream(lexer, data):
+    # the (type, value, lexpos) of every token lexer makes from data
+    lexer.input(data)
+    return [(tok.type, tok.value, tok.lexpos) for tok in iter(lexer.token, None)]
+
+if __name__ == '__main__':
+    # differential test of FastLexer against the PLY lexer
+    import argparse
+    import glob
+    argParser = argparse.ArgumentParser(description='Checks that FastLexer gives the same tokens as the PLY lexer')
+    argParser.add_argument('files', nargs='*', help='.go files to lex, all of tests/ here and at the top of the repository by default')
+    args = argParser.parse_args()
+    here = os.path.dirname(os.path.abspath(__file__))
+    files = args.files
+    if not files:
+        for top in [here, os.path.join(here, '..', '..')]:
+            files += sorted(glob.glob(os.path.join(top, 'tests', '**', '*.go'), recursive=True))
+    # inputs the files do not cover: whitespace at the very end
+    inputs = [('<trailing %r>' % text, text) for text in ['a ', 'a \n', 'a\t\r\n', 'package main;\n   \n']]
+    inputs += [(path, readSource(path)) for path in files]
+
+    plyLexer = lex.lex()
+    failed = 0
+    for path, data in inputs:
+        expected = tokenStream(plyLexer, data)
+        plyErrors = compilation_errors.error
+        compilation_errors.__init__()
+        got = tokenStream(FastLexer(), data)
+        fastErrors = compilation_errors.error
+        compilation_errors.__init__()
+        if got != expected or fastErrors != plyErrors:
+            failed += 1
+            print('%s: FAILED' % path)
+            for idx in range(min(len(got), len(expected))):
+                if got[idx] != expected[idx]:
+                    print('    token %d: %s instead of %s' % (idx, got[idx], expected[idx]))
+                    break
+        else:
+            print('%s: %d tokens ok' % (path, len(expected)))
+    sys.exit(1 if failed else 0)
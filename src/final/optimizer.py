@@ -0,0 +1,637 @@
+
+r'''
+Optimization passes over the 3AC generated by parser.py.
+
+The 3AC is kept as two parallel lists, rootNode.code and rootNode.scopeInfo,
+and every function starts with a ['name::'] marker. Each pass takes both lists
+and returns the rewritten pair, so passes can be chained in optimize().
+'''
+import hashlib
+
+def isFuncMarker(instr):
+    return len(instr) == 1 and instr[0][-2:] == '::'
+
+def splitFunctions(code):
+    # returns (name, start, end) for every function, start being the marker index
+    funcs = []
+    for idx, instr in enumerate(code):
+        if isFuncMarker(instr):
+            if len(funcs) > 0:
+                funcs[-1][2] = idx
+            funcs.append([instr[0][:-2], idx, len(code)])
+    return [tuple(x) for x in funcs]
+
+def isLabel(instr):
+    # ['return'] of a void return is one word too
+    return len(instr) == 1 and not isFuncMarker(instr) and instr[0] != 'return'
+
+def basicBlocks(code, start, end):
+    # (first, last) of every basic block in the body of the function whose
+    # marker is at start. Blocks begin at labels and after if/goto/return,
+    # the ['return'] of a void return ends its block and never starts one
+    blocks = []
+    first = start + 1
+    for idx in range(start+1, end):
+        if isLabel(code[idx]) and idx > first:
+            blocks.append((first, idx-1))
+            first = idx
+        if code[idx][0] in ['if', 'goto', 'return']:
+            blocks.append((first, idx))
+            first = idx + 1
+    if first < end:
+        blocks.append((first, end-1))
+    return blocks
+
+def functionChecksum(code, start, end):
+    # identifies the 3AC a profile was recorded on
+    return hashlib.md5(repr(code[start:end]).encode()).hexdigest()
+
+def getParams(helper, funcScope):
+    # parameters of a function in declaration order
+    table = helper.symbolTables[funcScope].table
+    params = [ident for ident in table if 'is_arg' in table[ident]]
+    params.sort(key=lambda ident: table[ident]['offset'])
+    return params
+
+def tailCallElimination(code, scopeInfo, helper):
+    r'''
+    A self call whose result is returned right away,
+
+        param a1 ... param an
+        name call n
+        t retval eax
+        return t
+
+    is replaced by assigning a1..an to the parameters and jumping back to a
+    label placed at the function entry, so no new frame is pushed.
+    '''
+    funcs = splitFunctions(code)
+    if len(funcs) == 0:
+        return code, scopeInfo
+    newCode = code[:funcs[0][1]]
+    newScopeInfo = scopeInfo[:funcs[0][1]]
+    for name, start, end in funcs:
+        funcScope = helper.symbolTables[0].functions[name]
+        params = getParams(helper, funcScope)
+        table = helper.symbolTables[funcScope].table
+        scalar = True
+        for param in params:
+            if helper.getBaseType(table[param]['type'])[0] not in ['int', 'float', 'bool', 'string']:
+                scalar = False
+
+        body = code[start+1:end]
+        bodyScopeInfo = scopeInfo[start+1:end]
+        entryLabel = None
+        idx = 0
+        funcCode = []
+        funcScopeInfo = []
+        while idx < len(body):
+            instr = body[idx]
+            if scalar and instr[0] == 'call' and instr[1] == name and instr[2] == len(params) \
+                    and idx + 2 < len(body) and body[idx+1][0] == 'retval' \
+                    and body[idx+2] == ['return', body[idx+1][1]]:
+                numArgs = len(params)
+                pushed = funcCode[len(funcCode)-numArgs:]
+                safe = len(funcCode) >= numArgs and all(x[0] == 'param' for x in pushed)
+                if safe:
+                    args = [x[1] for x in pushed]
+                    argScopes = [x[1] for x in funcScopeInfo[len(funcScopeInfo)-numArgs:]]
+                    # assignments happen one after another, so an argument must not
+                    # read a parameter that has already been overwritten
+                    for j in range(numArgs):
+                        if args[j] in params[:j]:
+                            safe = False
+                if safe:
+                    if entryLabel is None:
+                        entryLabel = helper.newLabel()
+                    del funcCode[len(funcCode)-numArgs:]
+                    del funcScopeInfo[len(funcScopeInfo)-numArgs:]
+                    for j in range(numArgs):
+                        if args[j] != params[j]:
+                            funcCode.append(['=', params[j], args[j]])
+                            funcScopeInfo.append(['', funcScope, argScopes[j]])
+                    funcCode.append(['goto', entryLabel])
+                    funcScopeInfo.append(['', ''])
+                    idx += 3
+                    continue
+            funcCode.append(instr)
+            funcScopeInfo.append(bodyScopeInfo[idx])
+            idx += 1
+
+        newCode.append(code[start])
+        newScopeInfo.append(scopeInfo[start])
+        if entryLabel is not None:
+            newCode.append([entryLabel])
+            newScopeInfo.append([''])
+        newCode += funcCode
+        newScopeInfo += funcScopeInfo
+    return newCode, newScopeInfo
+
+relops = ['==', '!=', '<', '>', '<=', '>=']
+
+def isRelop(instr):
+    # typed comparisons like '<int' or '==float'
+    return len(instr) == 4 and instr[0] not in relops and instr[0].rstrip('abcdefghijklmnopqrstuvwxyz') in relops
+
+def isBoolDef(instr):
+    return isRelop(instr) or instr[0] == '!'
+
+def isConstLoad(instr, info, helper):
+    # 't = 6', which writes no memory other than its own variable
+    if instr[0] != '=' or len(instr) != 3 or type(instr[2]) not in [int, float]:
+        return False
+    entry = helper.symbolTables[info[1]].get(instr[1])
+    return entry is not None and 'reference' not in entry
+
+def branchOnly(code, scopeInfo):
+    # (name, scope) of the booleans that are only written by comparisons or
+    # '!' and only read by ifs, each value being read once
+    defs = {}
+    reads = {}
+    bad = set()
+    for instr, info in zip(code, scopeInfo):
+        for k in range(1, len(instr)):
+            if k >= len(info) or info[k] == '':
+                continue
+            key = (instr[k], info[k])
+            if k == 1 and instr[0] == 'if':
+                reads[key] = reads.get(key, 0) + 1
+            elif k == 1 and isBoolDef(instr):
+                defs[key] = defs.get(key, 0) + 1
+            else:
+                bad.add(key)
+    return set(key for key in reads if reads[key] == defs.get(key) and key not in bad)
+
+def labelUses(code):
+    uses = {}
+    for idx, instr in enumerate(code):
+        target = jumpTarget(instr)
+        if target is not None:
+            uses.setdefault(target, []).append(idx)
+    return uses
+
+def joinedBools(code, scopeInfo, labels):
+    # (name, scope) of the bools the parser joins the operands of && and ||
+    # in, those only written by copies and only read by the ifs of such
+    # joins. The condition of a loop is emitted twice, so one bool may have
+    # several joins.
+    def isCopy(idx, key):
+        instr = code[idx]
+        return instr[0] == '=' and len(instr) == 3 and (instr[1], scopeInfo[idx][1]) == key \
+            and (instr[2], scopeInfo[idx][2]) != key
+
+    def isTest(idx, key):
+        # an if right after a copy into key
+        return code[idx][0] == 'if' and (code[idx][1], scopeInfo[idx][1]) == key and idx > 0 and isCopy(idx-1, key)
+
+    found = {}
+    for idx, (instr, info) in enumerate(zip(code, scopeInfo)):
+        for k in range(1, min(len(instr), len(info))):
+            if info[k] == '':
+                continue
+            key = (instr[k], info[k])
+            if isCopy(idx, key) or isTest(idx, key):
+                ok = True
+            elif instr[0] == 'if' and k == 1 and idx > 1 and len(code[idx-1]) == 1 and isCopy(idx-2, key):
+                # the if after the join, only reached from the copy before
+                # the label or from the test of the first operand
+                refs = labels.get(code[idx-1][0], [])
+                ok = len(refs) == 1 and isTest(refs[0], key)
+            else:
+                ok = False
+            found[key] = found.get(key, True) and ok
+    return set(key for key in found if found[key])
+
+def newIf(var, scope, sense, label):
+    return ['if', var, sense, 'False', 'goto', label], ['', scope, '', '', '', '']
+
+def shortCircuit(code, scopeInfo, joined, labels):
+    # code ends in the if testing the value of an && or || as the parser
+    # emits it
+    #   t = x; if t == False goto L; ...; t = y; L: if t == False goto M
+    # which becomes
+    #   if x == False goto M; ...; if y == False goto M
+    # when t is one of joined. Returns whether it was rewritten.
+    if len(code) < 5 or len(code[-2]) != 1 or code[-3][0] != '=' or len(code[-3]) != 3:
+        return False
+    instr, info = code[-1], scopeInfo[-1]
+    key = (instr[1], info[1])
+    label = code[-2][0]
+    if (code[-3][1], scopeInfo[-3][1]) != key or key not in joined or len(labels.get(label, [])) != 1:
+        return False
+    first = None
+    for idx in range(len(code)-4, 0, -1):
+        if code[idx][0] == 'if' and code[idx][5] == label:
+            first = idx
+            break
+    if first is None or (code[first][1], scopeInfo[first][1]) != key:
+        return False
+    if code[first-1][0] != '=' or len(code[first-1]) != 3 or (code[first-1][1], scopeInfo[first-1][1]) != key:
+        return False
+
+    # t is true after the first if jumps when that if is '!= False', and the
+    # last if then jumps when it tests '!= False' as well
+    jumps = (code[first][2] == '!=') == (instr[2] == '!=')
+    left, leftInfo = code[first-1], scopeInfo[first-1]
+    right, rightInfo = code[-3], scopeInfo[-3]
+    code[first-1], scopeInfo[first-1] = newIf(left[2], leftInfo[2], code[first][2], instr[5] if jumps else label)
+    del code[first]
+    del scopeInfo[first]
+    test, testInfo = newIf(right[2], rightInfo[2], instr[2], instr[5])
+    if jumps:
+        code[-3:], scopeInfo[-3:] = [test], [testInfo]
+    else:
+        code[-3:], scopeInfo[-3:] = [test, [label]], [testInfo, ['']]
+    return True
+
+def lowerFunction(code, scopeInfo, helper):
+    # one round of lowerConditions over the body of a function
+    branch = branchOnly(code, scopeInfo)
+    labels = labelUses(code)
+    joined = joinedBools(code, scopeInfo, labels)
+    changed = False
+    newCode = []
+    newScopeInfo = []
+    for instr, info in zip(code, scopeInfo):
+        newCode.append(instr)
+        newScopeInfo.append(info)
+        if instr[0] != 'if':
+            continue
+        if shortCircuit(newCode, newScopeInfo, joined, labels):
+            changed = True
+            continue
+        if (instr[1], info[1]) not in branch:
+            continue
+        key = (instr[1], info[1])
+        sense = instr[2]
+        label = instr[5]
+        # the comparison or '!' that computed the tested value, only other
+        # comparisons, constant loads and ifs may be in between
+        defIdx = None
+        for idx in range(len(newCode)-2, -1, -1):
+            prev = newCode[idx]
+            if isBoolDef(prev) and (prev[1], newScopeInfo[idx][1]) == key:
+                defIdx = idx
+                break
+            if prev[0] != 'if' and not isRelop(prev) and not isConstLoad(prev, newScopeInfo[idx], helper):
+                break
+            if prev[0] == 'if' and (prev[1], newScopeInfo[idx][1]) == key:
+                break
+        if defIdx is None:
+            continue
+        define = newCode[defIdx]
+        defInfo = newScopeInfo[defIdx]
+
+        if isRelop(define):
+            if defIdx == len(newCode) - 2:
+                continue
+            # what is in between only writes its own variable, so unless that
+            # is an operand the comparison moves down next to its if
+            operands = [(define[2], defInfo[2]), (define[3], defInfo[3])]
+            written = [(x[1], y[1]) for x, y in zip(newCode[defIdx+1:-1], newScopeInfo[defIdx+1:-1]) if x[0] != 'if']
+            if any(x in operands for x in written):
+                continue
+            del newCode[defIdx]
+            del newScopeInfo[defIdx]
+            newCode.insert(len(newCode)-1, define)
+            newScopeInfo.insert(len(newScopeInfo)-1, defInfo)
+            changed = True
+            continue
+
+        # '!' has to be right before the if, its operand is not checked for
+        # writes in between
+        if defIdx != len(newCode) - 2:
+            continue
+        test, testInfo = newIf(define[2], defInfo[2], '!=' if sense == '==' else '==', label)
+        newCode[-2:] = [test]
+        newScopeInfo[-2:] = [testInfo]
+        changed = True
+    return newCode, newScopeInfo, changed
+
+def lowerConditions(code, scopeInfo, helper):
+    r'''
+    Prepares conditions for the fused compare and branch of codeGen.py. An
+    if on the result of && or || jumps straight from the test of either
+    operand instead of going through the bool the parser joins them in, an
+    if on !x tests x the other way round, and a comparison that only ifs
+    read is moved down to its if.
+    '''
+    funcs = splitFunctions(code)
+    if len(funcs) == 0:
+        return code, scopeInfo
+    newCode = code[:funcs[0][1]]
+    newScopeInfo = scopeInfo[:funcs[0][1]]
+    for name, start, end in funcs:
+        body = code[start+1:end]
+        bodyScopeInfo = scopeInfo[start+1:end]
+        changed = True
+        while changed:
+            body, bodyScopeInfo, changed = lowerFunction(body, bodyScopeInfo, helper)
+        newCode.append(code[start])
+        newScopeInfo.append(scopeInfo[start])
+        newCode += body
+        newScopeInfo += bodyScopeInfo
+    return newCode, newScopeInfo
+
+def jumpTarget(instr):
+    if instr[0] == 'goto':
+        return instr[1]
+    if instr[0] == 'if':
+        return instr[5]
+    return None
+
+def setJumpTarget(instr, label):
+    if instr[0] == 'goto':
+        instr[1] = label
+    else:
+        instr[5] = label
+
+def threadFunction(code, scopeInfo):
+    # one round of jumpThreading over the body of a function, returns the new
+    # body and whether anything changed
+    # the first label of every run of adjacent labels stands for the run
+    alias = {}
+    follow = {}
+    idx = 0
+    while idx < len(code):
+        if isLabel(code[idx]):
+            first = idx
+            while idx < len(code) and isLabel(code[idx]):
+                alias[code[idx][0]] = code[first][0]
+                idx += 1
+            if idx < len(code) and code[idx][0] == 'goto':
+                follow[code[first][0]] = code[idx][1]
+            continue
+        idx += 1
+
+    def resolve(label):
+        # follows gotos until a label that is not followed by one, an endless
+        # loop like 'L: goto L' stays where it is
+        seen = set()
+        label = alias[label]
+        while label in follow and label not in seen:
+            seen.add(label)
+            label = alias[follow[label]]
+        return label
+
+    changed = False
+    newCode = []
+    newScopeInfo = []
+    dead = False
+    for idx in range(len(code)):
+        instr = code[idx]
+        if isLabel(instr):
+            dead = False
+        elif dead:
+            changed = True
+            continue
+        target = jumpTarget(instr)
+        if target is not None:
+            instr = list(instr)
+            if resolve(target) != target:
+                setJumpTarget(instr, resolve(target))
+                changed = True
+            target = instr[-1]
+            # jumps to the label right after are dropped, so is
+            # 'if c goto L1; goto L2; L1:' which becomes 'if !c goto L2'
+            nextIdx = idx + 1
+            if instr[0] == 'if' and nextIdx < len(code) and code[nextIdx][0] == 'goto' \
+                    and nextIdx + 1 < len(code) and isLabel(code[nextIdx+1]) \
+                    and alias[code[nextIdx+1][0]] == alias[target]:
+                instr[2] = '!=' if instr[2] == '==' else '=='
+                instr[5] = resolve(code[nextIdx][1])
+                target = instr[5]
+                # the goto is dead now
+                dead = True
+                changed = True
+            if nextIdx < len(code) and isLabel(code[nextIdx]) and alias[code[nextIdx][0]] == alias[target]:
+                dead = dead or instr[0] == 'goto'
+                changed = True
+                continue
+            if instr[0] == 'goto':
+                dead = True
+        elif instr[0] == 'return':
+            dead = True
+        newCode.append(instr)
+        newScopeInfo.append(scopeInfo[idx])
+
+    # only labels something jumps to are kept
+    used = set()
+    for instr in newCode:
+        target = jumpTarget(instr)
+        if target is not None:
+            used.add(target)
+    code, scopeInfo = newCode, newScopeInfo
+    newCode = []
+    newScopeInfo = []
+    for idx in range(len(code)):
+        if isLabel(code[idx]) and code[idx][0] not in used:
+            changed = True
+            continue
+        newCode.append(code[idx])
+        newScopeInfo.append(scopeInfo[idx])
+    return newCode, newScopeInfo, changed
+
+def jumpThreading(code, scopeInfo, helper):
+    r'''
+    Cleans up the jumps around the labels of blocks and loops. A jump to a
+    label followed by a goto goes straight to the final target,
+    'if c goto L1; goto L2; L1:' becomes 'if !c goto L2', jumps to the next
+    instruction and code after a goto or return are dropped, adjacent labels
+    are merged and labels nothing jumps to are removed.
+    '''
+    funcs = splitFunctions(code)
+    if len(funcs) == 0:
+        return code, scopeInfo
+    newCode = code[:funcs[0][1]]
+    newScopeInfo = scopeInfo[:funcs[0][1]]
+    for name, start, end in funcs:
+        body = code[start+1:end]
+        bodyScopeInfo = scopeInfo[start+1:end]
+        changed = True
+        while changed:
+            body, bodyScopeInfo, changed = threadFunction(body, bodyScopeInfo)
+        newCode.append(code[start])
+        newScopeInfo.append(scopeInfo[start])
+        newCode += body
+        newScopeInfo += bodyScopeInfo
+    return newCode, newScopeInfo
+
+def compactLabels(code, scopeInfo, helper):
+    # numbers the labels left from 0 in order of appearance, so the label
+    # count no longer grows with every block the parser opened
+    names = {}
+    for instr in code:
+        if isLabel(instr):
+            names[instr[0]] = 'label' + str(len(names))
+    newCode = []
+    for instr in code:
+        if isLabel(instr):
+            instr = [names[instr[0]]]
+        elif jumpTarget(instr) is not None:
+            instr = list(instr)
+            setJumpTarget(instr, names[jumpTarget(instr)])
+        newCode.append(instr)
+    helper.labelCount = len(names)
+    return newCode, scopeInfo
+
+def layoutFunction(code, scopeInfo, start, end, blockProfile, helper):
+    r'''
+    Places the blocks of one function so that the hottest successor of every
+    block comes right after it, and blocks that never ran go last. Jumps to
+    the next block are dropped, an if whose taken side is placed next is
+    inverted, and a fall through that is no longer next becomes a goto.
+    '''
+    blocks = basicBlocks(code, start, end)
+    labelBlock = {}
+    for idx, (first, last) in enumerate(blocks):
+        if isLabel(code[first]):
+            labelBlock[code[first][0]] = idx
+
+    # successors of every block as (block, count)
+    succs = []
+    for idx, (first, last) in enumerate(blocks):
+        count, taken = blockProfile[idx]
+        term = code[last]
+        nextBlock = idx + 1 if idx + 1 < len(blocks) else None
+        if term[0] == 'goto':
+            succs.append([(labelBlock[term[1]], count)])
+        elif term[0] == 'if':
+            succs.append([(labelBlock[term[5]], taken), (nextBlock, count - taken)])
+        elif term[0] == 'return':
+            succs.append([])
+        else:
+            succs.append([(nextBlock, count)])
+
+    order = []
+    placed = [False for _ in blocks]
+    current = 0
+    while current is not None:
+        order.append(current)
+        placed[current] = True
+        best = None
+        for succ, count in succs[current]:
+            if succ is not None and not placed[succ] and count > 0:
+                if best is None or count > best[1]:
+                    best = (succ, count)
+        if best is not None:
+            current = best[0]
+            continue
+        # the chain ended, continue with the first hot block left, then the cold ones
+        current = None
+        for idx in range(len(blocks)):
+            if not placed[idx] and blockProfile[idx][0] > 0:
+                current = idx
+                break
+        if current is None:
+            for idx in range(len(blocks)):
+                if not placed[idx]:
+                    current = idx
+                    break
+
+    # blocks that become jump targets need a label
+    labels = {}
+    def labelOf(block):
+        first = blocks[block][0]
+        if isLabel(code[first]):
+            return code[first][0]
+        if block not in labels:
+            labels[block] = helper.newLabel()
+        return labels[block]
+
+    tails = []
+    for pos, block in enumerate(order):
+        first, last = blocks[block]
+        nextPlaced = order[pos+1] if pos + 1 < len(order) else None
+        body = [list(x) for x in code[first:last+1]]
+        bodyScopeInfo = [list(x) for x in scopeInfo[first:last+1]]
+        term = body[-1]
+        # 'end' is falling off the end of the function
+        fallthrough = block + 1 if block + 1 < len(blocks) else 'end'
+        if term[0] == 'goto':
+            fallthrough = None
+            if labelBlock[term[1]] == nextPlaced:
+                body.pop()
+                bodyScopeInfo.pop()
+        elif term[0] == 'return':
+            fallthrough = None
+        elif term[0] == 'if':
+            if fallthrough not in [nextPlaced, 'end'] and labelBlock[term[5]] == nextPlaced:
+                term[2] = '!=' if term[2] == '==' else '=='
+                term[5] = labelOf(fallthrough)
+                fallthrough = None
+        if fallthrough == 'end':
+            if nextPlaced is not None:
+                body.append(['return'])
+                bodyScopeInfo.append([''])
+        elif fallthrough is not None and fallthrough != nextPlaced:
+            body.append(['goto', labelOf(fallthrough)])
+            bodyScopeInfo.append(['', ''])
+        tails.append((block, body, bodyScopeInfo))
+
+    newCode = [code[start]]
+    newScopeInfo = [scopeInfo[start]]
+    for block, body, bodyScopeInfo in tails:
+        if block in labels:
+            newCode.append([labels[block]])
+            newScopeInfo.append([''])
+        newCode += body
+        newScopeInfo += bodyScopeInfo
+    return newCode, newScopeInfo
+
+def profileGuidedLayout(code, scopeInfo, helper, profile):
+    # functions changed since the profile was recorded keep their layout
+    funcs = splitFunctions(code)
+    if len(funcs) == 0:
+        return code, scopeInfo
+    newCode = code[:funcs[0][1]]
+    newScopeInfo = scopeInfo[:funcs[0][1]]
+    for name, start, end in funcs:
+        funcProfile = profile['functions'].get(name)
+        if funcProfile is not None and funcProfile['checksum'] == functionChecksum(code, start, end) \
+                and funcProfile['blocks'][0][0] > 0:
+            funcCode, funcScopeInfo = layoutFunction(code, scopeInfo, start, end, funcProfile['blocks'], helper)
+        else:
+            funcCode, funcScopeInfo = code[start:end], scopeInfo[start:end]
+        newCode += funcCode
+        newScopeInfo += funcScopeInfo
+    return newCode, newScopeInfo
+
+def inliningCandidates(code, profile, maxSize=40):
+    # hot call sites of small, non recursive functions, hottest first, as
+    # (caller, callee, count)
+    sizes = {}
+    recursive = set()
+    for name, start, end in splitFunctions(code):
+        sizes[name] = end - start - 1
+        for idx in range(start, end):
+            if code[idx][0] == 'call' and code[idx][1] == name:
+                recursive.add(name)
+    candidates = []
+    for caller in profile['functions']:
+        for offset, callee, count in profile['functions'][caller]['calls']:
+            if count > 0 and callee in sizes and sizes[callee] <= maxSize and callee not in recursive:
+                candidates.append((caller, callee, count))
+    candidates.sort(key=lambda x: -x[2])
+    return candidates
+
+# passes that rewrite every function on its own, compactLabels then
+# numbers the labels of the whole program
+functionPasses = [
+    tailCallElimination,
+    lowerConditions,
+    jumpThreading,
+]
+
+passes = functionPasses + [compactLabels]
+
+def optimize(rootNode, helper):
+    code = rootNode.code
+    scopeInfo = rootNode.scopeInfo
+    for pass_ in passes:
+        code, scopeInfo = pass_(code, scopeInfo, helper)
+    rootNode.code = code
+    rootNode.scopeInfo = scopeInfo
+
+def optimizeLayout(rootNode, helper, profile):
+    rootNode.code, rootNode.scopeInfo = profileGuidedLayout(rootNode.code, rootNode.scopeInfo, helper, profile)
@@ -2,7 +2,10 @@ from ply import lex
 from ply.lex import TOKEN
 import ply.yacc as yacc
 from lexer import *
-from data_structures import Helper, Node
+from data_structures import Helper, Node, ParseStop
+from optimizer import optimize, optimizeLayout, inliningCandidates
+from parsetree import DotWriter
+from profiler import PhaseProfiler, countReductions
 import json
 import argparse
 import sys
@@ -51,6 +54,11 @@ def p_start(p):
 
 # -------------------------------------------------------
 
+def position(p, n=1):
+    # line and column of the n-th symbol of a production, the parser tracks
+    # where every symbol starts
+    return lexPosition(p.lexer, p.lexpos(n))
+
 
 # -----------------------TYPES---------------------------
 def p_type(p):
@@ -75,7 +83,7 @@ def p_type_token(p):
         p[0].typeList.append(p[1])
     else:
         if not helper.checkType(p[2]):
-            compilation_errors.add('Type Error', line_number.get()+1, 'undefined: '+p[2])
+            compilation_errors.add('Type Error', position(p, 2), 'undefined: '+p[2])
         else:
             p[0].typeList.append(p[2])
 
@@ -102,7 +110,7 @@ def p_array_type(p):
         p[0].typeList.append(newSlice)
     else:
         if p[2].extra['count'] < 0:
-            compilation_errors.add('Size Error', line_number.get()+1, 'array bound must be non-negative')
+            compilation_errors.add('Size Error', position(p), 'array bound must be non-negative')
             return
         newArr = helper.addUnNamedType(['array', {
             'type': helper.getBaseType(p[4].typeList[0]),
@@ -133,7 +141,7 @@ def p_struct_type(p):
     p[0] = Node('StructType')
     for index_ in range(len(p[4].identList)):
         if p[4].identList[index_] in p[4].identList[:index_]:
-            compilation_errors.add('Redeclaration Error',line_number.get()+1, 'Field %s redeclared'%p[4].identList[index_])
+            compilation_errors.add('Redeclaration Error', position(p), 'Field %s redeclared'%p[4].identList[index_])
             return
     p[0] = p[4]
     dict_ = {}
@@ -154,11 +162,11 @@ def p_struct_type(p):
 
 def p_structInit(p):
     '''structInit : epsilon'''
-    helper.type[p[-3]] = {'type': ['struct', p[-3]], 'size': 0}
+    helper.setType(p[-3], {'type': ['struct', p[-3]], 'size': 0})
 
 def p_structDeInit(p):
     '''structDeInit : epsilon'''
-    helper.type.pop(p[-6], None)
+    helper.dropType(p[-6])
 
 def p_field_decl_rep(p):
     ''' FieldDeclRep : FieldDeclRep FieldDecl SEMICOLON
@@ -206,7 +214,7 @@ def p_sign(p):
     # we store it as a list since we need to handle void functions as well.
     msg = helper.updateSignature(p[2].typeList)
     if msg != 'cool':
-        compilation_errors.add('Redeclaration Error', line_number.get()+1, msg)
+        compilation_errors.add('Redeclaration Error', position(p), msg)
         return
     helper.updateRetValType(p[4].typeList)
 
@@ -232,7 +240,7 @@ def p_param_list_opt(p):
         p[0].name = 'ParameterListOpt'
         for index_ in range(len(p[1].typeList)):
             sz = helper.getSize(p[1].typeList[index_])
-            helper.symbolTables[helper.getScope()].add(p[1].identList[index_], p[1].typeList[index_])
+            helper.addSymbol(p[1].identList[index_], p[1].typeList[index_])
             helper.symbolTables[helper.getScope()].update(p[1].identList[index_], 'size', sz)
             helper.symbolTables[helper.getScope()].update(p[1].identList[index_], 'offset', helper.getOffset())
             helper.symbolTables[helper.getScope()].update(p[1].identList[index_], 'is_arg', True)
@@ -314,7 +322,7 @@ def p_const_decl(p):
     p[0].name = 'ConstDecl'
     for index_ in range(len(p[0].identList)):
         sz = helper.getSize(p[0].typeList[index_])
-        helper.symbolTables[helper.getScope()].add(p[0].identList[index_], p[0].typeList[index_])
+        helper.addSymbol(p[0].identList[index_], p[0].typeList[index_])
         helper.symbolTables[helper.getScope()].update(p[0].identList[index_], 'is_const', True)
         helper.symbolTables[helper.getScope()].update(p[0].identList[index_], 'offset', helper.getOffset())
         helper.symbolTables[helper.getScope()].update(p[0].identList[index_], 'size', sz)
@@ -342,16 +350,18 @@ def p_const_spec(p):
         p[0].typeList.append(p[2].typeList[0])
     if len(p[1].identList) != len(p[4].typeList):
         err_ = str(len(p[1].identList)) + ' constants but ' + str(len(p[4].typeList)) + ' values'
-        compilation_errors.add('Assignment Mismatch', line_number.get()+1, err_)
+        compilation_errors.add('Assignment Mismatch', position(p), err_)
     for type_ in p[4].typeList:
         if not helper.compareType(type_, p[2].typeList[0]):
             err_ = str(type_) + 'assigned to ' + str(p[2].typeList[0])
-            compilation_errors.add('TypeMismatch', line_number.get()+1, err_)
+            compilation_errors.add('TypeMismatch', position(p), err_)
+    p[0].placeList = p[4].placeList
+    p[0].name = 'ConstSpec'
+    if helper.checkOnly:
+        return
     for idx_ in range(len(p[1].identList)):
         p[0].code.append(['=', p[1].identList[idx_], p[4].placeList[idx_]])
         p[0].scopeInfo.append(['', helper.getScope(), helper.findScope(p[4].placeList[idx_])])
-    p[0].placeList = p[4].placeList
-    p[0].name = 'ConstSpec'
 
 def p_identifier_list(p):
     '''IdentifierList : IDENT IdentifierRep'''
@@ -359,7 +369,7 @@ def p_identifier_list(p):
     p[0].name = 'IdentifierList'
 
     if helper.checkId(p[1],'current') or (p[1] in p[2].identList):
-        compilation_errors.add("Redeclaration Error", line_number.get()+1,\
+        compilation_errors.add("Redeclaration Error", position(p),\
             "%s already declared"%p[1])
     else:
         p[0].identList.insert(0,p[1])
@@ -373,7 +383,7 @@ def p_identifier_rep(p):
     p[0].name = 'IdentifierRep'
     if len(p) == 4:
         if helper.checkId(p[3], 'current') or (p[3] in p[0].identList):
-            compilation_errors.add("Redeclaration Error", line_number.get()+1,\
+            compilation_errors.add("Redeclaration Error", position(p, 3),\
             "%s already declared"%p[1])
         else:
             p[0].identList.append(p[3])
@@ -441,10 +451,10 @@ def p_alias_decl(p):
     p[0] = Node('AliasDecl')
 
     if helper.checkType(p[1]):
-        compilation_errors.add("Redeclaration Error", line_number.get()+1,\
+        compilation_errors.add("Redeclaration Error", position(p),\
             "Alias %s already declared"%p[1])
     else:
-        helper.type[p[1]] = helper.type[p[3].typeList[0]]
+        helper.setType(p[1], helper.type[p[3].typeList[0]])
 # -------------------------------------------------------
 
 
@@ -454,10 +464,10 @@ def p_type_def(p):
     p[0] = Node('Typedef')
 
     if helper.checkType(p[1]):
-        compilation_errors.add("Redeclaration Error", line_number.get()+1,\
+        compilation_errors.add("Redeclaration Error", position(p),\
             "Type %s already declared"%p[1])
     else:
-        helper.type[p[1]] = helper.type[p[2].typeList[0]]
+        helper.setType(p[1], helper.type[p[2].typeList[0]])
 # -------------------------------------------------------
 
 
@@ -472,7 +482,7 @@ def p_var_decl(p):
     p[0].name = 'VarDecl'
     for index_ in range(len(p[0].identList)):
         sz = helper.getSize(p[0].typeList[index_])
-        helper.symbolTables[helper.getScope()].add(p[0].identList[index_], p[0].typeList[index_])
+        helper.addSymbol(p[0].identList[index_], p[0].typeList[index_])
         helper.symbolTables[helper.getScope()].update(p[0].identList[index_], 'offset', helper.getOffset())
         helper.symbolTables[helper.getScope()].update(p[0].identList[index_], 'size', sz)
         helper.updateOffset(sz)
@@ -499,10 +509,12 @@ def p_var_spec(p):
     if p[2] == '=':
         if len(p[1].identList) != len(p[3].typeList):
             err_ = str(len(p[1].identList)) + ' varaibles but ' + str(len(p[3].typeList)) + ' values'
-            compilation_errors.add('Assignment Mismatch', line_number.get()+1, err_)
+            compilation_errors.add('Assignment Mismatch', position(p), err_)
         else:
             p[0].typeList = p[3].typeList
             p[0].placeList = p[3].placeList
+            if helper.checkOnly:
+                return
             for idx_ in range(len(p[3].placeList)):
                 p[0].code.append(['=', p[1].identList[idx_], p[3].placeList[idx_]])
                 p[0].scopeInfo.append(['', helper.getScope(), helper.findScope(p[3].placeList[idx_])])
@@ -513,14 +525,16 @@ def p_var_spec(p):
         if len(p[3].typeList) != 0: # not going to empty
             if len(p[0].identList) != len(p[3].typeList):
                 err_ = str(len(p[0].identList)) + ' varaibles but ' + str(len(p[3].typeList)) + ' values'
-                compilation_errors.add('Assignment Mismatch', line_number.get()+1, err_)
+                compilation_errors.add('Assignment Mismatch', position(p), err_)
                 return
             for type_ in p[3].typeList:
                 if not helper.compareType(type_, p[2].typeList[0]):
                     err_ = str(type_) + ' assign to ' + str(p[2].typeList[0])
-                    compilation_errors.add('TypeMismatch', line_number.get()+1,err_)
+                    compilation_errors.add('TypeMismatch', position(p),err_)
                     return
             p[0].placeList = p[3].placeList
+            if helper.checkOnly:
+                return
             for idx_ in range(len(p[3].placeList)):
                 p[0].code.append(['=', p[1].identList[idx_], p[3].placeList[idx_]])
                 p[0].scopeInfo.append(['', helper.getScope(), helper.findScope(p[3].placeList[idx_])])
@@ -545,14 +559,16 @@ def p_short_var_decl(p):
     p[0] = Node('ShortVarDecl')
 
     if helper.checkId(p[1],'current'):
-        compilation_errors.add("Redeclaration Error", line_number.get()+1,\
+        compilation_errors.add("Redeclaration Error", position(p),\
             "%s already declared"%p[1])
     try:
         sz = helper.getSize(p[3].typeList[0])
-        helper.symbolTables[helper.getScope()].add(p[1],p[3].typeList[0])
+        helper.addSymbol(p[1],p[3].typeList[0])
         helper.symbolTables[helper.getScope()].update(p[1], 'offset', helper.getOffset())
         helper.symbolTables[helper.getScope()].update(p[1], 'size', sz)
         helper.updateOffset(sz)
+        if helper.checkOnly:
+            return
         p[0].code = p[3].code
         p[0].scopeInfo = p[3].scopeInfo
         p[0].code.append(['=', p[1], p[3].placeList[0]])
@@ -615,16 +631,8 @@ def p_create_scope(p):
         if p[-1].name == 'FunctionName':
             type_ = 'func'
             helper.makeSymTabFunc(p[-1].extra['name'])
-
-    label1 = helper.newLabel()
-    label2 = helper.newLabel()
-    label3 = helper.newLabel()
-    label4 = helper.newLabel()
-    helper.symbolTables[helper.getScope()].updateMetadata('start', label1)
-    helper.symbolTables[helper.getScope()].updateMetadata('end', label2)
+    # labels of the scope are made on demand by helper.getScopeLabel
     helper.symbolTables[helper.getScope()].updateMetadata('name', type_)
-    helper.symbolTables[helper.getScope()].updateMetadata('update',label3)
-    helper.symbolTables[helper.getScope()].updateMetadata('condition', label4)
 
 
 def p_delete_scope(p):
@@ -660,28 +668,33 @@ def p_basic_lit_1(p):
     p[0] = Node('IntLit')
     p[0].typeList.append('int')
     newVar = helper.newVar('int')
-
+    p[0].placeList.append(newVar)
+    if helper.checkOnly:
+        return
     p[0].code.append(['=', newVar, int(p[1])])
     p[0].scopeInfo.append(['', helper.getScope() , 'int_literal'])
-    p[0].placeList.append(newVar)
 
 def p_basic_lit_2(p):
     '''FloatLit : FLOAT_LITERAL'''
     p[0] = Node('FloatLit')
     p[0].typeList.append('float')
     newVar = helper.newVar('float')
+    p[0].placeList.append(newVar)
+    if helper.checkOnly:
+        return
     p[0].code.append(['=', newVar, float(p[1])])
     p[0].scopeInfo.append(['', helper.getScope() , 'literal'])
-    p[0].placeList.append(newVar)
 
 def p_basic_lit_3(p):
     '''StringLit : STRING_LITERAL'''
     p[0] = Node('StringLit')
     p[0].typeList.append('string')
     newVar = helper.newVar('string')
+    p[0].placeList.append(newVar)
+    if helper.checkOnly:
+        return
     p[0].code.append(['=', newVar, p[1]])
     p[0].scopeInfo.append(['', helper.getScope() , 'literal'])
-    p[0].placeList.append(newVar)
 
 def p_basic_lit_4(p):
     '''BoolLit : TRUE
@@ -689,9 +702,11 @@ def p_basic_lit_4(p):
     p[0] = Node('BoolLit')
     p[0].typeList.append('bool')
     newVar = helper.newVar('bool')
+    p[0].placeList.append(newVar)
+    if helper.checkOnly:
+        return
     p[0].code.append(['=', newVar, p[1]])
     p[0].scopeInfo.append(['', helper.getScope() , 'literal'])
-    p[0].placeList.append(newVar)
 
 # new rules finished
 
@@ -699,7 +714,7 @@ def p_operand_name(p):
     '''OperandName : IDENT'''
     p[0] = Node('OperandName')
     if not helper.checkId(p[1],'default'):
-        compilation_errors.add('NameError', line_number.get()+1, '%s not declared'%p[1])
+        compilation_errors.add('NameError', position(p), '%s not declared'%p[1])
     else:
         info_ = helper.findInfo(p[1],'default')
         p[0].typeList.append(info_['type'])
@@ -723,46 +738,52 @@ def p_prim_expr(p):
         if True:
             baseType = helper.getBaseType(p[1].typeList[0])
             ident = p[2].extra['ident']
-            if isinstance(baseType[1], str):
-                baseType[1] = helper.getBaseType(baseType[1])[1]
+            # types are shared between expressions, so a struct referred to
+            # by name is looked up rather than filled in
+            fields = baseType[1]
+            if isinstance(fields, str):
+                fields = helper.getBaseType(fields)[1]
             if baseType[0] != 'struct':
-                compilation_errors.add('TypeMismatch', line_number.get()+1, 'Before the period we must have struct type')
-            elif ident not in baseType[1]:
-                err_ = 'Name ' + str(baseType[1]) + ' has no field, or method called ' + ident
-                compilation_errors.add('Field Error', line_number.get()+1, err_)
+                compilation_errors.add('TypeMismatch', position(p, 2), 'Before the period we must have struct type')
+            elif ident not in fields:
+                err_ = 'Name ' + str(fields) + ' has no field, or method called ' + ident
+                compilation_errors.add('Field Error', position(p, 2), err_)
 
             else:
-                identType = helper.addUnNamedType(baseType[1][ident]['type'])
+                identType = helper.addUnNamedType(fields[ident]['type'])
                 newVar1 = helper.newVar('int')
                 helper.symbolTables[helper.getScope()].update(newVar1, 'type', identType)
-                p[0].code.append(['+int', newVar1, p[1].placeList[0], baseType[1][ident]['offset']])
-                p[0].scopeInfo.append(['', helper.getScope(), helper.findScope(p[1].placeList[0]), 'offset'])
+                if not helper.checkOnly:
+                    p[0].code.append(['+int', newVar1, p[1].placeList[0], fields[ident]['offset']])
+                    p[0].scopeInfo.append(['', helper.getScope(), helper.findScope(p[1].placeList[0]), 'offset'])
                 p[0].placeList = [newVar1]
                 p[0].identList = p[0].placeList
                 p[0].typeList = [identType]
                 helper.symbolTables[helper.getScope()].update(newVar1, 'reference', True)
         else:
-            compilation_errors.add('TypeMismatch', line_number.get()+1, 'Before period we must have struct')
+            compilation_errors.add('TypeMismatch', position(p, 2), 'Before period we must have struct')
 
     elif p[2].name == 'Index':
         p[0] = p[1]
-        p[0].code += p[2].code
-        p[0].scopeInfo += p[2].scopeInfo
+        if not helper.checkOnly:
+            p[0].code += p[2].code
+            p[0].scopeInfo += p[2].scopeInfo
         rawType = helper.getBaseType(p[1].typeList[0])
         if not helper.compareType(p[2].typeList[0], 'int'):
             return # error handling already done in Index : rule
         elif rawType[0] != 'array' and rawType[0] != 'pointer':
-            compilation_errors.add('Invalid Operation', line_number.get()+1, 'type ' + str(helper.getBaseType(p[1].typeList[0])) + ' does not support indexing')
+            compilation_errors.add('Invalid Operation', position(p, 2), 'type ' + str(helper.getBaseType(p[1].typeList[0])) + ' does not support indexing')
         else:
             arrayElemtp = helper.addUnNamedType(rawType[1]['type'])
             newVar1 = helper.newVar('int')
             helper.symbolTables[helper.getScope()].update(newVar1, 'type', arrayElemtp)
             newVar2 = helper.newVar('int')
-            arrayElemSz = helper.type[arrayElemtp]['size']
-            p[0].code.append(['*' + 'int', newVar2, p[2].placeList[0], arrayElemSz])
-            p[0].scopeInfo.append(['', helper.getScope(), helper.findScope(p[2].placeList[0]), 'literal'])
-            p[0].code.append(['+' + 'int', newVar1, p[1].placeList[0], newVar2])
-            p[0].scopeInfo.append(['', helper.getScope(), helper.findScope(p[1].placeList[0]), helper.getScope()])
+            if not helper.checkOnly:
+                arrayElemSz = helper.type[arrayElemtp]['size']
+                p[0].code.append(['*' + 'int', newVar2, p[2].placeList[0], arrayElemSz])
+                p[0].scopeInfo.append(['', helper.getScope(), helper.findScope(p[2].placeList[0]), 'literal'])
+                p[0].code.append(['+' + 'int', newVar1, p[1].placeList[0], newVar2])
+                p[0].scopeInfo.append(['', helper.getScope(), helper.findScope(p[1].placeList[0]), helper.getScope()])
             p[0].placeList = [newVar1]
             p[0].typeList = [arrayElemtp]
             helper.symbolTables[helper.getScope()].update(newVar1, 'reference', True)
@@ -772,23 +793,25 @@ def p_prim_expr(p):
         p[0] = p[2]
         msg = helper.checkArguments(p[1],p[2].typeList)
         if msg[0] == 'a':
-            compilation_errors.add('Type Error',line_number.get()+1, msg)
+            compilation_errors.add('Type Error', position(p), msg)
         else:
             funcScope = int(msg)
             if funcScope == -1:
-                compilation_errors.add('Declaration Error', line_number.get()+1, 'Function %s not defined'%p[1])
+                compilation_errors.add('Declaration Error', position(p), 'Function %s not defined'%p[1])
             else:
-                for arg in p[2].placeList:
-                    p[0].code.append(['param', arg])
-                    p[0].scopeInfo.append(['', helper.findScope(arg)])
-                p[0].code.append(['call', p[1] + str(funcScope), len(p[2].placeList)])
-                p[0].scopeInfo.append(['', 'function', 'int'])
+                if not helper.checkOnly:
+                    for arg in p[2].placeList:
+                        p[0].code.append(['param', arg])
+                        p[0].scopeInfo.append(['', helper.findScope(arg)])
+                    p[0].code.append(['call', p[1] + str(funcScope), len(p[2].placeList)])
+                    p[0].scopeInfo.append(['', 'function', 'int'])
                 type_ = helper.getRetType(funcScope)
                 size_ = helper.getRetSize(funcScope)
                 p[0].typeList = type_
                 newVar1 = helper.newVar(type_)
-                p[0].code.append(['retval', newVar1, 'eax'])
-                p[0].scopeInfo.append(['', helper.findScope(newVar1), ''])
+                if not helper.checkOnly:
+                    p[0].code.append(['retval', newVar1, 'eax'])
+                    p[0].scopeInfo.append(['', helper.findScope(newVar1), ''])
                 argList = ''
                 for arg in p[2].placeList:
                     argList += str(arg) + ', '
@@ -813,7 +836,7 @@ def p_index(p):
     p[0] = p[2]
     p[0].name = 'Index'
     if not helper.compareType(p[2].typeList[0], 'int'):
-        compilation_errors.add('TypeError',line_number.get(), "Index type should be integer")
+        compilation_errors.add('TypeError', position(p, 2), "Index type should be integer")
 
 def p_argument(p):
     '''Arguments : LPAREN ExpressionListTypeOpt RPAREN'''
@@ -837,17 +860,21 @@ def p_expr(p):
     if len(p) == 2:
         p[0].typeList = p[1].typeList
         p[0].placeList = p[1].placeList
-        p[0].code = p[1].code
-        p[0].scopeInfo = p[1].scopeInfo
+        if not helper.checkOnly:
+            p[0].code = p[1].code
+            p[0].scopeInfo = p[1].scopeInfo
         p[0].extra['deref'] = p[1].extra['deref']
+        # a plain variable may live in an enclosing scope
         p[0].extra['scope'] = helper.getScope()
+        if len(p[1].placeList) > 0 and helper.findScope(p[1].placeList[0]) is not None:
+            p[0].extra['scope'] = helper.findScope(p[1].placeList[0])
     else:
         p[0].extra['deref'] = ['no']
         tp = helper.getBaseType(p[1].typeList[0])
         if not helper.compareType(p[1].typeList[0], p[3].typeList[0]):
-            compilation_errors.add('TypeMismatch', line_number.get()+1, 'Type should be same across binary operator')
+            compilation_errors.add('TypeMismatch', position(p, 2), 'Type should be same across binary operator')
         elif tp[0] not in p[2].extra:
-            compilation_errors.add('TypeMismatch', line_number.get()+1, 'Invalid type for binary expression')
+            compilation_errors.add('TypeMismatch', position(p, 2), 'Invalid type for binary expression')
         else:
             if len(p[2].typeList) > 0:
                 # for boolean
@@ -855,8 +882,30 @@ def p_expr(p):
             else:
                 p[0].typeList = p[1].typeList
             newVar = helper.newVar(p[0].typeList[0])
+            p[0].placeList.append(newVar)
+            p[0].extra['scope'] = helper.getScope()
+            if helper.checkOnly:
+                return
             p[0].code = p[1].code
             p[0].scopeInfo = p[1].scopeInfo
+            if p[2].extra['opcode'] in ['&&', '||']:
+                # the right operand is only evaluated when the left one
+                # does not decide the result
+                #   t = x; if t == False goto L; <y>; t = y; L:
+                # with != instead of == for ||
+                endLabel = helper.newLabel()
+                sense = '==' if p[2].extra['opcode'] == '&&' else '!='
+                p[0].code.append(['=', newVar, p[1].placeList[0]])
+                p[0].scopeInfo.append(['', helper.getScope(), helper.findScope(p[1].placeList[0])])
+                p[0].code.append(['if', newVar, sense, 'False', 'goto', endLabel])
+                p[0].scopeInfo.append(['', helper.getScope(), '', '', '', ''])
+                p[0].code += p[3].code
+                p[0].scopeInfo += p[3].scopeInfo
+                p[0].code.append(['=', newVar, p[3].placeList[0]])
+                p[0].scopeInfo.append(['', helper.getScope(), helper.findScope(p[3].placeList[0])])
+                p[0].code.append([endLabel])
+                p[0].scopeInfo.append([''])
+                return
             p[0].code += p[3].code
             p[0].scopeInfo += p[3].scopeInfo
             if len(p[2].extra) < 3:
@@ -866,8 +915,6 @@ def p_expr(p):
                 baseType = helper.getBaseType(p[1].typeList[0])
                 p[0].code.append([p[2].extra['opcode'] + baseType[0], newVar, p[1].placeList[0], p[3].placeList[0]])
                 p[0].scopeInfo.append(['', helper.getScope(), helper.findScope(p[1].placeList[0]), helper.findScope(p[3].placeList[0])])
-            p[0].placeList.append(newVar)
-            p[0].extra['scope'] = helper.getScope()
 
 def p_unary_expr(p):
     '''UnaryExpr : PrimaryExpr
@@ -878,19 +925,22 @@ def p_unary_expr(p):
     if len(p) == 2:
         p[0].typeList = p[1].typeList
         p[0].placeList = p[1].placeList
-        p[0].code = p[1].code
-        p[0].scopeInfo = p[1].scopeInfo
+        if not helper.checkOnly:
+            p[0].code = p[1].code
+            p[0].scopeInfo = p[1].scopeInfo
 
     elif p[1] == '!':
         tp = helper.getBaseType(p[2].typeList[0])
         if tp != ['bool']:
-            compilation_errors.add('TypeMismatch', line_number.get()+1, 'Type should be boolean')
+            compilation_errors.add('TypeMismatch', position(p), 'Type should be boolean')
         else:
             p[0].typeList = p[2].typeList
-            p[0].placeList = p[2].placeList
+            newVar = helper.newVar(p[0].typeList[0])
+            p[0].placeList = [newVar]
+            if helper.checkOnly:
+                return
             p[0].code = p[2].code
             p[0].scopeInfo = p[2].scopeInfo
-            newVar = helper.newVar(p[0].typeList[0])
             p[0].code.append(['!', newVar, p[2].placeList[0]])
             p[0].scopeInfo.append(['', helper.getScope(), helper.findScope(p[2].placeList[0])])
     else:
@@ -900,7 +950,7 @@ def p_unary_expr(p):
             ck = True
             rawType = helper.getBaseType(p[2].typeList[0])
             if rawType[0] != 'pointer':
-                compilation_errors.add('TypeMismatch', line_number.get()+1, 'Expected pointer type')
+                compilation_errors.add('TypeMismatch', position(p), 'Expected pointer type')
             else:
                 newType = helper.addUnNamedType(rawType[1])
                 p[0].typeList = [newType]
@@ -913,7 +963,7 @@ def p_unary_expr(p):
             updateNeeded = False
         rawType = helper.getBaseType(p[2].typeList[0])
         if rawType[0] not in p[1].extra and not ck:
-            compilation_errors.add('TypeMismatch', line_number.get()+1, 'Invalid type for unary expression')
+            compilation_errors.add('TypeMismatch', position(p), 'Invalid type for unary expression')
         else:
             if updateNeeded:
                 p[0].typeList = p[2].typeList
@@ -923,6 +973,8 @@ def p_unary_expr(p):
             newVar = helper.newVar(p[0].typeList[0])
             p[0].placeList = [newVar]
             p[0].identList = [newVar]
+            if helper.checkOnly:
+                return
             p[0].code = p[2].code
             p[0].scopeInfo = p[2].scopeInfo
             p[0].code.append([p[1].extra['opcode'] + helper.getBaseType(p[2].typeList[0])[0], newVar, p[2].placeList[0]])
@@ -1005,12 +1057,13 @@ def p_conversion(p):
     p[0] = p[4]
     p[0].name = 'Conversion'
     if (p[2].typeList[0][0] not in ['f', 'i']) or (p[4].typeList[0][0] not in ['i', 'f']):
-        compilation_errors.add('TypeError', line_number.get()+1, 'Type conversion between only float/int allowed')
+        compilation_errors.add('TypeError', position(p), 'Type conversion between only float/int allowed')
         return
 
     newVar = helper.newVar(p[2].typeList[0])
-    p[0].code.append(['=', newVar, '(' + str(p[2].typeList[0]) + ')' + str(p[4].placeList[0])])
-    p[0].scopeInfo.append(['', helper.getScope(), helper.findScope(p[4].placeList[0])])
+    if not helper.checkOnly:
+        p[0].code.append(['=', newVar, '(' + str(p[2].typeList[0]) + ')' + str(p[4].placeList[0])])
+        p[0].scopeInfo.append(['', helper.getScope(), helper.findScope(p[4].placeList[0])])
     p[0].placeList = [newVar]
     p[0].typeList = p[2].typeList
 
@@ -1060,7 +1113,9 @@ def p_inc_dec(p):
     rawType = helper.getBaseType(p[1].typeList[0])
     if  rawType[0] != 'int':
         err_ = str(p[1].typeList[0]) + 'cannot be incremented/decremented'
-        compilation_errors.add('TypeMismatch', line_number.get()+1, err_)
+        compilation_errors.add('TypeMismatch', position(p), err_)
+    if helper.checkOnly:
+        return
     p[0].code.append([p[2], p[1].placeList[0], p[1].placeList[0]])
     p[0].scopeInfo.append(['', helper.findScope(p[1].placeList[0]), helper.findScope(p[1].placeList[0])])
 
@@ -1069,22 +1124,24 @@ def p_assignment(p):
     p[0] = p[1]
     if len(p[1].typeList) != len(p[3].typeList):
         err_ = str(len(p[1].typeList)) + ' identifier on left, while ' + str(len(p[3].placeList)) + ' expression on right'
-        compilation_errors.add('Assignment Mismatch', line_number.get()+1, err_)
+        compilation_errors.add('Assignment Mismatch', position(p), err_)
     else:
         for idx in range(len(p[3].typeList)):
             rawTp1 = helper.getBaseType(p[1].typeList[idx])
             rawTp2 = helper.getBaseType(p[3].typeList[idx])
             if not helper.compareType(rawTp1, rawTp2):
                 err_ = str(rawTp1) + ' assigned to ' + str(rawTp2)
-                compilation_errors.add('TypeMismatch', line_number.get()+1, err_)
+                compilation_errors.add('TypeMismatch', position(p), err_)
             info = helper.findInfo(p[1].placeList[idx])
             if info is None:
                 info = []
             if 'is_const' in info:
-                compilation_errors.add('ConstantAssignment', line_number.get()+1, 'Constant cannot be reassigned')
+                compilation_errors.add('ConstantAssignment', position(p), 'Constant cannot be reassigned')
             if p[2].extra['opcode'] != '=' and rawTp1[0] not in p[2].extra:
-                compilation_errors.add('TypeMismatch', line_number.get()+1, 'Invalid Type for operator %s'%p[2].extra['opcode'])
+                compilation_errors.add('TypeMismatch', position(p), 'Invalid Type for operator %s'%p[2].extra['opcode'])
     p[0].name = 'Assignment'
+    if helper.checkOnly:
+        return
     p[0].code += p[3].code
     p[0].scopeInfo += p[3].scopeInfo
     for idx_ in range(len(p[3].typeList)):
@@ -1127,7 +1184,9 @@ def p_if_statement(p):
     p[0] = p[3]
     rawType = helper.getBaseType(p[3].typeList[0])
     if rawType[0] != 'bool':
-        compilation_errors.add('TypeError',line_number.get()+1, 'Non-bool expression (%s) used as if condition'%p[3].typeList[0])
+        compilation_errors.add('TypeError', position(p, 3), 'Non-bool expression (%s) used as if condition'%p[3].typeList[0])
+    if helper.checkOnly:
+        return
     # if x relopy gotoL
 
     newLabel1 = helper.newLabel()
@@ -1166,6 +1225,8 @@ def p_print(p):
     '''PrintStmt : PRINT ExpressionList'''
     p[0] = p[2]
     p[0].name = 'PrintStmt'
+    if helper.checkOnly:
+        return
     for idx, var in enumerate(p[2].placeList):
         p[0].code.append(['print_' + str(helper.getBaseType(p[2].typeList[idx])[0]), var])
         p[0].scopeInfo.append(['', helper.findScope(var)])
@@ -1174,6 +1235,8 @@ def p_scan(p):
     '''ScanStmt : SCAN ExpressionList'''
     p[0] = p[2]
     p[0].name = 'ScanStmt'
+    if helper.checkOnly:
+        return
     for idx, var in enumerate(p[2].placeList):
         p[0].code.append(['scan_' + str(helper.getBaseType(p[2].typeList[idx])[0]), var])
         p[0].scopeInfo.append(['', helper.findScope(var)])
@@ -1182,84 +1245,119 @@ def p_scan(p):
 
 
 # --------- FOR STATEMENTS AND OTHERS ---------------
+def copyCode(code, scopeInfo):
+    # a copy of some 3AC that can be emitted a second time, with fresh labels
+    labels = {}
+    for instr in code:
+        if len(instr) == 1:
+            labels[instr[0]] = helper.newLabel()
+    newCode = []
+    for instr in code:
+        instr = list(instr)
+        if len(instr) == 1:
+            instr[0] = labels[instr[0]]
+        elif instr[0] == 'goto' and instr[1] in labels:
+            instr[1] = labels[instr[1]]
+        elif instr[0] == 'if' and instr[5] in labels:
+            instr[5] = labels[instr[5]]
+        newCode.append(instr)
+    return newCode, [list(x) for x in scopeInfo]
+
 def p_for(p):
     '''ForStmt : FOR CreateScope ConditionBlockOpt Block EndScope'''
+    # the loop is rotated, so an iteration takes a single backward branch
+    #       init
+    #       cond; if cond == False goto end
+    #   start:
+    #       body
+    #   update:
+    #       post
+    #       cond; if cond != False goto start
+    #   end:
     p[0] = p[3]
-    start = helper.symbolTables[helper.lastScope].metadata['start']
-    update = helper.symbolTables[helper.lastScope].metadata['update']
-    end = helper.symbolTables[helper.lastScope].metadata['end']
+    p[0].name = 'ForStmt'
+    if helper.checkOnly:
+        return
+    start = helper.getScopeLabel(helper.lastScope, 'start')
+    update = helper.getScopeLabel(helper.lastScope, 'update')
+    end = helper.getScopeLabel(helper.lastScope, 'end')
+    cond = p[3].extra['condition']
+    post = p[3].extra['post']
+    if cond is not None:
+        guardCode, guardScopeInfo = copyCode(cond.code, cond.scopeInfo)
+        p[0].code += guardCode
+        p[0].scopeInfo += guardScopeInfo
+        p[0].code.append(['if', cond.placeList[0], '==', 'False', 'goto', end])
+        p[0].scopeInfo.append(['', cond.extra['condScope'], '', '', '', ''])
     p[0].code += [[start]]
     p[0].scopeInfo.append([''])
     p[0].code += p[4].code
     p[0].scopeInfo += p[4].scopeInfo
-    p[0].code += [['goto', update]]
-    p[0].scopeInfo.append(['', ''])
+    p[0].code += [[update]]
+    p[0].scopeInfo.append([''])
+    if post is not None:
+        p[0].code += post.code
+        p[0].scopeInfo += post.scopeInfo
+    if cond is not None:
+        p[0].code += cond.code
+        p[0].scopeInfo += cond.scopeInfo
+        p[0].code.append(['if', cond.placeList[0], '!=', 'False', 'goto', start])
+        p[0].scopeInfo.append(['', cond.extra['condScope'], '', '', '', ''])
+    else:
+        p[0].code += [['goto', start]]
+        p[0].scopeInfo.append(['', ''])
     p[0].code += [[end]]
     p[0].scopeInfo.append([''])
-    p[0].name = 'ForStmt'
 
 
 def p_conditionblockopt(p):
     '''ConditionBlockOpt : epsilon
                            | Condition
                            | ForClause'''
-
-    p[0] = p[1]
-    condition = helper.symbolTables[helper.getScope()].metadata['condition']
-    update = helper.symbolTables[helper.getScope()].metadata['update']
-    if p[1].name != 'ForClause':
-        p[0].code.insert(0, [condition])
-        p[0].scopeInfo.insert(0, [''])
-    if p[1].name == 'epsilon':
-        p[0].extra['isInfinite'] = True
-        p[0].code += [[update]]
-        p[0].scopeInfo.append([''])
+    # extra['condition'] and extra['post'] are put together by p_for, the
+    # code is what runs once before the loop
+    if p[1].name == 'ForClause':
+        p[0] = p[1]
+    else:
+        p[0] = Node('ConditionBlockOpt')
+        p[0].extra['condition'] = None
+        p[0].extra['post'] = None
+        if p[1].name == 'epsilon':
+            p[0].extra['isInfinite'] = True
+        else:
+            p[0].extra['condition'] = p[1]
     p[0].name = 'ConditionBlockOpt'
 
 
 def p_condition(p):
     '''Condition : Expression'''
     p[0] = p[1]
-    end = helper.symbolTables[helper.getScope()].metadata['end']
-    p[0].code.append(['if', p[1].placeList[0], '==', 'False', 'goto', end])
-    p[0].scopeInfo.append(['', helper.findScope(p[1].placeList[0]), '', '', '',''])
     rawType = helper.getBaseType(p[1].typeList[0])
     if rawType[0] != 'bool':
-        compilation_errors.add('TypeMismatch', line_number.get()+1, 'Expression type should be bool')
+        compilation_errors.add('TypeMismatch', position(p), 'Expression type should be bool')
+    p[0].extra['condScope'] = helper.findScope(p[1].placeList[0])
     p[0].name = 'Condition'
-    update = helper.symbolTables[helper.getScope()].metadata['update']
 
 
 def p_forclause(p):
     '''ForClause : SimpleStmt SEMICOLON ConditionOpt SEMICOLON SimpleStmt'''
     p[0] = p[1]
-    condition = helper.symbolTables[helper.getScope()].metadata['condition']
-    update = helper.symbolTables[helper.getScope()].metadata['update']
-    start = helper.symbolTables[helper.getScope()].metadata['start']
-    p[0].code += [[condition]]
-    p[0].scopeInfo.append([''])
-    p[0].code += p[3].code
-    p[0].scopeInfo += p[3].scopeInfo
-    p[0].code += [['goto', start]]
-    p[0].scopeInfo.append(['', ''])
-    p[0].code += [[update]]
-    p[0].scopeInfo.append([''])
-    p[0].code += p[5].code
-    p[0].scopeInfo += p[5].scopeInfo
-    p[0].code += [['goto', condition]]
-    p[0].scopeInfo.append(['',''])
     p[0].name = 'ForClause'
-
-    p[0].extra = p[3].extra
+    if 'isInfinite' in p[3].extra:
+        p[0].extra['isInfinite'] = True
+        p[0].extra['condition'] = None
+    else:
+        p[0].extra['condition'] = p[3]
+    p[0].extra['post'] = p[5]
 
 
 def p_conditionopt(p):
     '''ConditionOpt : epsilon
                     | Condition'''
     p[0] = p[1]
-    p[0].name = 'ConditionOpt'
     if p[1].name == 'epsilon':
         p[0].extra['isInfinite'] = True
+    p[0].name = 'ConditionOpt'
 
 
 
@@ -1269,15 +1367,17 @@ def p_return(p):
 
     scope_ = helper.getNearest('func')
     if scope_ == -1:
-        compilation_errors.add('Scope Error', line_number.get()+1, 'return is not in a function')
+        compilation_errors.add('Scope Error', position(p), 'return is not in a function')
         return
 
     typeList = helper.getRetType(scope_)
     if len(typeList) != len(p[2].typeList):
         error_ = 'Expected ' + str(len(typeList)) + ' arguments got ' + str(len(p[2].typeList))
-        compilation_errors.add('Type Mismatch', line_number.get()+1,error_)
+        compilation_errors.add('Type Mismatch', position(p),error_)
     elif len(typeList) != 0 and not helper.compareType(p[2].typeList[0], typeList[0]):
-        compilation_errors.add('Type Error',line_number.get()+1, 'return type does not match')
+        compilation_errors.add('Type Error', position(p), 'return type does not match')
+    elif helper.checkOnly:
+        return
     elif len(p[2].placeList) != 0:
         helper.updateRetVal(p[2].placeList[0])
         p[0].code = p[2].code + [['return', p[2].placeList[0]]]
@@ -1297,10 +1397,9 @@ def p_break(p):
     p[0] = Node('BreakStmt')
     scope_ = helper.getNearest('for')
     if scope_ == -1:
-        compilation_errors.add('Scope Error', line_number.get()+1, 'break is not in a loop')
+        compilation_errors.add('Scope Error', position(p), 'break is not in a loop')
         return
-    symTab = helper.symbolTables[scope_]
-    p[0].code = [['goto', symTab.metadata['end']]]
+    p[0].code = [['goto', helper.getScopeLabel(scope_, 'end')]]
     p[0].scopeInfo = [['', '']]
 
 def p_continue(p):
@@ -1308,10 +1407,9 @@ def p_continue(p):
     p[0] = Node('ContinueStmt')
     scope_ = helper.getNearest('for')
     if scope_ == -1:
-        compilation_errors.add('Scope Error', line_number.get()+1, 'continue is not in a loop')
+        compilation_errors.add('Scope Error', position(p), 'continue is not in a loop')
         return
-    symTab = helper.symbolTables[scope_]
-    p[0].code = [['goto', symTab.metadata['update']]]
+    p[0].code = [['goto', helper.getScopeLabel(scope_, 'update')]]
     p[0].scopeInfo = [['', '']]
 
 # -----------------------------------------------------------
@@ -1396,9 +1494,12 @@ def p_empty(p):
 # Error rule for syntax errors
 
 def p_error(p):
-    # plus one as line number starts from 0
-    compilation_errors.add('Parsing Error', line_number.get()+1,\
+    if p is None:
+        compilation_errors.add('Parsing Error', lexPosition(lexer, len(data)), 'Unexpected end of input')
+        raise ParseStop()
+    compilation_errors.add('Parsing Error', lexPosition(lexer, p.lexpos),\
                            'Error occured at the token: %s'%p.type)
+    raise ParseStop()
 
 def getCodeString(codeList):
     len_ = len(codeList)
@@ -1408,6 +1509,8 @@ def getCodeString(codeList):
     codeList = tmpList
     if len_ == 0:
         return ''
+    elif len_ == 1 and codeList[0] == 'return':
+        return '    return'
     elif len_ == 1:
         return codeList[0] + ':'
     elif len_ == 2:
@@ -1439,7 +1542,17 @@ def getCodeString(codeList):
             str_ += (x + ' ')
         return str_
 
-def generateCSV(filename):
+def exportedTables(scopes='all'):
+    # (number, table) of the symbol tables kept by the filter scopes: all of
+    # them, the global and function ones, or those with symbols
+    for idx_, table in enumerate(helper.symbolTables):
+        if scopes == 'functions' and idx_ != 0 and 'is_function' not in table.metadata:
+            continue
+        if scopes == 'nonempty' and len(table.table) == 0:
+            continue
+        yield idx_, table
+
+def generateCSV(filename, scopes='all'):
     import csv
     csvfile = filename
     writer = csv.writer(csvfile)
@@ -1448,86 +1561,247 @@ def generateCSV(filename):
     writer.writerow(['Identifier', 'Type', 'Size','Offset','is_Constant'])
     writer.writerow(['-------', '-------', '-------','------','------'])
 
-    for idx_, table in enumerate(helper.symbolTables):
+    # most symbols share a few types, each is expanded and printed once
+    typeStrings = {}
+    for idx_, table in exportedTables(scopes):
         # create rows
         writer.writerow(['','','','',''])
         writer.writerow(['======','Symbol Table Number:'+ str(idx_),'======','======','======'])
         writer.writerow(['','','','',''])
 
-        symTable = table.table
-        ident = symTable.keys()
-        type_ = [symTable[key]['type'] for key in ident]
-        size_ = [symTable[key]['size'] for key in ident]
-        offset_ = [symTable[key]['offset'] for key in ident]
-        is_const = ['is_const' in symTable[key] for key in ident]
-        rows = []
-        for idx_,key in enumerate(ident):
-            rawTp = helper.getBaseType(type_[idx_])
-            row = [key,rawTp,size_[idx_],offset_[idx_],is_const[idx_]]
-            rows.append(row)
-        writer.writerows(rows)
+        for key, entry in table.table.items():
+            type_ = entry.type
+            if isinstance(type_, str):
+                rawTp = typeStrings.get(type_)
+                if rawTp is None:
+                    rawTp = typeStrings[type_] = str(helper.displayType(type_))
+            else:
+                rawTp = str(helper.displayType(type_))
+            writer.writerow([key, rawTp, entry['size'], entry['offset'], 'is_const' in entry])
 
         writer.writerow(['','','','',''])
         writer.writerow(['======','======','======','======','======'])
         writer.writerow(['','','','',''])
 
-parser = argparse.ArgumentParser(description='Does Semantic Analysis and generates 3AC')
+def generateJSONLines(filename, scopes='all'):
+    r'''
+    The symbol tables as JSON lines, a line per table with a list per
+    column, {"record": "table", "scope": number, ..., "type": [type ids]}.
+    Types are given by id, a line {"record": "type", "typeId": id, "name":
+    name, "base": expanded type} coming before the first table using it.
+    '''
+    typeIds = {}
+    for idx_, table in exportedTables(scopes):
+        columns = {'record': 'table', 'scope': idx_, 'parent': table.parent, 'kind': table.metadata['name'],
+                   'ident': [], 'type': [], 'size': [], 'offset': [], 'const': []}
+        for key, entry in table.table.items():
+            name = entry.type if isinstance(entry.type, str) else str(entry.type)
+            if name not in typeIds:
+                typeIds[name] = len(typeIds)
+                filename.write(json.dumps({'record': 'type', 'typeId': typeIds[name], 'name': name,
+                                           'base': helper.displayType(entry.type)}) + '\n')
+            columns['ident'].append(key)
+            columns['type'].append(typeIds[name])
+            columns['size'].append(entry['size'])
+            columns['offset'].append(entry['offset'])
+            columns['const'].append('is_const' in entry)
+        filename.write(json.dumps(columns) + '\n')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Does Semantic Analysis and generates 3AC')
+
+    parser.add_argument('--code', dest='code_file_location', help='Location of the output .code file for 3AC, required unless --check-only', required=False)
+
+    parser.add_argument('--csv', dest='csv_file_location', help='Location of the output .csv file for symbol tables, required unless --check-only', required=False)
+
+    parser.add_argument('--csv-format', dest='csv_format', choices=['csv', 'jsonl'], default='csv', help='write the symbol tables as CSV, or as JSON lines of columns')
+
+    parser.add_argument('--csv-scopes', dest='csv_scopes', choices=['all', 'functions', 'nonempty'], default='all', help='symbol tables written: all, the global and function ones, or those with symbols')
+
+    parser.add_argument('--input', dest='in_file_location', help='Location of the input .go file', required=True)
 
-parser.add_argument('--code', dest='code_file_location', help='Location of the output .code file for 3AC', required=True)
+    parser.add_argument('--debug', dest='isDebug', help='for dubugging mode [t/F]', required=False)
 
-parser.add_argument('--csv', dest='csv_file_location', help='Location of the output .csv file for symbol tables', required=True)
+    parser.add_argument('--opt', dest='isOpt', help='run optimization passes on the 3AC [t/F]', required=False)
 
-parser.add_argument('--input', dest='in_file_location', help='Location of the input .go file', required=True)
+    parser.add_argument('--pgo', dest='pgo_location', help='block profile written by interpreter.py --profile-out, used to lay out the code', required=False)
 
-parser.add_argument('--debug', dest='isDebug', help='for dubugging mode [t/F]', required=False)
+    parser.add_argument('--fast-lex', dest='isFastLex', action='store_true', help='tokenize with FastLexer instead of the PLY lexer')
 
-result = parser.parse_args()
-code_file_location = str(result.code_file_location)
-csv_file_location = str(result.csv_file_location)
-in_file_location = str(result.in_file_location)
-isDebug = str(result.isDebug)
+    parser.add_argument('--cache', dest='cache_dir', help='directory keeping what every function compiled to, only the functions that changed are parsed again (implies --fast-lex)', required=False)
 
+    parser.add_argument('--dot', dest='dot_location', help='write the parse tree as a Graphviz .dot file, or with --dot-split a directory of them. A parse stopped by a syntax error leaves the file as it was and writes the partial tree next to it, with .partial appended', required=False)
 
-# Build lexer
-lexer = lex.lex()
+    parser.add_argument('--dot-split', dest='isDotSplit', action='store_true', help='a .dot file per top-level declaration, to be laid out separately')
 
-# Read input file
-in_file = open(in_file_location,'r')
+    parser.add_argument('--dot-collapse', dest='isDotCollapse', action='store_true', help='collapse chains of single child productions and flatten the lists')
 
+    parser.add_argument('--dot-depth', dest='dot_depth', type=int, help='levels of the parse tree kept below every top-level declaration', required=False)
 
-# CSV output File
-csv_file = open(csv_file_location,"w+")
+    parser.add_argument('--dot-func', dest='dot_function', help='only write the parse trees of the functions with this name', required=False)
 
-# 3AC output file
-code_file = open(code_file_location,"w+")
+    parser.add_argument('--check-only', dest='isCheckOnly', action='store_true', help='only check the types: no 3AC and no output files, the exit status is 1 if there are errors')
 
-data = in_file.read()
+    parser.add_argument('--errors', dest='errors_format', choices=['text', 'json', 'sarif'], default='text', help='how the errors are printed, all at once after parsing')
 
-# Iterate to get tokens
-parser = yacc.yacc()
-res = parser.parse(data)
+    parser.add_argument('--max-errors', dest='max_errors', type=int, help='stop parsing after this many errors', required=False)
 
-# Dubug Mode
-if isDebug in ['true', 't','T','True']:
-    helper.debug()
-    print("===== 3AC ====")
-    assert(len(rootNode.code)==len(rootNode.scopeInfo))
-    for idx in range(len(rootNode.code)):
-        print("-------------------------")
-        print(rootNode.code[idx])
-        print(rootNode.scopeInfo[idx])
+    parser.add_argument('--profile', dest='isProfile', action='store_true', help='print the time and memory spent in every phase')
+
+    parser.add_argument('--profile-json', dest='profile_json_location', default='profile.json', help='Location of the JSON written by --profile')
+
+    parser.add_argument('--cprofile', dest='cprofile_dir', help='with --profile, dump a cProfile .prof file per phase in this directory', required=False)
+
+    result = parser.parse_args()
+    if not result.isCheckOnly and (result.code_file_location is None or result.csv_file_location is None):
+        parser.error('--code and --csv are required unless --check-only')
+    if result.isCheckOnly and result.cache_dir is not None:
+        parser.error('--cache keeps the 3AC, which --check-only does not make')
+    if result.dot_location is not None and result.cache_dir is not None:
+        parser.error('--dot needs every declaration parsed, which --cache does not do')
+    code_file_location = str(result.code_file_location)
+    csv_file_location = str(result.csv_file_location)
+    in_file_location = str(result.in_file_location)
+    isDebug = str(result.isDebug)
+    isOpt = str(result.isOpt)
+    profiler = PhaseProfiler(result.isProfile, result.cprofile_dir)
+    cache = None
+    if result.cache_dir is not None:
+        # imports this module through incremental.py, so only now
+        from buildcache import BuildCache
+        cache = BuildCache(result.cache_dir)
+
+
+    # Build lexer
+    if result.isFastLex or cache is not None:
+        lexer = FastLexer()
+    else:
+        lexer = lex.lex()
+
+
+    if result.isCheckOnly:
+        helper.checkOnly = True
+    else:
+        # CSV output File
+        csv_file = open(csv_file_location,"w+")
+
+        # 3AC output file
+        code_file = open(code_file_location,"w+")
+
+    # Read input file
+    data = readSource(in_file_location)
+
+    # Iterate to get tokens
+    parser = yacc.yacc()
+    dotWriter = None
+    if result.dot_location is not None:
+        dotWriter = DotWriter(result.dot_location, result.isDotCollapse, result.dot_depth,
+                              result.dot_function, result.isDotSplit)
+        dotWriter.attach(parser)
+
+    if profiler.enabled:
+        # the parser pulls tokens lazily, so lexing is timed by a separate pass
+        with profiler.phase('lex'):
+            lexer.input(data)
+            numTokens = 0
+            for tok in iter(lexer.token, None):
+                numTokens += 1
+        compilation_errors.__init__()
+        profiler.count('lines', data.count('\n') + 1)
+        profiler.count('tokens', numTokens)
+        reductions = [0]
+        countReductions(parser, reductions)
+
+    compilation_errors.limit = result.max_errors
+    with profiler.phase('parse'):
+        try:
+            if cache is not None:
+                lexer.input(data)
+                cache.compile(helper, rootNode, lexer, parser)
+            else:
+                res = parser.parse(data, lexer=lexer, tracking=True)
+        except ParseStop:
+            res = None
+        except Exception:
+            # the actions can trip over what earlier errors left behind,
+            # those come first
+            compilation_errors.report(result.errors_format, source=in_file_location)
+            raise
+        finally:
+            # what was parsed is still a well-formed graph
+            if dotWriter is not None and not dotWriter.close() and not result.isDotSplit:
+                sys.stderr.write('the parse stopped early, the partial tree is in %s.partial\n' % result.dot_location)
+
+    if profiler.enabled:
+        profiler.count('reductions', reductions[0])
+        profiler.count('temporaries', helper.varCount)
+        profiler.count('labels', helper.labelCount)
+        if cache is not None:
+            profiler.count('functions_parsed', cache.parsed)
+            profiler.count('functions_cached', cache.grafted)
+
+    # Dubug Mode
+    if isDebug in ['true', 't','T','True']:
+        helper.debug()
+        print("===== 3AC ====")
+        assert(len(rootNode.code)==len(rootNode.scopeInfo))
+        for idx in range(len(rootNode.code)):
+            print("-------------------------")
+            print(rootNode.code[idx])
+            print(rootNode.scopeInfo[idx])
+
+    # a JSON or SARIF reader expects a document even when there are no errors
+    if compilation_errors.size() > 0 or result.errors_format != 'text':
+        compilation_errors.report(result.errors_format, source=in_file_location)
+    if compilation_errors.size() > 0:
+        if profiler.enabled:
+            profiler.report()
+            profiler.dump(result.profile_json_location)
+        sys.exit(1 if result.isCheckOnly else None)
+
+    if result.isCheckOnly:
+        if profiler.enabled:
+            profiler.report()
+            profiler.dump(result.profile_json_location)
+        sys.exit(0)
+
+    if isOpt in ['true', 't', 'T', 'True']:
+        with profiler.phase('optimize'):
+            if cache is not None:
+                cache.optimize(helper, rootNode)
+            else:
+                optimize(rootNode, helper)
+    if cache is not None:
+        cache.save()
+
+    if result.pgo_location is not None:
+        blockProfile = json.load(open(result.pgo_location, 'r'))
+        # no inlining yet, so only report where it would pay off
+        for caller, callee, count in inliningCandidates(rootNode.code, blockProfile)[:10]:
+            sys.stderr.write('inlining candidate: %s calls %s %d times\n' % (caller, callee, count))
+        with profiler.phase('layout'):
+            optimizeLayout(rootNode, helper, blockProfile)
+
+    with profiler.phase('csv'):
+        if result.csv_format == 'jsonl':
+            generateJSONLines(csv_file, result.csv_scopes)
+        else:
+            generateCSV(csv_file, result.csv_scopes)
+        csv_file.close()
 
-if compilation_errors.size() > 0:
-    sys.exit()
-generateCSV(csv_file)
+    with profiler.phase('3ac'):
+        for idx_ in range(len(rootNode.code)):
+            code_file.write(getCodeString(rootNode.code[idx_]))
+            code_file.write('\n')
 
-for idx_ in range(len(rootNode.code)):
-    code_file.write(getCodeString(rootNode.code[idx_]))
-    code_file.write('\n')
+        code_file.close()
+    profiler.count('instructions', len(rootNode.code))
 
-code_file.close()
-in_file.close()
+    import pickle as pkl
+    with profiler.phase('pickle'):
+        pkl.dump(rootNode, open('rootNode.p', 'wb'))
+        pkl.dump(helper, open('helper.p', 'wb'))
 
-import pickle as pkl
-pkl.dump(rootNode, open('rootNode.p', 'wb'))
-pkl.dump(helper, open('helper.p', 'wb'))
+    if profiler.enabled:
+        profiler.report()
+        profiler.dump(result.profile_json_location)
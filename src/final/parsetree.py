@@ -0,0 +1,164 @@
+r'''
+Parse trees of Go sources as Graphviz DOT, written while the parser
+reduces.
+
+Only the declaration being parsed is kept in memory: when a top-level
+declaration is reduced its subtree is written out and replaced by the id
+of its root. With collapse, chains of productions with a single child
+(Type -> TypeLit -> ArrayType) become their last symbol, and left
+recursive lists (StatementRep -> StatementRep Statement SEMICOLON) become
+one node with all the items as children. Productions that derive nothing
+are left out.
+'''
+import os
+
+from ply import yacc
+
+
+def dotLabel(text):
+    return '"' + str(text).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+
+
+class DotWriter:
+    r'''
+    Writes the parse tree made by a PLY parser it is attached to.
+
+    out is the .dot file to write, or with split a directory that gets a
+    graph per top-level declaration. depth is how many levels are kept
+    below every top-level declaration. With function set, only the
+    declarations of functions with that name are written.
+
+    The .dot file is written as out.partial and only moved to out by close
+    once the start symbol was reduced, so a parse stopped by a syntax
+    error leaves an earlier graph in out as it was.
+    '''
+    # a node is a [label, children] list until it is written, then its id;
+    # tokens are their value until they are written
+    def __init__(self, out, collapse=False, depth=None, function=None, split=False):
+        self.collapse = collapse
+        self.depth = depth
+        self.function = function
+        self.split = split
+        self.nodes = 0
+        self.declarations = 0
+        self.stream = None
+        # set when the whole input was parsed
+        self.complete = False
+        if split:
+            os.makedirs(out, exist_ok=True)
+            self.directory = out
+        else:
+            self.out = out
+            self.stream = open(out + '.partial', 'w')
+            self.stream.write('strict digraph G {\n')
+
+    def attach(self, parser):
+        # wraps the semantic action of every production, as countReductions
+        def wrap(action):
+            def traced(p):
+                action(p)
+                self.reduce(p)
+            return traced
+        for production in parser.productions:
+            if production.callable is not None:
+                production.callable = wrap(production.callable)
+
+    def reduce(self, p):
+        lhs = p.slice[0]
+        children = []
+        for sym in p.slice[1:]:
+            if isinstance(sym, yacc.YaccSymbol):
+                child = getattr(sym, 'parseTree', None)
+                if child is not None:
+                    children.append(child)
+            else:
+                children.append(str(sym.value))
+        if len(children) == 0:
+            node = None
+        elif self.collapse and len(children) == 1 and isinstance(children[0], list):
+            node = children[0]
+        elif self.collapse and lhs.type.endswith('Rep') and isinstance(children[0], list) and children[0][0] == lhs.type:
+            # the lists of the grammar are the ...Rep symbols, other left
+            # recursive productions are operators and keep their shape
+            node = children[0]
+            node[1].extend(children[1:])
+        else:
+            node = [lhs.type, children]
+        if lhs.type == 'start':
+            self.complete = True
+        if lhs.type == 'TopLevelDecl' and node is not None:
+            node = self.declaration(node)
+        elif lhs.type == 'start' and node is not None and self.stream is not None and self.function is None:
+            self.write(self.stream, node, None)
+            node = None
+        lhs.parseTree = node
+
+    def declaration(self, node):
+        # writes the tree of a top-level declaration, returns what stands
+        # for it in the tree of the file
+        name = functionName(node)
+        self.declarations += 1
+        if self.function is not None and name != self.function:
+            return None
+        if self.split:
+            fileName = 'decl%d%s.dot' % (self.declarations, '_' + name if name else '')
+            self.nodes = 0
+            with open(os.path.join(self.directory, fileName), 'w') as stream:
+                stream.write('strict digraph G {\n')
+                self.write(stream, node, self.depth)
+                stream.write('}\n')
+            return None
+        return self.write(self.stream, node, self.depth)
+
+    def write(self, stream, root, depth):
+        # writes the nodes of root down to depth levels below it, returns
+        # the id of root
+        rootId = self.newNode(stream, root)
+        stack = [(root, rootId, 0)]
+        while stack:
+            node, nodeId, level = stack.pop()
+            if not isinstance(node, list):
+                continue
+            if depth is not None and level >= depth:
+                hidden = self.nodes
+                self.nodes += 1
+                stream.write('%d [label="..."];\n%d -> %d;\n' % (hidden, nodeId, hidden))
+                continue
+            lines = []
+            for child in node[1]:
+                childId = self.newNode(stream, child)
+                lines.append('%d -> %d;\n' % (nodeId, childId))
+                stack.append((child, childId, level + 1))
+            stream.write(''.join(lines))
+        return rootId
+
+    def newNode(self, stream, node):
+        # id of node, declared in stream if it was not written before
+        if isinstance(node, int):
+            return node
+        nodeId = self.nodes
+        self.nodes += 1
+        stream.write('%d [label=%s];\n' % (nodeId, dotLabel(node[0] if isinstance(node, list) else node)))
+        return nodeId
+
+    def close(self):
+        # returns whether the whole input was parsed
+        if self.stream is not None:
+            self.stream.write('}\n')
+            self.stream.close()
+            if self.complete:
+                os.replace(self.out + '.partial', self.out)
+        return self.complete
+
+
+def functionName(node):
+    # name of the function a declaration tree declares, None for the other
+    # declarations
+    while isinstance(node, list) and node[0] != 'FunctionDecl' and len(node[1]) == 1:
+        node = node[1][0]
+    if not isinstance(node, list) or node[0] != 'FunctionDecl':
+        return None
+    for child in node[1]:
+        if isinstance(child, list) and child[0] == 'FunctionName':
+            return child[1][0]
+    return None
@@ -0,0 +1,107 @@
+import cProfile
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # not available on windows, peak memory is then reported as 0
+    resource = None
+
+
+def peakMemory():
+    # peak resident set size of this process so far, in KB
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak
+
+
+class PhaseProfiler:
+    r'''
+    Collects wall time, cpu time, peak memory and live allocations of every
+    compiler phase, along with counters (tokens, reductions, temporaries,
+    ...).
+
+        with profiler.phase('parse'):
+            ...
+
+    When disabled, phase() costs nothing more than an empty with block.
+    If cprofileDir is given every phase also dumps a <phase>.prof file.
+    '''
+    def __init__(self, enabled=False, cprofileDir=None):
+        self.enabled = enabled
+        self.cprofileDir = cprofileDir
+        self.phases = []
+        self.counters = {}
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        prof = None
+        if self.cprofileDir is not None:
+            prof = cProfile.Profile()
+            prof.enable()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            if prof is not None:
+                prof.disable()
+                os.makedirs(self.cprofileDir, exist_ok=True)
+                prof.dump_stats(os.path.join(self.cprofileDir, name + '.prof'))
+            self.phases.append({
+                'phase': name,
+                'wall': wall,
+                'cpu': cpu,
+                'peak_kb': peakMemory(),
+                # memory blocks held by python objects after the phase
+                'blocks': sys.getallocatedblocks(),
+            })
+
+    def count(self, key, value):
+        if self.enabled:
+            self.counters[key] = value
+
+    def report(self, out=sys.stderr):
+        out.write('%-12s %10s %10s %12s %12s\n' % ('phase', 'wall (s)', 'cpu (s)', 'peak (MB)', 'blocks'))
+        for phase in self.phases:
+            out.write('%-12s %10.4f %10.4f %12.1f %12d\n' % (phase['phase'], phase['wall'], phase['cpu'], phase['peak_kb'] / 1024, phase['blocks']))
+        for key in self.counters:
+            out.write('%-12s %10d\n' % (key, self.counters[key]))
+
+    def dump(self, filename, merge=False):
+        # with merge the phases and counters of an earlier run (parser.py
+        # before codeGen.py) are kept, and ones with the same name replaced
+        data = {'phases': [], 'counters': {}}
+        if merge and os.path.exists(filename):
+            with open(filename, 'r') as jsonFile:
+                data = json.load(jsonFile)
+        names = [phase['phase'] for phase in self.phases]
+        data['phases'] = [x for x in data['phases'] if x['phase'] not in names] + self.phases
+        data['counters'].update(self.counters)
+        with open(filename, 'w') as jsonFile:
+            json.dump(data, jsonFile, indent=2)
+
+
+def countReductions(parser, counter):
+    # wraps the semantic action of every production so that the number of
+    # reductions done by a PLY parser can be read from counter[0]
+    def wrap(action):
+        def counted(p):
+            counter[0] += 1
+            action(p)
+        return counted
+    for production in parser.productions:
+        if production.callable is not None:
+            production.callable = wrap(production.callable)
@@ -0,0 +1,19 @@
+#!/bin/bash
+
+# writes the 3AC of every program in code_tests without --opt and compares
+# it with the .out file next to it
+
+array=($(ls code_tests/*.go))
+status=0
+
+for goFile in "${array[@]}"
+do
+    python3 parser.py --input=$goFile --csv="symTab.csv" --code="3AC.code" > /dev/null 2>&1
+    if ! diff "${goFile%.go}.out" "3AC.code"; then
+        echo $goFile": the 3AC differs from "${goFile%.go}".out"
+        status=1
+    fi
+done
+
+rm -f "symTab.csv" "3AC.code"
+exit $status
@@ -0,0 +1,28 @@
+#!/bin/bash
+
+# checks every test with incremental.py and with parser.py --check-only, and
+# reports the tests whose errors differ. parser.py stops at a syntax error
+# while incremental.py goes on with the next declaration, so the tests with
+# one are left out
+
+array=($(ls ../../tests/semantic_check_input/*.go basic_tests/*.go tests/*.go))
+errors='import json, sys; print(json.dumps(json.load(sys.stdin)["errors"], indent=1))'
+status=0
+
+for goFile in "${array[@]}"
+do
+    python3 parser.py --input=$goFile --check-only --errors json 2> /dev/null | python3 -c "$errors" > "expected.out"
+    if grep -q '"SyntaxError"' "expected.out"; then
+        continue
+    fi
+
+    python3 incremental.py --input=$goFile < /dev/null 2> /dev/null | python3 -c "$errors" > "actual.out"
+    if ! cmp -s "expected.out" "actual.out"; then
+        echo $goFile": incremental.py reports other errors than parser.py --check-only"
+        diff "expected.out" "actual.out"
+        status=1
+    fi
+done
+
+rm -f "expected.out" "actual.out"
+exit $status
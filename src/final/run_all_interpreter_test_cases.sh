@@ -0,0 +1,40 @@
+#!/bin/bash
+
+# runs every test through interpreter.py built without --opt, with it, and
+# laid out with --pgo by the profile of the run before, and reports the
+# tests whose output changes. scan reads nothing, so the tests
+# run on their empty input
+
+array=($(ls tests))
+a='tests/'
+status=0
+
+for goFile in "${array[@]}"
+do
+    # tests of the error messages have nothing to run
+    if ! python3 parser.py --input=$a$goFile --check-only > /dev/null 2>&1; then
+        continue
+    fi
+
+    python3 parser.py --input=$a$goFile --csv="symTab.csv" --code="3AC.code" > /dev/null 2>&1
+    python3 interpreter.py --max-steps=10000000 < /dev/null > "expected.out" 2>&1
+
+    python3 parser.py --input=$a$goFile --csv="symTab.csv" --code="3AC.code" --opt=t > /dev/null 2>&1
+    python3 interpreter.py --max-steps=10000000 --profile-out="profile.json" < /dev/null > "actual.out" 2>&1
+    if ! cmp -s "expected.out" "actual.out"; then
+        echo $a$goFile": --opt changes the output"
+        diff "expected.out" "actual.out"
+        status=1
+    fi
+
+    python3 parser.py --input=$a$goFile --csv="symTab.csv" --code="3AC.code" --opt=t --pgo="profile.json" > /dev/null 2>&1
+    python3 interpreter.py --max-steps=10000000 < /dev/null > "actual.out" 2>&1
+    if ! cmp -s "expected.out" "actual.out"; then
+        echo $a$goFile": --pgo changes the output"
+        diff "expected.out" "actual.out"
+        status=1
+    fi
+done
+
+rm -f "symTab.csv" "3AC.code" "profile.json" "expected.out" "actual.out"
+exit $status
@@ -0,0 +1,19 @@
+// An if on a plain bool variable declared in an enclosing scope
+// Output: 1 3 4
+package main;
+
+func main() {
+	yes := true;
+	no := false;
+	if yes {
+		print 1;
+	};
+	if no {
+		print 2;
+	};
+	for i := 0; i < 2; i++ {
+		if yes {
+			print i + 3;
+		};
+	};
+};
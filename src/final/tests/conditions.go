@@ -0,0 +1,69 @@
+// Conditions: &&, ||, ! and float comparisons in if and for
+// Output: 3 7 4 5 2 3 3
+package main;
+
+func main() {
+	inside := 0;
+	outside := 0;
+	for i := 0; i < 10; i++ {
+		if (i > 2) && (i < 6) {
+			inside++;
+		};
+		if (i < 2) || (i >= 5) {
+			outside++;
+		};
+	};
+	print inside;
+	print outside;
+
+	n := 0;
+	for j := 0; (j < 10) && (n < 4); j++ {
+		if !(j == 1) {
+			n++;
+		};
+	};
+	print n;
+
+	m := 0;
+	k := 0;
+	for (k < 3) || (m < 5) {
+		m++;
+		k++;
+	};
+	print m;
+
+	var x float;
+	var y float;
+	x = 1.5;
+	y = 2.5;
+	f := 0;
+	if x < y {
+		f++;
+	};
+	if (x <= y) && (y >= x) {
+		f++;
+	};
+	if (x > y) || (x == y) {
+		f += 10;
+	};
+	print f;
+
+	g := 0;
+	b := x < y;
+	if b {
+		g++;
+	};
+	if y > x {
+		g++;
+	};
+	if !(x != x) {
+		g++;
+	};
+	print g;
+
+	c := 0;
+	for z := 0.5; z < 3.0; z = z + 1.0 {
+		c++;
+	};
+	print c;
+};
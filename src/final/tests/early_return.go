@@ -0,0 +1,16 @@
+// Early return from a void function, inside an if inside a loop
+// Output: 0 1 2 3 4 5 6 1
+package main;
+
+func main() {
+	var n int;
+	n = 10;
+	for i := 0; i < n; i++ {
+		if i > 6 {
+			print 1;
+			return;
+		};
+		print i;
+	};
+	print 2;
+};
@@ -0,0 +1,16 @@
+// Error positions: newlines inside comments and strings count, and errors
+// point at the offending symbol rather than the lookahead
+// Errors: binary operator at line 13, column 9; d at line 15, column 8
+package main;
+
+/* a comment
+   spanning lines */
+func main() {
+	var s string = "two
+lines";
+	a := 1;
+	b := 2.0;
+	c := a +
+		b;
+	print d;
+};
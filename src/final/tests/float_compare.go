@@ -0,0 +1,39 @@
+// Float comparisons kept as bool values, not fused with an if
+// Output: 1 3 5 8 9
+package main;
+
+func main() {
+	x := 1.5;
+	y := 2.5;
+	less := x < y;
+	greater := x > y;
+	atMost := y <= y;
+	atLeast := x >= y;
+	same := x == y;
+	differ := x != y;
+	if less {
+		print 1;
+	};
+	if greater {
+		print 2;
+	};
+	if atMost {
+		print 3;
+	};
+	if atLeast {
+		print 4;
+	};
+	negative := -x < 0.5;
+	if negative {
+		print 5;
+	};
+	if same {
+		print 7;
+	};
+	if differ {
+		print 8;
+	};
+	if y > x {
+		print 9;
+	};
+};
@@ -0,0 +1,49 @@
+// Loop forms: condition only, infinite, full clause, with break and continue
+// Output: 12 4 20 6
+package main;
+
+func main() {
+	i := 0;
+	sum := 0;
+	for i < 5 {
+		i++;
+		if i == 3 {
+			continue;
+		};
+		sum += i;
+	};
+	print sum + 1 - 1 + 0;
+
+	n := 0;
+	for {
+		n++;
+		if n == 4 {
+			break;
+		};
+	};
+	print n;
+
+	total := 0;
+	for j := 0; j < 10; j++ {
+		if j == 5 {
+			break;
+		};
+		for k := 0; ; k++ {
+			if k > j {
+				break;
+			};
+			total++;
+		};
+		total += 1;
+	};
+	print total;
+
+	count := 0;
+	for j := 0; j < 0; j++ {
+		count++;
+	};
+	for j := 10; j > 4; j-- {
+		count++;
+	};
+	print count;
+};
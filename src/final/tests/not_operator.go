@@ -0,0 +1,21 @@
+// ! as a value and as a condition
+// Output: 1 2 4
+package main;
+
+func main() {
+	a := 3;
+	t := a > 2;
+	f := !t;
+	if t {
+		print 1;
+	};
+	if !f {
+		print 2;
+	};
+	if f {
+		print 3;
+	};
+	if !(a > 5) {
+		print 4;
+	};
+};
@@ -0,0 +1,45 @@
+// Short circuit: the right side of && and || only runs when it decides the result
+// Output: 1 3 5 6 1 0 2 9 10 2
+package main;
+
+func show(x int, r int) bool {
+	print x;
+	return r > 0;
+};
+
+func main() {
+	if show(1, 0) && show(2, 1) {
+		print 100;
+	};
+	if show(3, 1) || show(4, 1) {
+		if show(5, 1) && show(6, 0) {
+			print 100;
+		};
+	};
+
+	b := (1 < 2) || show(7, 1);
+	c := (2 < 1) && show(8, 1);
+	n := 0;
+	if b {
+		n++;
+	};
+	print n;
+	n = 0;
+	if c {
+		n++;
+	};
+	print n;
+
+	var a [3]int;
+	a[0] = 1;
+	a[1] = 1;
+	i := 0;
+	for (i < 3) && (a[i] > 0) {
+		i++;
+	};
+	print i;
+
+	if (show(9, 0) || show(10, 0)) || (i == 2) {
+		print 2;
+	};
+};
@@ -0,0 +1,31 @@
+// Tail recursion
+package main;
+
+// Output: 3628800 1024 5050
+
+func factorial(n int, acc int) int {
+    if n <= 1 {
+        return acc;
+    };
+    return factorial(n-1, acc*n);
+};
+
+func power(b int, e int, acc int) int {
+    if e == 0 {
+        return acc;
+    };
+    return power(b, e-1, acc*b);
+};
+
+func sum(n int, acc int) int {
+    if n == 0 {
+        return acc;
+    };
+    return sum(n-1, acc+n);
+};
+
+func main(){
+    print factorial(10, 1);
+    print power(2, 10, 1);
+    print sum(100, 0);
+};